@@ -0,0 +1,34 @@
+import os
+from dotenv import load_dotenv
+
+# .env may carry GCP_* as well as the queue/quota settings read by the services,
+# so it is loaded before any of them read the environment.
+load_dotenv()
+
+# Data directory is at project root: move_37/data
+# We are in move_37/backend/app/config.py
+# So we need to go up 3 levels to get to move_37, then into data
+# abspath(__file__) -> move_37/backend/app/config.py
+# dirname -> move_37/backend/app
+# dirname -> move_37/backend
+# dirname -> move_37
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DATA_DIR = os.getenv("MOVE37_DATA_DIR", os.path.join(BASE_DIR, "data"))
+
+# Runtime state (job queue database, caches) lives outside DATA_DIR so it is
+# never exposed through the /static mount.
+STATE_DIR = os.getenv("MOVE37_STATE_DIR", os.path.join(BASE_DIR, ".move37"))
+
+# Generation runs in job worker processes and CLIs as well as the API, so every
+# process records its metrics into this directory and /metrics aggregates the files.
+METRICS_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", os.path.join(STATE_DIR, "metrics"))
+
+
+def configure_metrics():
+    """
+    Record Prometheus metrics in METRICS_DIR. Called by every entry point before it
+    imports the services: prometheus_client picks its storage when first imported,
+    and worker processes inherit the setting.
+    """
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = METRICS_DIR
+    os.makedirs(METRICS_DIR, exist_ok=True)
@@ -1,39 +1,93 @@
-from fastapi import FastAPI, HTTPException, Body
+from fastapi import FastAPI, HTTPException, Body, Query, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse, FileResponse, RedirectResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, ValidationError
 from typing import List, Optional, Dict, Any
 import os
-import json
-import glob
+import time
+import mimetypes
+import asyncio
+import logging
+from contextlib import asynccontextmanager, closing
 
 # Import services
-# Assuming running from backend/ directory as `uvicorn app.main:app`
-# Adjust imports if necessary based on actual python path
-try:
-    from app.services.character_refs import generate_character_references
-    from app.services.environment_refs import generate_environment_references
-    from app.services.llm import generate_character_json
-except ImportError:
-    # Fallback for running directly or differently
-    from services.character_refs import generate_character_references
-    from services.environment_refs import generate_environment_references
-    from services.llm import generate_character_json
-
-app = FastAPI()
-
-# Config
-# Data directory is at project root: move_37/data
-# We are in move_37/backend/app/main.py
-# So we need to go up 3 levels to get to move_37, then into data
-# abspath(__file__) -> move_37/backend/app/main.py
-# dirname -> move_37/backend/app
-# dirname -> move_37/backend
-# dirname -> move_37
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-DATA_DIR = os.path.join(BASE_DIR, "data")
-
-print(f"DATA_DIR resolved to: {DATA_DIR}")
+# Run from backend/ as `uvicorn app.main:app`
+from app.config import BASE_DIR, DATA_DIR, configure_metrics
+
+# Before any service imports prometheus_client, so requests and job workers share the metrics directory
+configure_metrics()
+
+from app.logging_config import configure_logging
+from app.services.metrics import REQUEST_LATENCY, latest as latest_metrics, remove_dead_process_files
+from app.services.jobs import JobQueue, WorkerPool, JOB_WORKERS, JOB_EVENTS_POLL_INTERVAL
+from app.services.llm import generate_character_json, generate_character_jsons, get_response_cache, LLM_BATCH_MAX_PROMPTS
+from app.services.quota import QuotaExceededError
+from app.services.model_registry import warm_up, WARM_UP_MODELS
+from app.services.catalog import get_catalog
+from app.services.compiler import iter_sequence
+from app.services.render_cache import get_render_cache
+from app.services.asset_index import get_asset_index
+from app.services import thumbnails
+from app.services.batch import expand_matrix, iter_batch
+from app.services.planner import plan_sequence, run_plan, reference_status
+from app.services.sheet_store import sheet_lock, write_text_atomic
+from app.services.jsonio import dumps, validate_sheet, sheet_adapter, SHEET_SCHEMAS, JSONDecodeError
+from app.services.static_assets import (
+    versioned_url, versioned_references, SendfileResponse, ImmutableFileResponse, IMMUTABLE_CACHE_CONTROL,
+)
+from app.services.storage import get_storage, clean_key, LocalStorage
+
+configure_logging()
+logger = logging.getLogger(__name__)
+logger.info("DATA_DIR resolved", extra={"data_dir": DATA_DIR})
+
+# Reference generation runs in worker processes fed by a durable queue,
+# so requests return immediately and unfinished jobs survive a restart.
+job_queue = JobQueue()
+# Sheets are read through an in-memory catalog shared with the parser
+catalog = get_catalog(DATA_DIR)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    remove_dead_process_files()
+    # JOB_WORKERS=0 leaves draining to standalone `python run_workers.py` processes
+    pool = WorkerPool(JOB_WORKERS) if JOB_WORKERS > 0 else None
+    if pool:
+        pool.start()
+    await run_in_threadpool(catalog.warm)
+    for category in SHEET_SCHEMAS:
+        sheet_adapter(category)
+    await run_in_threadpool(get_asset_index().refresh, True)
+    if WARM_UP_MODELS:
+        # Blocking SDK setup runs off the event loop
+        await run_in_threadpool(warm_up)
+    yield
+    if pool:
+        pool.stop()
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+
+@app.exception_handler(QuotaExceededError)
+async def quota_exceeded_handler(request, exc: QuotaExceededError):
+    # Surface exhausted Vertex quota as 429 instead of a generic 500
+    return ORJSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(int(exc.retry_after))},
+    )
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    # Label by route template, not the raw path, so IDs don't explode the series count.
+    # Streaming responses are timed to their first byte.
+    route = request.scope.get("route")
+    route_path = route.path if route is not None else (request.scope.get("root_path") or "unmatched")
+    REQUEST_LATENCY.labels(request.method, route_path, response.status_code).observe(time.perf_counter() - start)
+    return response
 
 # CORS
 origins = [
@@ -50,12 +104,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Rendered assets; sheets and anything from before a storage switch stay in DATA_DIR
+storage = get_storage(DATA_DIR)
+data_files = LocalStorage(DATA_DIR)
+
 # Mount static files
 # Access via http://localhost:8000/static/characters/kaelen_refs/...
-if os.path.exists(DATA_DIR):
+if not os.path.exists(DATA_DIR):
+    logger.warning("DATA_DIR does not exist, static files will not be served", extra={"data_dir": DATA_DIR})
+elif isinstance(storage, LocalStorage):
     app.mount("/static", StaticFiles(directory=DATA_DIR), name="static")
 else:
-    print(f"WARNING: DATA_DIR {DATA_DIR} does not exist. Static files will not be served.")
+    @app.get("/static/{path:path}")
+    def get_static(path: str):
+        source, key = find_asset(path)
+        return asset_response(source, key)
 
 # Schemas
 class GenerateRequest(BaseModel):
@@ -65,121 +128,436 @@ class GenerateRequest(BaseModel):
 
 class PromptRequest(BaseModel):
     prompt: str
+    use_cache: bool = True
+
+class BatchPromptRequest(BaseModel):
+    prompts: List[str]
+    use_cache: bool = True
 
 class FileSaveRequest(BaseModel):
     content: str # content as string (JSON/YAML)
 
+class BatchRenderRequest(BaseModel):
+    character_ids: List[str] = []
+    environment_ids: List[str] = []
+    style_ids: List[str] = [] # Characters only; empty renders each in its own style
+    types: List[str] = [] # Reference angles (head, full_body, wide, ...); empty renders all
+    force: bool = False
+    use_cache: bool = True
+
+class RenderSequenceRequest(BaseModel):
+    force: bool = False
+    use_cache: bool = True
+
+class CompileSequenceRequest(BaseModel):
+    sequence_id: Optional[str] = None # Load data/sequences/{sequence_id}.json
+    scenes: Optional[List[Dict[str, Any]]] = None # Or pass scenes inline
+
 @app.get("/")
 def read_root():
     return {"message": "Move 37 Backend API"}
 
-@app.post("/generate/character")
+@app.post("/generate/character", status_code=202)
 def generate_character(request: GenerateRequest):
-    try:
-        # Check if file exists
-        char_path = os.path.join(DATA_DIR, "characters", f"{request.id}.json")
-        if not os.path.exists(char_path):
-             # Try adding .json
-             if not request.id.endswith(".json"):
-                 char_path = os.path.join(DATA_DIR, "characters", f"{request.id}.json")
-        
-        if not os.path.exists(char_path):
-             raise HTTPException(status_code=404, detail=f"Character file not found: {request.id}")
-
-        # The service expects data_dir to be the directory containing the json files
-        result = generate_character_references(
-            character_id=request.id,
-            data_dir=os.path.join(DATA_DIR, "characters"),
-            style_id=request.style_id,
-            force=request.force
-        )
-        return {"status": "success", "images": result}
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=str(e))
+    # Check if file exists
+    char_path = os.path.join(DATA_DIR, "characters", f"{request.id}.json")
+    if not os.path.exists(char_path):
+         raise HTTPException(status_code=404, detail=f"Character file not found: {request.id}")
+
+    # The service expects data_dir to be the directory containing the json files
+    job_id = job_queue.enqueue("character", {
+        "character_id": request.id,
+        "data_dir": os.path.join(DATA_DIR, "characters"),
+        "style_id": request.style_id,
+        "force": request.force,
+    })
+    return {"status": "queued", "job_id": job_id}
 
-@app.post("/generate/environment")
+@app.post("/generate/environment", status_code=202)
 def generate_environment(request: GenerateRequest):
-    try:
-        # Check if file exists
-        env_path = os.path.join(DATA_DIR, "environments", f"{request.id}.json")
-        if not os.path.exists(env_path):
-             # Try adding .json
-             if not request.id.endswith(".json"):
-                 env_path = os.path.join(DATA_DIR, "environments", f"{request.id}.json")
-
-        if not os.path.exists(env_path):
-             raise HTTPException(status_code=404, detail=f"Environment file not found: {request.id}")
-
-        result = generate_environment_references(
-            environment_id=request.id,
-            data_dir=os.path.join(DATA_DIR, "environments")
-        )
-        return {"status": "success", "images": result}
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=str(e))
+    # Check if file exists
+    env_path = os.path.join(DATA_DIR, "environments", f"{request.id}.json")
+    if not os.path.exists(env_path):
+         raise HTTPException(status_code=404, detail=f"Environment file not found: {request.id}")
+
+    job_id = job_queue.enqueue("environment", {
+        "environment_id": request.id,
+        "data_dir": os.path.join(DATA_DIR, "environments"),
+        "force": request.force,
+    })
+    return {"status": "queued", "job_id": job_id}
+
+def _job_status(job: dict):
+    return {
+        "job_id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "error": job["error"],
+    }
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """Status of a queued generation job."""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_status(job)
+
+def _job_event_messages(job_id: str, after_id: int):
+    """
+    SSE messages for a job's events after after_id.
+    Returns (messages, last_id, finished); a job that ended without a final
+    event (e.g. its worker was lost too often) gets one synthesized from its status.
+    """
+    job = job_queue.get(job_id)
+    category = "characters" if job["kind"] == "character" else "environments"
+    messages = []
+    finished = False
+    for event_id, event in job_queue.events(job_id, after_id):
+        if event["stage"] == "image_saved":
+            event["urls"] = [versioned_url(f"{category}/{p}") for p in event["paths"]]
+        messages.append(f"id: {event_id}\nevent: {event['stage']}\ndata: {dumps(event)}\n\n")
+        after_id = event_id
+        finished = event["stage"] in ("done", "failed")
+    if not finished and job["status"] in ("done", "failed"):
+        event = {"stage": job["status"]}
+        if job["error"]:
+            event["error"] = job["error"]
+        messages.append(f"event: {job['status']}\ndata: {dumps(event)}\n\n")
+        finished = True
+    return messages, after_id, finished
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, request: Request):
+    """
+    Server-Sent Events stream of a job's progress: started, prompts_built,
+    model_call_started, image_saved (with versioned image URLs, as soon as each
+    angle is written), json_updated, then done or failed. Every event carries
+    timings. Reconnecting clients resume from the Last-Event-ID header.
+    """
+    if await run_in_threadpool(job_queue.get, job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    last_id = request.headers.get("last-event-id", "")
+    last_id = int(last_id) if last_id.isdigit() else 0
+
+    async def messages():
+        nonlocal last_id
+        last_sent = time.monotonic()
+        while not await request.is_disconnected():
+            batch, last_id, finished = await run_in_threadpool(_job_event_messages, job_id, last_id)
+            for message in batch:
+                yield message
+            if finished:
+                return
+            if batch:
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent > 15:
+                # Comment line keeps proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+            await asyncio.sleep(JOB_EVENTS_POLL_INTERVAL)
+
+    return StreamingResponse(messages(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/jobs/{job_id}/result")
+def get_job_result(job_id: str):
+    """
+    Result of a finished job.
+    Returns 202 with the job status while it is still queued or running.
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] == "failed":
+        raise HTTPException(status_code=500, detail=job["error"])
+    if job["status"] != "done":
+        return ORJSONResponse(status_code=202, content=_job_status(job))
+    return {"status": "success", "images": job["result"]}
+
+@app.get("/cache/renders")
+def render_cache_stats():
+    """Render cache size and hit/miss counts."""
+    return get_render_cache().stats()
+
+@app.get("/stats/threadpool")
+async def threadpool_stats():
+    """
+    Usage of the worker threadpool that runs the sync endpoints.
+    'waiting' above zero means requests are queuing for a thread.
+    """
+    import anyio.to_thread
+
+    stats = anyio.to_thread.current_default_thread_limiter().statistics()
+    return {
+        "total": stats.total_tokens,
+        "busy": stats.borrowed_tokens,
+        "waiting": stats.tasks_waiting,
+    }
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus metrics, aggregated over the API, job workers and CLI runs."""
+    body, content_type = latest_metrics()
+    return Response(body, media_type=content_type)
 
 @app.post("/generate/character-json")
 def generate_character_json_endpoint(request: PromptRequest):
     """Generate a character sheet JSON from a text prompt."""
     try:
-        result = generate_character_json(request.prompt)
+        result = generate_character_json(request.prompt, use_cache=request.use_cache)
         return result
+    except QuotaExceededError:
+        raise
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("Character JSON generation failed")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/generate/character-json/batch")
+def generate_character_json_batch(request: BatchPromptRequest):
+    """
+    Generate a character sheet per prompt, concurrently under the Gemini quota.
+    Each result is validated against CharacterSheet and reported on its own, so one bad prompt doesn't fail the batch.
+    """
+    if not request.prompts:
+        raise HTTPException(status_code=400, detail="No prompts given")
+    if len(request.prompts) > LLM_BATCH_MAX_PROMPTS:
+        raise HTTPException(status_code=400, detail=f"At most {LLM_BATCH_MAX_PROMPTS} prompts per batch")
+    results = generate_character_jsons(request.prompts, use_cache=request.use_cache)
+    return {
+        "results": results,
+        "ok": sum(1 for r in results if r["status"] == "ok"),
+        "failed": sum(1 for r in results if r["status"] != "ok"),
+    }
+
+@app.get("/cache/llm")
+def llm_cache_stats():
+    """Gemini response cache size and hit/miss counts for this process."""
+    return get_response_cache().stats()
+
+@app.post("/compile/sequence")
+def compile_sequence(request: CompileSequenceRequest):
+    """
+    Compile every scene of a sequence into a prompt.
+    Streams NDJSON, one {scene_id, prompt, negative_prompt} record per line, as scenes are compiled.
+    """
+    if request.scenes is not None:
+        scenes = request.scenes
+    elif request.sequence_id:
+        sequence = catalog.get("sequences", request.sequence_id)
+        if sequence is None:
+            raise HTTPException(status_code=404, detail=f"Sequence file not found: {request.sequence_id}")
+        scenes = sequence.get("scenes", [])
+    else:
+        raise HTTPException(status_code=400, detail="Provide sequence_id or scenes")
+
+    def lines():
+        # Send records in ~64 KB chunks rather than one write per scene
+        buffer = []
+        size = 0
+        for scene_id, prompt, negative_prompt in iter_sequence(scenes):
+            line = dumps({"scene_id": scene_id, "prompt": prompt, "negative_prompt": negative_prompt}) + "\n"
+            buffer.append(line)
+            size += len(line)
+            if size >= 65536:
+                yield "".join(buffer)
+                buffer, size = [], 0
+        if buffer:
+            yield "".join(buffer)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.post("/batch-render")
+def batch_render(request: BatchRenderRequest):
+    """
+    Render the characters x styles x types (and environments x types) matrix concurrently,
+    paced by the shared quota governor. Streams NDJSON: a "started" line, one "image" line
+    per finished reference angle (with versioned URLs), "error" lines for failed sheets,
+    and a closing "done" summary.
+    """
+    try:
+        tasks = expand_matrix(
+            request.character_ids, request.environment_ids, request.style_ids, request.types, DATA_DIR,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not tasks:
+        raise HTTPException(status_code=400, detail="Nothing to render")
+
+    def lines():
+        # One write per event: clients should see each image as soon as it lands
+        for event in iter_batch(tasks, DATA_DIR, force=request.force, use_cache=request.use_cache):
+            if event["status"] == "image":
+                event["urls"] = [versioned_url(p) for p in event["paths"]]
+            yield dumps(event) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+def _sequence_plan(sequence_id: str, force: bool, use_cache: bool) -> dict:
+    sequence = catalog.get("sequences", sequence_id)
+    if sequence is None:
+        raise HTTPException(status_code=404, detail=f"Sequence file not found: {sequence_id}")
+    try:
+        return plan_sequence(sequence, DATA_DIR, force=force, use_cache=use_cache)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/sequences/{sequence_id}/plan")
+def get_sequence_plan(sequence_id: str, force: bool = False, use_cache: bool = True):
+    """
+    Dry run: the reference renders a sequence still needs (one task per character and
+    style, one per environment), which scenes are ready, and the model calls and
+    estimated wall-clock time at the current Imagen quota.
+    """
+    return _sequence_plan(sequence_id, force, use_cache)
+
+@app.post("/sequences/{sequence_id}/render")
+def render_sequence(sequence_id: str, request: RenderSequenceRequest):
+    """
+    Render everything the sequence's plan lists, as concurrently as the quota allows.
+    Streams NDJSON: a "plan" line, then the same lines as /batch-render.
+    """
+    plan = _sequence_plan(sequence_id, request.force, request.use_cache)
+
+    def lines():
+        yield dumps({"status": "plan", **plan}) + "\n"
+        for event in run_plan(plan, DATA_DIR, force=request.force, use_cache=request.use_cache):
+            if event["status"] == "image":
+                event["urls"] = [versioned_url(p) for p in event["paths"]]
+            yield dumps(event) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.get("/references/status")
+def get_reference_status(stale_only: bool = True):
+    """
+    Recorded reference images whose inputs (sheet fields, style, prompt template, render
+    settings) changed since they were rendered, with the inputs that did. stale_only=false
+    also lists fresh and untracked images.
+    """
+    rows = reference_status(DATA_DIR)
+    return [row for row in rows if not stale_only or row["status"] in ("stale", "missing")]
+
 @app.get("/assets")
-def list_assets():
-    """List all generated assets (images/videos) in the data directory."""
-    assets = []
-    # Recursively find all jpg, png, mp4
-    search_patterns = ["**/*.jpg", "**/*.png", "**/*.mp4"]
-    
-    for pattern in search_patterns:
-        # glob.glob in python 3.10+ supports root_dir, but let's be safe
-        # We need relative paths for glob to work nicely with recursive=True sometimes
-        # or just join path
-        full_pattern = os.path.join(DATA_DIR, pattern)
-        files = glob.glob(full_pattern, recursive=True)
-        
-        for f in files:
-            rel_path = os.path.relpath(f, DATA_DIR)
-            # Convert backslashes to forward slashes for URLs
-            rel_path = rel_path.replace("\\", "/")
-            
-            # Simple heuristic for type
-            asset_type = "video" if f.endswith(".mp4") else "image"
-            
-            assets.append({
-                "path": f"/static/{rel_path}",
-                "name": os.path.basename(f),
-                "type": asset_type,
-                "full_path": rel_path
-            })
+def list_assets(
+    response: Response,
+    category: Optional[str] = None,
+    character: Optional[str] = None,
+    environment: Optional[str] = None,
+    style: Optional[str] = None,
+    type: Optional[str] = Query(None, pattern="^(image|video)$"),
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+):
+    """
+    List generated assets (images/videos) in the data directory, sorted by path.
+    Served from an incrementally maintained index. With 'limit', the cursor for
+    the next page is returned in the X-Next-Cursor header.
+    """
+    try:
+        assets, next_cursor = get_asset_index().query(
+            category=category, character=character, environment=environment,
+            style=style, asset_type=type, cursor=cursor, limit=limit,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return assets
 
+def find_asset(path: str):
+    """(storage, key) holding the file at path relative to the data directory; 404 if none does."""
+    try:
+        key = clean_key(path)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="File not found")
+    for source in (storage, data_files):
+        if source.exists(key):
+            return source, key
+    raise HTTPException(status_code=404, detail="File not found")
+
+def asset_response(source, key: str, headers: dict = None, response_class=SendfileResponse):
+    """Serve an object: from its file when it has one (sendfile, byte ranges), else streamed from the backend."""
+    path = source.local_path(key)
+    if path is not None:
+        return response_class(path, headers=headers)
+    size = source.stat(key)[0]
+    media_type = mimetypes.guess_type(key)[0] or "application/octet-stream"
+    body = source.open(key)
+
+    def chunks():
+        with closing(body):
+            while chunk := body.read(1024 * 1024):
+                yield chunk
+
+    return StreamingResponse(chunks(), media_type=media_type, headers={**(headers or {}), "Content-Length": str(size)})
+
+@app.get("/thumbs/{size}/{path:path}")
+def get_thumbnail(size: int, path: str, format: Optional[str] = None):
+    """
+    Downscaled copy of an image under the data directory, e.g. /thumbs/256/characters/juri_refs/shonen_v1/head.jpg.
+    Rendered on first request and then served from the on-disk thumbnail cache.
+    """
+    fmt = format or thumbnails.THUMB_FORMAT
+    if size not in thumbnails.THUMB_SIZES:
+        raise HTTPException(status_code=400, detail=f"Invalid size. Valid sizes are: {list(thumbnails.THUMB_SIZES)}")
+    if fmt not in thumbnails.supported_formats():
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {fmt}")
+
+    if not path.lower().endswith(thumbnails.SOURCE_EXTENSIONS):
+        raise HTTPException(status_code=400, detail="Invalid image path")
+    source, key = find_asset(path)
+
+    thumb = thumbnails.ensure_thumbnail(key, size, fmt, storage=source)
+    return FileResponse(thumb, media_type=thumbnails.MEDIA_TYPES[fmt], headers={"Cache-Control": "public, max-age=86400"})
+
+@app.get("/static-v/{digest}/{path:path}")
+def get_versioned_static(digest: str, path: str, request: Request):
+    """
+    Content-hashed copy of /static/{path}. The digest pins the bytes, so the
+    response is immutable; a stale digest redirects to the current URL.
+    """
+    source, key = find_asset(path)
+    current = source.digest(key)
+    if current != digest:
+        # Regenerated since the URL was handed out: send the client to the new version
+        return RedirectResponse(versioned_url(key, current), status_code=302, headers={"Cache-Control": "no-cache"})
+
+    etag = f'"{digest}"'
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL}
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    # Byte ranges (video seeking, resumed downloads) are handled by FileResponse
+    return asset_response(source, key, headers, response_class=ImmutableFileResponse)
+
 @app.get("/data/{category}/{filename}")
 def read_data_file(category: str, filename: str):
     """
     Read a JSON file.
     Category: characters, environments, styles
+    For characters and environments, 'reference_urls' mirrors the sheet's
+    reference_images with content-hashed /static-v URLs.
     """
     if category not in ["characters", "environments", "styles"]:
         raise HTTPException(status_code=400, detail="Invalid category")
     
-    file_path = os.path.join(DATA_DIR, category, filename)
-    if not os.path.exists(file_path):
+    content = catalog.raw(category, filename)
+    if content is None:
         raise HTTPException(status_code=404, detail="File not found")
     
-    with open(file_path, "r") as f:
-        content = f.read()
-    
-    return {"content": content}
+    result = {"content": content}
+    if category in ("characters", "environments"):
+        try:
+            sheet = catalog.get(category, filename) or {}
+        except JSONDecodeError:
+            # Hand-edited file mid-save; the raw content is still useful to the editor
+            sheet = {}
+        result["reference_urls"] = versioned_references(sheet.get("reference_images"), category)
+    return result
 
 @app.post("/data/{category}/{filename}")
 def save_data_file(category: str, filename: str, request: FileSaveRequest):
@@ -191,14 +569,20 @@ def save_data_file(category: str, filename: str, request: FileSaveRequest):
         
     file_path = os.path.join(DATA_DIR, category, filename)
     
-    # Simple validation that it is parsable JSON
+    # Bad sheets are caught here rather than when a render trips over them
     try:
-        json.loads(request.content)
-    except json.JSONDecodeError:
-         raise HTTPException(status_code=400, detail="Invalid JSON content")
+        sheet = validate_sheet(category, request.content)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False, include_input=False))
+    except ValueError:
+        # JSONDecodeError included
+        raise HTTPException(status_code=400, detail="Invalid JSON content")
 
-    with open(file_path, "w") as f:
-        f.write(request.content)
+    # The editor's content replaces the file; renders finishing later merge into it
+    with sheet_lock(file_path):
+        write_text_atomic(file_path, request.content)
+        # Hand the parsed sheet to the catalog instead of re-reading the file
+        catalog.store(category, filename, request.content, sheet)
     
     return {"status": "success"}
 
@@ -208,9 +592,4 @@ def list_files(category: str):
     if category not in ["characters", "environments", "styles"]:
         raise HTTPException(status_code=400, detail="Invalid category")
     
-    dir_path = os.path.join(DATA_DIR, category)
-    if not os.path.exists(dir_path):
-        return []
-        
-    files = [f for f in os.listdir(dir_path) if f.endswith(".json")]
-    return files
\ No newline at end of file
+    return catalog.list_files(category)
\ No newline at end of file
@@ -10,7 +10,7 @@ class CharacterSheet(BaseModel):
     negative_prompt: Optional[str] = None
 
 class EnvironmentSheet(BaseModel):
-    location_name: str
+    location: str
     lighting: str
     time_of_day: str
     mood: str
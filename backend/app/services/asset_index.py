@@ -0,0 +1,229 @@
+import os
+import time
+import base64
+import bisect
+import threading
+
+from ..config import DATA_DIR, STATE_DIR
+from .static_assets import file_digest, versioned_url
+from .jsonio import loads, dumps_bytes
+from .storage import get_storage, LocalStorage
+
+ASSET_TYPES = {".jpg": "image", ".png": "image", ".webp": "image", ".mp4": "video"}
+ASSET_INDEX_PATH = os.getenv("ASSET_INDEX_PATH", os.path.join(STATE_DIR, "asset_index.json"))
+# Seconds between directory mtime scans; requests in between answer purely from memory.
+ASSET_INDEX_REFRESH_INTERVAL = float(os.getenv("ASSET_INDEX_REFRESH_INTERVAL", "2.0"))
+
+
+SNAPSHOT_VERSION = 3
+
+
+def describe_asset(rel_path: str, digest: str = None) -> dict:
+    """Asset record for a path relative to the data directory."""
+    parts = rel_path.split("/")
+    asset = {
+        "path": f"/static/{rel_path}",
+        # Content-hashed, immutable URL; changes whenever the file is regenerated
+        "url": versioned_url(rel_path, digest) if digest else None,
+        "name": parts[-1],
+        "type": ASSET_TYPES.get(os.path.splitext(rel_path)[1].lower(), "image"),
+        "full_path": rel_path,
+        "category": parts[0] if len(parts) > 1 else None,
+        "character": None,
+        "environment": None,
+        "style": None,
+    }
+    # characters/{id}_refs/{style}/{file} and environments/{id}_refs/{file}
+    if len(parts) >= 3 and parts[1].endswith("_refs"):
+        owner = parts[1][:-len("_refs")]
+        if parts[0] == "characters":
+            asset["character"] = owner
+        elif parts[0] == "environments":
+            asset["environment"] = owner
+        if len(parts) >= 4:
+            asset["style"] = parts[2]
+    return asset
+
+
+def encode_cursor(rel_path: str) -> str:
+    return base64.urlsafe_b64encode(rel_path.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> str:
+    return base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+
+
+class AssetIndex:
+    """
+    In-memory index of the images and videos under the data directory.
+    A refresh stats every directory but only lists those whose mtime changed,
+    so it costs one stat per folder instead of a full recursive glob. The
+    directory snapshot is persisted so a restart starts warm.
+    Content digests are recomputed only for files whose mtime or size changed;
+    files are replaced (unlink + write) rather than rewritten in place, which
+    is what bumps their folder's mtime.
+    With sharded or S3 storage there is nothing to scan; the index follows the
+    storage's change feed instead, starting from a full read of its object index.
+    """
+
+    def __init__(self, root: str = DATA_DIR, snapshot_path: str = ASSET_INDEX_PATH,
+                 refresh_interval: float = ASSET_INDEX_REFRESH_INTERVAL, storage=None):
+        self.root = os.path.abspath(root)
+        self.storage = storage or get_storage(self.root)
+        self._scanning = isinstance(self.storage, LocalStorage)
+        self._seq = 0
+        self.snapshot_path = snapshot_path
+        self.refresh_interval = refresh_interval
+        # rel_dir -> {"mtime_ns": int, "files": {name: [mtime_ns, size, digest]}, "subdirs": [names]}
+        self._dirs = {}
+        self._assets = {}
+        self._sorted = []
+        self._refreshed = None
+        self._lock = threading.Lock()
+        if self._scanning:
+            self._load_snapshot()
+
+    def _load_snapshot(self):
+        try:
+            with open(self.snapshot_path, "rb") as f:
+                snapshot = loads(f.read())
+        except (OSError, ValueError):
+            return
+        if snapshot.get("root") != self.root or snapshot.get("version") != SNAPSHOT_VERSION:
+            return
+        self._dirs = snapshot.get("dirs", {})
+        for rel_dir, entry in self._dirs.items():
+            for name, (_, _, digest) in entry["files"].items():
+                rel_path = f"{rel_dir}/{name}" if rel_dir else name
+                self._assets[rel_path] = describe_asset(rel_path, digest)
+        self._sorted = sorted(self._assets)
+
+    def _save_snapshot(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.snapshot_path)), exist_ok=True)
+        tmp = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(dumps_bytes({"version": SNAPSHOT_VERSION, "root": self.root, "dirs": self._dirs}))
+        os.replace(tmp, self.snapshot_path)
+
+    def _drop_dir(self, rel_dir: str):
+        entry = self._dirs.pop(rel_dir, None)
+        if entry is None:
+            return
+        for name in entry["files"]:
+            self._assets.pop(f"{rel_dir}/{name}" if rel_dir else name, None)
+        for sub in entry["subdirs"]:
+            self._drop_dir(f"{rel_dir}/{sub}" if rel_dir else sub)
+
+    def _scan(self, rel_dir: str) -> bool:
+        """Bring one directory (and, recursively, its children) up to date. Returns True on change."""
+        abs_dir = os.path.join(self.root, rel_dir) if rel_dir else self.root
+        try:
+            mtime_ns = os.stat(abs_dir).st_mtime_ns
+        except OSError:
+            had = rel_dir in self._dirs
+            self._drop_dir(rel_dir)
+            return had
+
+        changed = False
+        entry = self._dirs.get(rel_dir)
+        if entry is None or entry["mtime_ns"] != mtime_ns:
+            old = entry or {"files": {}, "subdirs": []}
+            prefix = f"{rel_dir}/" if rel_dir else ""
+            files, subdirs = {}, []
+            with os.scandir(abs_dir) as it:
+                for item in it:
+                    # Hidden entries are skipped, as glob('**') did
+                    if item.name.startswith("."):
+                        continue
+                    if item.is_dir(follow_symlinks=False):
+                        subdirs.append(item.name)
+                    elif os.path.splitext(item.name)[1].lower() in ASSET_TYPES:
+                        st = item.stat()
+                        known = old["files"].get(item.name)
+                        if known and known[0] == st.st_mtime_ns and known[1] == st.st_size:
+                            files[item.name] = known
+                            continue
+                        files[item.name] = [st.st_mtime_ns, st.st_size, file_digest(item.path)]
+                        self._assets[prefix + item.name] = describe_asset(prefix + item.name, files[item.name][2])
+            for name in set(old["files"]) - set(files):
+                self._assets.pop(prefix + name, None)
+            for name in set(old["subdirs"]) - set(subdirs):
+                self._drop_dir(prefix + name)
+            entry = {"mtime_ns": mtime_ns, "files": files, "subdirs": sorted(subdirs)}
+            self._dirs[rel_dir] = entry
+            changed = True
+
+        for sub in entry["subdirs"]:
+            changed = self._scan(f"{rel_dir}/{sub}" if rel_dir else sub) or changed
+        return changed
+
+    def _follow_changes(self):
+        self._seq, changes = self.storage.changes(self._seq)
+        # Small batches are merged into the sorted list; large ones (startup) re-sort once
+        incremental = len(changes) < 1000
+        for key, _, _, digest, deleted in changes:
+            known = key in self._assets
+            if deleted or os.path.splitext(key)[1].lower() not in ASSET_TYPES:
+                if known:
+                    del self._assets[key]
+                    if incremental:
+                        self._sorted.pop(bisect.bisect_left(self._sorted, key))
+                continue
+            self._assets[key] = describe_asset(key, digest)
+            if incremental and not known:
+                bisect.insort(self._sorted, key)
+        if changes and not incremental:
+            self._sorted = sorted(self._assets)
+
+    def refresh(self, force: bool = False):
+        now = time.monotonic()
+        with self._lock:
+            if not force and self._refreshed is not None and now - self._refreshed < self.refresh_interval:
+                return
+            if not self._scanning:
+                self._follow_changes()
+            elif self._scan(""):
+                self._sorted = sorted(self._assets)
+                self._save_snapshot()
+            self._refreshed = now
+
+    def query(self, category: str = None, character: str = None, environment: str = None,
+              style: str = None, asset_type: str = None, cursor: str = None, limit: int = None):
+        """
+        Assets sorted by path, filtered server-side.
+        Returns (assets, next_cursor); next_cursor is None on the last page.
+        """
+        self.refresh()
+        with self._lock:
+            paths = self._sorted
+            start = bisect.bisect_right(paths, decode_cursor(cursor)) if cursor else 0
+            results = []
+            next_cursor = None
+            for i in range(start, len(paths)):
+                asset = self._assets[paths[i]]
+                if category and asset["category"] != category:
+                    continue
+                if character and asset["character"] != character:
+                    continue
+                if environment and asset["environment"] != environment:
+                    continue
+                if style and asset["style"] != style:
+                    continue
+                if asset_type and asset["type"] != asset_type:
+                    continue
+                if limit is not None and len(results) == limit:
+                    next_cursor = encode_cursor(results[-1]["full_path"])
+                    break
+                results.append(dict(asset))
+        return results, next_cursor
+
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_asset_index() -> AssetIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = AssetIndex()
+        return _index
@@ -0,0 +1,121 @@
+import os
+import time
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+from ..config import DATA_DIR
+from .catalog import get_catalog
+from .quota import IMAGEN_MAX_WORKERS
+
+# (sheet, style) tasks rendered at once; the imagen governor still paces every call
+BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", str(IMAGEN_MAX_WORKERS)))
+
+CHARACTER_REFERENCE_TYPES = ("head", "full_body", "side", "back")
+ENVIRONMENT_REFERENCE_TYPES = ("wide", "detail", "lighting")
+
+
+def expand_matrix(character_ids=(), environment_ids=(), style_ids=(), types=(), data_dir: str = DATA_DIR):
+    """
+    Expand a batch request into render tasks, one per sheet (and style, for characters).
+    Characters are rendered once per style, or in their own style when none are given.
+    Environments keep a single, unstyled reference folder, so they ignore style_ids.
+    'types' limits the angles; each sheet kind only gets the types that apply to it.
+    Raises ValueError for unknown IDs or types.
+    """
+    catalog = get_catalog(data_dir)
+    unknown_types = [t for t in types if t not in CHARACTER_REFERENCE_TYPES + ENVIRONMENT_REFERENCE_TYPES]
+    if unknown_types:
+        raise ValueError(f"Invalid reference type: {', '.join(unknown_types)}")
+    for category, ids in (("characters", character_ids), ("environments", environment_ids), ("styles", style_ids)):
+        missing = [i for i in ids if catalog.get(category, i) is None]
+        if missing:
+            raise ValueError(f"Unknown {category}: {', '.join(missing)}")
+
+    character_types = [t for t in types if t in CHARACTER_REFERENCE_TYPES] or None
+    environment_types = [t for t in types if t in ENVIRONMENT_REFERENCE_TYPES] or None
+    tasks = []
+    if not types or character_types:
+        # Sheets vary fastest so early results cover every character, not one at a time
+        for style_id in style_ids or [None]:
+            for character_id in character_ids:
+                tasks.append({"kind": "character", "id": character_id, "style_id": style_id, "types": character_types})
+    if not types or environment_types:
+        for environment_id in environment_ids:
+            tasks.append({"kind": "environment", "id": environment_id, "style_id": None, "types": environment_types})
+    return tasks
+
+
+def _run_task(task: dict, data_dir: str, force: bool, use_cache: bool, emit):
+    from .character_refs import generate_character_references
+    from .environment_refs import generate_environment_references
+
+    category = f"{task['kind']}s"
+
+    def on_event(event):
+        # Only finished images are streamed; the other stages are for per-job SSE
+        if event["stage"] != "image_saved":
+            return
+        emit({
+            "status": "image",
+            "kind": task["kind"],
+            "id": task["id"],
+            "style_id": task["style_id"],
+            "type": event["type"],
+            "source": event["source"],
+            "paths": [f"{category}/{p}" for p in event["paths"]],
+        })
+
+    if task["kind"] == "character":
+        generate_character_references(
+            task["id"], data_dir=os.path.join(data_dir, category), style_id=task["style_id"],
+            # Matrix tasks don't set it: keep each angle's recorded variant count
+            num_images=task.get("num_images"),
+            force=force, use_cache=use_cache, target_types=task["types"], on_event=on_event,
+        )
+    else:
+        generate_environment_references(
+            task["id"], data_dir=os.path.join(data_dir, category),
+            force=force, use_cache=use_cache, target_types=task["types"], on_event=on_event,
+        )
+
+
+def iter_batch(tasks, data_dir: str = DATA_DIR, force: bool = False, use_cache: bool = True,
+               max_workers: int = BATCH_MAX_WORKERS):
+    """
+    Run render tasks concurrently and yield an event dict as each image is ready,
+    then a final summary. A failing task yields an "error" event; the rest carry on.
+    """
+    events = queue.Queue()
+    started = time.monotonic()
+
+    def run(task):
+        # Styles of one character run in parallel; their sheet updates are merged under a lock
+        try:
+            _run_task(task, data_dir, force, use_cache, events.put)
+        except Exception as e:
+            events.put({"status": "error", "kind": task["kind"], "id": task["id"],
+                        "style_id": task["style_id"], "detail": str(e)})
+        events.put(None)
+
+    yield {"status": "started", "tasks": len(tasks)}
+    images = errors = 0
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(tasks))))
+    try:
+        for task in tasks:
+            executor.submit(run, task)
+        pending = len(tasks)
+        while pending:
+            event = events.get()
+            if event is None:
+                pending -= 1
+                continue
+            if event["status"] == "image":
+                images += 1
+            else:
+                errors += 1
+            yield event
+    finally:
+        # A disconnected client stops the stream, not the renders already paid for
+        executor.shutdown(wait=False)
+    yield {"status": "done", "images": images, "errors": errors,
+           "elapsed": round(time.monotonic() - started, 2)}
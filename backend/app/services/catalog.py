@@ -0,0 +1,178 @@
+import os
+import copy
+import time
+import logging
+import threading
+
+from ..config import DATA_DIR
+from .jsonio import loads, JSONDecodeError
+
+logger = logging.getLogger(__name__)
+
+# Seconds a cached entry is trusted before its mtime is checked again.
+# Within this window lookups cost no disk I/O at all.
+CATALOG_STAT_INTERVAL = float(os.getenv("CATALOG_STAT_INTERVAL", "1.0"))
+
+CATEGORIES = ("characters", "environments", "styles", "cinematography", "sequences")
+
+
+class _Entry:
+    __slots__ = ("mtime_ns", "size", "text", "data", "checked")
+
+    def __init__(self, mtime_ns, size, text, checked):
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.text = text
+        self.data = None
+        self.checked = checked
+
+
+class DataCatalog:
+    """
+    In-memory view of the JSON sheets under a data directory, indexed by
+    category and file ID (the filename without .json).
+    Entries are re-read only when their file's mtime or size changes; writers
+    in this process call invalidate() so their changes show up immediately.
+    """
+
+    def __init__(self, root: str, stat_interval: float = CATALOG_STAT_INTERVAL):
+        self.root = os.path.abspath(root)
+        self.stat_interval = stat_interval
+        self._entries = {}
+        self._listings = {}
+        self._lock = threading.RLock()
+
+    def path(self, category: str, filename: str) -> str:
+        return os.path.join(self.root, category, filename)
+
+    @staticmethod
+    def _filename(file_id: str) -> str:
+        return file_id if file_id.endswith(".json") else f"{file_id}.json"
+
+    def _entry(self, category: str, filename: str):
+        key = (category, filename)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry.checked < self.stat_interval:
+                return entry
+            try:
+                st = os.stat(self.path(category, filename))
+            except OSError:
+                self._entries.pop(key, None)
+                return None
+            if entry is not None and entry.mtime_ns == st.st_mtime_ns and entry.size == st.st_size:
+                entry.checked = now
+                return entry
+            try:
+                with open(self.path(category, filename), "r") as f:
+                    text = f.read()
+            except (IsADirectoryError, FileNotFoundError):
+                self._entries.pop(key, None)
+                return None
+            entry = _Entry(st.st_mtime_ns, st.st_size, text, now)
+            self._entries[key] = entry
+            return entry
+
+    def raw(self, category: str, filename: str):
+        """File contents as text, or None if the file does not exist."""
+        entry = self._entry(category, filename)
+        return entry.text if entry is not None else None
+
+    def get(self, category: str, file_id: str):
+        """
+        Parsed sheet, or None if it does not exist.
+        The dict is shared between callers and must be treated as read-only.
+        """
+        entry = self._entry(category, self._filename(file_id))
+        if entry is None:
+            return None
+        if entry.data is None:
+            with self._lock:
+                if entry.data is None:
+                    entry.data = loads(entry.text)
+        return entry.data
+
+    def get_copy(self, category: str, file_id: str):
+        """A private, mutable copy of a sheet, or None if it does not exist."""
+        data = self.get(category, file_id)
+        return copy.deepcopy(data) if data is not None else None
+
+    def list_files(self, category: str):
+        """Names of the .json files in a category."""
+        dir_path = os.path.join(self.root, category)
+        now = time.monotonic()
+        with self._lock:
+            listing = self._listings.get(category)
+            if listing is not None and now - listing[2] < self.stat_interval:
+                return list(listing[1])
+            try:
+                mtime_ns = os.stat(dir_path).st_mtime_ns
+            except OSError:
+                self._listings.pop(category, None)
+                return []
+            if listing is None or listing[0] != mtime_ns:
+                files = sorted(f for f in os.listdir(dir_path) if f.endswith(".json"))
+                listing = [mtime_ns, files, now]
+                self._listings[category] = listing
+            listing[2] = now
+            return list(listing[1])
+
+    def index(self, category: str):
+        """Every sheet in a category, keyed by file ID."""
+        index = {}
+        for filename in self.list_files(category):
+            try:
+                data = self.get(category, filename)
+            except JSONDecodeError as e:
+                logger.warning("Skipping invalid JSON", extra={"category": category, "file": filename, "error": str(e)})
+                continue
+            if data is not None:
+                index[filename[:-5]] = data
+        return index
+
+    def warm(self):
+        """Load every category up front."""
+        for category in CATEGORIES:
+            self.index(category)
+
+    def store(self, category: str, filename: str, text: str, data: dict):
+        """Record a sheet this process just wrote, so the next read neither re-reads nor re-parses it."""
+        try:
+            st = os.stat(self.path(category, filename))
+        except OSError:
+            self.invalidate(category, filename)
+            return
+        entry = _Entry(st.st_mtime_ns, st.st_size, text, time.monotonic())
+        entry.data = data
+        with self._lock:
+            self._listings.pop(category, None)
+            self._entries[(category, filename)] = entry
+
+    def invalidate(self, category: str, file_id: str = None):
+        with self._lock:
+            self._listings.pop(category, None)
+            if file_id is None:
+                for key in [k for k in self._entries if k[0] == category]:
+                    del self._entries[key]
+            else:
+                # Accept either an ID or a full filename such as 'juri.json'
+                self._entries.pop((category, file_id), None)
+                self._entries.pop((category, self._filename(file_id)), None)
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+def get_catalog(root: str = None) -> DataCatalog:
+    """Process-wide catalog for a data directory (DATA_DIR by default)."""
+    root = os.path.abspath(root or DATA_DIR)
+    with _catalogs_lock:
+        if root not in _catalogs:
+            _catalogs[root] = DataCatalog(root)
+        return _catalogs[root]
+
+def catalog_for_dir(category_dir: str):
+    """(catalog, category) for a category directory such as 'data/characters'."""
+    category_dir = os.path.abspath(category_dir)
+    return get_catalog(os.path.dirname(category_dir)), os.path.basename(category_dir)
@@ -1,109 +1,273 @@
 import os
-import json
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from .vertex_ai import generate_visual_from_sheet
-from .parser import create_character_reference_prompts
+from .parser import create_character_reference_prompts, CHARACTER_PROMPT_FIELDS, STYLE_PROMPT_FIELDS
+from .quota import get_governor, IMAGEN_MAX_WORKERS
+from .model_registry import get_imagen_model, IMAGEN_RENDER_ID, IMAGEN_MAX_IMAGES_PER_CALL
+from .catalog import catalog_for_dir
+from .render_cache import get_render_cache, render_key, REFERENCE_IMAGE_PARAMS
+from .thumbnails import schedule_thumbnails
+from .storage import get_storage
+from .manifest import get_manifest, reference_inputs
+from .sheet_store import update_sheet
+from .image_output import output_format, get_image_writer
+from .metrics import IMAGES, IMAGE_BYTES, stage_timer, timed
 
-def generate_character_references(character_id: str, data_dir: str = "data/characters", style_id: str = None, force: bool = False, num_images: int = 1, target_type: str = None):
+logger = logging.getLogger(__name__)
+
+
+class PartialRenderError(Exception):
+    """
+    Raised after some variants failed to render. The ones that succeeded are
+    saved and recorded in the sheet ('references'); rerunning without force
+    renders only the missing ones.
+    """
+
+    def __init__(self, message: str, references: dict, errors: list):
+        super().__init__(message)
+        self.references = references
+        self.errors = errors
+
+
+def generate_character_references(character_id: str, data_dir: str = "data/characters", style_id: str = None, force: bool = False, num_images: int = 1, target_type: str = None, use_cache: bool = True, target_types=None, on_event=None):
     """
     Orchestrates the generation and saving of character references.
     Allows for style-specific overrides and subfolders.
-    'force' will regenerate images even if they already exist.
-    'num_images' controls how many images per angle (head/full_body/side/back) to generate.
+    Existing images are kept unless they are stale: the reference manifest shows an input
+    of their prompt (sheet fields, style, template) or render settings has changed since.
+    'force' will regenerate images even if they are up to date; identical renders are still served from the render cache.
+    'use_cache' set to False always calls the model, bypassing the render cache.
+    'num_images' controls how many images per angle (head/full_body/side/back) to generate;
+    None keeps the number each angle already records for the style (1 for new angles).
+    Counts above IMAGEN_MAX_IMAGES_PER_CALL are split into several concurrent model calls;
+    if some fail, the rest are still saved and PartialRenderError is raised at the end.
     'target_type' if provided, will only generate that specific angle (e.g., 'head').
+    'target_types' is the multi-angle form of 'target_type'.
+    'on_event(event)' receives progress dicts, some from the render threads: stage
+    "prompts_built", "model_call_started", "image_saved" (with the angle's paths and a
+    source of "existing", "cache" or "generated"), "chunk_failed" and finally "json_updated".
+    Every event carries 'elapsed', seconds since the call started.
     """
+    started = time.monotonic()
+
+    def emit(stage, **fields):
+        if on_event is not None:
+            on_event({"stage": stage, "elapsed": round(time.monotonic() - started, 3), **fields})
+
     # 1. Load Character Data
     char_path = os.path.join(data_dir, f"{character_id}.json")
-    if not os.path.exists(char_path):
+    catalog, category = catalog_for_dir(data_dir)
+    character_data = catalog.get_copy(category, character_id)
+    if character_data is None:
         raise FileNotFoundError(f"Character file not found: {char_path}")
     
-    with open(char_path, "r") as f:
-        character_data = json.load(f)
-    
     # Use provided style_id or fallback to character's default style
     effective_style = style_id or character_data.get("style_id", "default_style")
+    # Encoding (JPEG, progressive JPEG, WebP, PNG) is set per style
+    style_sheet = catalog.get("styles", effective_style)
+    fmt = output_format(style_sheet)
     
     # 2. Generate Prompts
-    prompts = create_character_reference_prompts(character_data, style_id=style_id)
+    with stage_timer("character", "prompt_build"):
+        prompts = create_character_reference_prompts(character_data, style_id=style_id)
     
-    # Filter prompts if a target_type is specified
-    if target_type:
-        if target_type not in prompts:
-            raise ValueError(f"Invalid reference type: {target_type}. Valid types are: {list(prompts.keys())}")
-        prompts = {target_type: prompts[target_type]}
-        print(f"Targeting specific reference type: {target_type}")
+    # Filter prompts if target types are specified
+    target_types = list(target_types or ([target_type] if target_type else []))
+    if target_types:
+        invalid = [t for t in target_types if t not in prompts]
+        if invalid:
+            raise ValueError(f"Invalid reference type: {', '.join(invalid)}. Valid types are: {list(prompts.keys())}")
+        prompts = {t: prompts[t] for t in target_types}
+        logger.info("Targeting specific reference types", extra={"character_id": character_id, "types": target_types})
+    emit("prompts_built", style_id=effective_style, types=list(prompts))
     
-    # 3. Setup Folders
-    # We now use a subfolder for the style to avoid overwriting or mixing styles
-    ref_folder = os.path.join(data_dir, f"{character_id}_refs", effective_style)
-    os.makedirs(ref_folder, exist_ok=True)
+    # 3. Setup Storage
+    # We now use a subfolder for the style to avoid overwriting or mixing styles.
+    # Files go through the asset storage, keyed by their path under the data directory.
+    storage = get_storage(catalog.root)
+    key_prefix = f"{category}/{character_id}_refs/{effective_style}/"
+    cache = get_render_cache()
+    manifest = get_manifest()
     
-    import time
-    image_references = {}
-    for ref_type, prompt in prompts.items():
-        # ... logic to generate images ...
+    def save_variant(image, key, asset_key, inputs):
+        with stage_timer("character", "image_save"):
+            blob = cache.save_blob(image, key, fmt)
+            storage.put_file(asset_key, blob, move=not cache.enabled)
+        manifest.record(catalog.root, asset_key, inputs)
+        size = storage.stat(asset_key)[0]
+        IMAGES.labels("character", "generated").inc()
+        IMAGE_BYTES.labels("character").inc(size)
+        logger.info("Saved reference", extra={"character_id": character_id, "key": asset_key, "bytes": size})
+
+    # (ref_type, paths, error) of every failed model call or angle, appended from the render threads
+    failures = []
+
+    def recorded_count(ref_type):
+        refs = character_data.get("reference_images")
+        style_refs = refs.get(effective_style) if isinstance(refs, dict) else None
+        paths = style_refs.get(ref_type) if isinstance(style_refs, dict) else None
+        return len(paths) if isinstance(paths, list) and paths else 1
+
+    def render_angle(ref_type, prompt):
+        angle_started = time.monotonic()
+        count = num_images or recorded_count(ref_type)
         # Determine filenames and relative paths
         type_images_paths = []
         img_filenames = []
-        for i in range(num_images):
-            suffix = f"_{i+1}" if num_images > 1 else ""
-            filename = f"{ref_type}{suffix}.jpg"
+        for i in range(count):
+            suffix = f"_{i+1}" if count > 1 else ""
+            filename = f"{ref_type}{suffix}.{fmt.ext}"
             img_filenames.append(filename)
             type_images_paths.append(f"{character_id}_refs/{effective_style}/{filename}")
         
-        # Check if all exist
-        all_exist = all(os.path.exists(os.path.join(ref_folder, f)) for f in img_filenames)
+        # Check if all exist and none is stale
+        negative_prompt = character_data.get("negative_prompt")
+        inputs = [
+            reference_inputs(character_data, CHARACTER_PROMPT_FIELDS, style_sheet, STYLE_PROMPT_FIELDS, prompt, negative_prompt,
+                             {"model": IMAGEN_RENDER_ID, "format": fmt.cache_id, "variant": i, **REFERENCE_IMAGE_PARAMS})
+            for i in range(count)
+        ]
+        fresh = [manifest.is_fresh(storage, catalog.root, key_prefix + f, inputs[i]) for i, f in enumerate(img_filenames)]
         
-        if all_exist and not force:
-            print(f"Skipping {ref_type} reference (all {num_images} images already exist)")
-            image_references[ref_type] = type_images_paths[0] if num_images == 1 else type_images_paths
-            continue
+        if all(fresh) and not force:
+            logger.info("Skipping reference, all images up to date",
+                        extra={"character_id": character_id, "style_id": effective_style, "ref_type": ref_type, "images": count})
+            emit("image_saved", type=ref_type, paths=type_images_paths, source="existing", duration=0.0)
+            return type_images_paths[0] if count == 1 else type_images_paths
 
-        print(f"\nGenerating {num_images} variant(s) for {ref_type} reference in style: {effective_style}...")
-        print(f"DEBUG: Character Reference Prompt: {prompt}")
-        
-        from vertexai.preview.vision_models import ImageGenerationModel
-        model = ImageGenerationModel.from_pretrained("imagen-3.0-generate-002")
-        
-        images = model.generate_images(
-            prompt=prompt,
-            number_of_images=num_images,
-            aspect_ratio="1:1",
-            add_watermark=False,
-            safety_filter_level="block_only_high",
-            person_generation="allow_all",
-            negative_prompt=character_data.get("negative_prompt"),
-        )
-        
-        for idx, image in enumerate(images):
-            save_path = os.path.join(ref_folder, img_filenames[idx])
-            image.save(save_path)
-            print(f"Saved {img_filenames[idx]} reference to {save_path}")
+        # Variants already rendered with identical parameters come from the render cache
+        keys = [
+            render_key(prompt, negative_prompt, IMAGEN_RENDER_ID, variant_index=i, output_format=fmt.cache_id, **REFERENCE_IMAGE_PARAMS)
+            for i in range(count)
+        ]
+        # Variants whose file matches the current inputs: up to date, linked from the cache or written below
+        current = {idx for idx, is_fresh in enumerate(fresh) if is_fresh}
+        missing = []
+        for idx, key in enumerate(keys):
+            # Without force, up-to-date variants (e.g. from an earlier, partly failed run) are kept
+            if not force and fresh[idx]:
+                continue
+            blob = cache.lookup(key) if use_cache else None
+            if blob is not None:
+                storage.put_file(key_prefix + img_filenames[idx], blob)
+                manifest.record(catalog.root, key_prefix + img_filenames[idx], inputs[idx])
+                current.add(idx)
+                IMAGES.labels("character", "cache").inc()
+                logger.info("Linked reference from render cache", extra={"character_id": character_id, "key": key_prefix + img_filenames[idx]})
+            else:
+                missing.append(idx)
+
+        if missing:
+            logger.info("Generating reference", extra={
+                "character_id": character_id, "style_id": effective_style, "ref_type": ref_type, "variants": len(missing),
+            })
+            logger.debug("Character reference prompt", extra={"character_id": character_id, "ref_type": ref_type, "prompt": prompt})
+            
+            model = get_imagen_model()
+            # Imagen caps images per request, so variants go out in chunks
+            chunks = [missing[i:i + IMAGEN_MAX_IMAGES_PER_CALL] for i in range(0, len(missing), IMAGEN_MAX_IMAGES_PER_CALL)]
+            emit("model_call_started", type=ref_type, variants=len(missing), calls=len(chunks))
+
+            def render_chunk(chunk):
+                """Render and save one chunk; returns the variants the model returned no image for."""
+                # The shared governor paces the call and retries 429s.
+                # Only the list is kept, so each image is freed once its file is written.
+                images = list(get_governor("imagen").call(
+                    timed("character", "model_call", model.generate_images),
+                    prompt=prompt,
+                    number_of_images=len(chunk),
+                    negative_prompt=negative_prompt,
+                    **REFERENCE_IMAGE_PARAMS,
+                ))
+                returned = chunk[:len(images)]
+                # Encoding and writes run on the image writer pool
+                writes = []
+                for idx in returned:
+                    writes.append((idx, get_image_writer().submit(save_variant, images.pop(0), keys[idx], key_prefix + img_filenames[idx], inputs[idx])))
+                for idx, write in writes:
+                    write.result()
+                    current.add(idx)
+                return chunk[len(returned):]
+
+            # Chunks run concurrently; every one finishes (or fails) before the angle does
+            with ThreadPoolExecutor(max_workers=max(1, min(IMAGEN_MAX_WORKERS, len(chunks)))) as chunk_executor:
+                outcomes = [chunk_executor.submit(render_chunk, chunk) for chunk in chunks]
+            for chunk, outcome in zip(chunks, outcomes):
+                error = outcome.exception()
+                lost = chunk if error is not None else outcome.result()
+                if not lost:
+                    continue
+                if error is None:
+                    # Fewer images than requested (e.g. some filtered out) fail like a failed call
+                    error = RuntimeError(f"Imagen returned {len(chunk) - len(lost)} of {len(chunk)} images")
+                failed = [type_images_paths[idx] for idx in lost]
+                failures.append((ref_type, failed, error))
+                logger.warning("Reference chunk failed", extra={
+                    "character_id": character_id, "ref_type": ref_type, "variants": len(lost), "error": str(error),
+                })
+                emit("chunk_failed", type=ref_type, paths=failed, error=str(error))
+
+        # Only current variants are recorded: a stale file left by a failed chunk is not
+        saved = [(type_images_paths[idx], key_prefix + img_filenames[idx]) for idx in sorted(current)]
+        if not saved:
+            errors = [error for failed_type, _, error in failures if failed_type == ref_type]
+            raise errors[0] if errors else RuntimeError(f"No images were returned for {ref_type}")
+        schedule_thumbnails([key for _, key in saved], storage)
+        type_images_paths = [path for path, _ in saved]
+        emit("image_saved", type=ref_type, paths=type_images_paths, source="generated" if missing else "cache",
+             duration=round(time.monotonic() - angle_started, 3))
         
         # Store as string if only one, or list if multiple
-        image_references[ref_type] = type_images_paths[0] if num_images == 1 else type_images_paths
-        
-        # Small delay to avoid 429 Quota Exceeded
-        print("Waiting 5 seconds for quota reset...")
-        time.sleep(5)
+        return type_images_paths[0] if count == 1 else type_images_paths
+
+    # 4. Render angles concurrently; the shared quota governor sets the pace.
+    # A failed angle doesn't discard the others: they are recorded before the error is raised.
+    with ThreadPoolExecutor(max_workers=max(1, min(IMAGEN_MAX_WORKERS, len(prompts)))) as executor:
+        futures = {ref_type: executor.submit(render_angle, ref_type, prompt) for ref_type, prompt in prompts.items()}
+    image_references = {}
+    for ref_type, future in futures.items():
+        if future.exception() is None:
+            image_references[ref_type] = future.result()
+        elif not any(failed_type == ref_type for failed_type, _, _ in failures):
+            failures.append((ref_type, [], future.exception()))
+    if failures and not image_references:
+        raise failures[0][2]
 
     # 5. Update JSON
-    # We now store reference images mapped by style_id to support multiple styles
-    if "reference_images" not in character_data or not isinstance(character_data["reference_images"], dict):
-        character_data["reference_images"] = {}
-        
-    # If the current structure is the old one (not keyed by style), migrate it or just nest it
-    # We check if the first level of keys looks like style IDs or reference types (front/side/back)
-    first_key = next(iter(character_data["reference_images"].keys()), None)
-    if first_key in ["front", "side", "back", "head", "full_body"]:
-        # Legacy format detected, migrate to style-keyed format
-        old_refs = character_data["reference_images"]
-        old_style = character_data.get("style_id", "legacy")
-        character_data["reference_images"] = {old_style: old_refs}
-
-    character_data["reference_images"][effective_style] = image_references
+    # Merged into the latest on-disk sheet under a lock, so concurrent renders and edits all survive
+    def merge_references(sheet):
+        # We now store reference images mapped by style_id to support multiple styles
+        if "reference_images" not in sheet or not isinstance(sheet["reference_images"], dict):
+            sheet["reference_images"] = {}
+            
+        # If the current structure is the old one (not keyed by style), migrate it or just nest it
+        # We check if the first level of keys looks like style IDs or reference types (front/side/back)
+        first_key = next(iter(sheet["reference_images"].keys()), None)
+        if first_key in ["front", "side", "back", "head", "full_body"]:
+            # Legacy format detected, migrate to style-keyed format
+            old_refs = sheet["reference_images"]
+            old_style = sheet.get("style_id", "legacy")
+            sheet["reference_images"] = {old_style: old_refs}
+
+        # Merge, so rendering a subset of angles keeps the others
+        style_refs = sheet["reference_images"].get(effective_style)
+        if isinstance(style_refs, dict):
+            style_refs.update(image_references)
+        else:
+            sheet["reference_images"][effective_style] = image_references
     
-    with open(char_path, "w") as f:
-        json.dump(character_data, f, indent=4)
+    with stage_timer("character", "json_write"):
+        update_sheet(char_path, merge_references)
+    catalog.invalidate(category, character_id)
+    emit("json_updated", style_id=effective_style)
     
-    print(f"Updated {char_path} with reference images for style '{effective_style}'.")
+    logger.info("Updated sheet with reference images", extra={"path": char_path, "style_id": effective_style})
+    if failures:
+        failed = sum(len(paths) or 1 for _, paths, _ in failures)
+        raise PartialRenderError(
+            f"{failed} reference(s) failed for {character_id}, the rest were saved: {failures[0][2]}",
+            image_references, [{"type": ref_type, "paths": paths, "error": str(error)} for ref_type, paths, error in failures],
+        )
     return image_references
@@ -0,0 +1,73 @@
+from typing import Iterable, Iterator, Tuple
+
+from .parser import load_json_data, cinematography_text, subject_text, context_text, ambiance_text
+
+
+class PromptCompiler:
+    """
+    Streaming counterpart of parser.parse_scene.
+    The fixed parts of the prompt are compiled into one template per
+    (style, cinematography) pair, and character and environment fragments are
+    built once per ID, so each scene only costs a dictionary lookup and a format.
+    A compiler caches what it has seen; use a fresh one per sequence to pick up edits.
+    """
+
+    def __init__(self):
+        self._templates = {}
+        self._characters = {}
+        self._contexts = {}
+
+    def _character(self, character_id):
+        entry = self._characters.get(character_id)
+        if entry is None:
+            character_data = load_json_data("characters", character_id)
+            entry = (subject_text(character_id, character_data), character_data)
+            self._characters[character_id] = entry
+        return entry
+
+    def _context(self, env_id):
+        context = self._contexts.get(env_id)
+        if context is None:
+            context = context_text(load_json_data("environments", env_id))
+            self._contexts[env_id] = context
+        return context
+
+    def _template(self, style_id, shot_type):
+        key = (style_id, shot_type)
+        template = self._templates.get(key)
+        if template is None:
+            cinematography = cinematography_text(shot_type).replace("{", "{{").replace("}", "}}")
+            ambiance = ambiance_text(load_json_data("styles", style_id)).replace("{", "{{").replace("}", "}}")
+            template = f"{cinematography}, {{subject}}, {{action}}, {{context}}. {ambiance}."
+            self._templates[key] = template
+        return template
+
+    def compile_scene(self, scene_data: dict, index: int = 0) -> Tuple[str, str, str]:
+        """Returns (scene_id, prompt, negative_prompt); the prompt matches parse_scene."""
+        character_id = scene_data.get('character_id')
+        subject, character_data = self._character(character_id)
+        style_id = scene_data.get('style_id') or character_data.get('style_id')
+        template = self._template(style_id, scene_data.get('cinematography', 'medium_shot'))
+        prompt = template.format(
+            subject=subject,
+            action=scene_data.get('action', 'standing still'),
+            context=self._context(scene_data.get('environment_id')),
+        )
+        negative_prompt = ", ".join(dict.fromkeys(filter(None, [
+            scene_data.get('negative_prompt'),
+            character_data.get('negative_prompt'),
+        ])))
+        scene_id = scene_data.get('scene_id') or f"{index + 1:03d}"
+        return scene_id, prompt, negative_prompt
+
+    def iter_sequence(self, scenes: Iterable[dict]) -> Iterator[Tuple[str, str, str]]:
+        for index, scene in enumerate(scenes):
+            yield self.compile_scene(scene, index)
+
+
+def iter_sequence(scenes: Iterable[dict]) -> Iterator[Tuple[str, str, str]]:
+    """
+    Yield (scene_id, prompt, negative_prompt) for each scene as it is compiled.
+    'scenes' may be any iterable, so callers can feed scenes lazily.
+    """
+    return PromptCompiler().iter_sequence(scenes)
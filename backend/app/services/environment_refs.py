@@ -1,72 +1,158 @@
 import os
-import json
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from .vertex_ai import generate_visual_from_sheet
-from .parser import create_environment_reference_prompts
+from .parser import create_environment_reference_prompts, ENVIRONMENT_PROMPT_FIELDS, STYLE_PROMPT_FIELDS
+from .quota import get_governor, IMAGEN_MAX_WORKERS
+from .model_registry import get_imagen_model, IMAGEN_RENDER_ID
+from .catalog import catalog_for_dir
+from .render_cache import get_render_cache, render_key, REFERENCE_IMAGE_PARAMS
+from .thumbnails import schedule_thumbnails
+from .storage import get_storage
+from .manifest import get_manifest, reference_inputs
+from .sheet_store import update_sheet
+from .image_output import output_format, get_image_writer
+from .metrics import IMAGES, IMAGE_BYTES, stage_timer, timed
+from .character_refs import PartialRenderError
 
-def generate_environment_references(environment_id: str, data_dir: str = "data/environments"):
+logger = logging.getLogger(__name__)
+
+def generate_environment_references(environment_id: str, data_dir: str = "data/environments", force: bool = False, use_cache: bool = True, target_types=None, on_event=None):
     """
     Orchestrates the generation and saving of environment references.
+    Existing images are kept unless the reference manifest shows them stale, as in generate_character_references.
+    'force' will regenerate images even if they are up to date; identical renders are still served from the render cache.
+    'use_cache' set to False always calls the model, bypassing the render cache.
+    'target_types' if provided, only those reference types (e.g. ['wide']) are generated.
+    'on_event(event)' receives progress dicts, as in generate_character_references.
+    If some angles fail, the others are still saved and recorded, then PartialRenderError is raised.
     """
+    started = time.monotonic()
+
+    def emit(stage, **fields):
+        if on_event is not None:
+            on_event({"stage": stage, "elapsed": round(time.monotonic() - started, 3), **fields})
+
     # 1. Load Environment Data
     env_path = os.path.join(data_dir, f"{environment_id}.json")
-    if not os.path.exists(env_path):
-        # Try without extension if needed, but standard is with .json
-        if not environment_id.endswith(".json"):
-            env_path = os.path.join(data_dir, f"{environment_id}.json")
-            
-    if not os.path.exists(env_path):
+    catalog, category = catalog_for_dir(data_dir)
+    environment_data = catalog.get_copy(category, environment_id)
+    if environment_data is None:
         raise FileNotFoundError(f"Environment file not found: {env_path}")
     
-    with open(env_path, "r") as f:
-        environment_data = json.load(f)
-    
     # 2. Generate Prompts
-    prompts = create_environment_reference_prompts(environment_data)
+    with stage_timer("environment", "prompt_build"):
+        prompts = create_environment_reference_prompts(environment_data)
+    if target_types:
+        invalid = [t for t in target_types if t not in prompts]
+        if invalid:
+            raise ValueError(f"Invalid reference type: {', '.join(invalid)}. Valid types are: {list(prompts.keys())}")
+        prompts = {t: prompts[t] for t in target_types}
+    emit("prompts_built", types=list(prompts))
     
-    # 3. Setup Folders
-    ref_folder = os.path.join(data_dir, f"{environment_id}_refs")
-    os.makedirs(ref_folder, exist_ok=True)
+    # Environments have no style; an "output" block on the sheet itself sets the encoding
+    fmt = output_format(environment_data)
+
+    # 3. Setup Storage
+    # Files go through the asset storage, keyed by their path under the data directory
+    storage = get_storage(catalog.root)
+    cache = get_render_cache()
+    manifest = get_manifest()
+    style_sheet = catalog.get("styles", environment_data.get("style_id")) if environment_data.get("style_id") else None
     
-    import time
-    image_references = {}
-    for ref_type, prompt in prompts.items():
-        img_filename = f"{ref_type}.jpg"
-        img_path = os.path.join(ref_folder, img_filename)
+    def save_image(image, key, asset_key, inputs):
+        with stage_timer("environment", "image_save"):
+            blob = cache.save_blob(image, key, fmt)
+            storage.put_file(asset_key, blob, move=not cache.enabled)
+        manifest.record(catalog.root, asset_key, inputs)
+
+    def render_angle(ref_type, prompt):
+        angle_started = time.monotonic()
+        img_filename = f"{ref_type}.{fmt.ext}"
+        asset_key = f"{category}/{environment_id}_refs/{img_filename}"
         
-        # Check if already exists to save quota
-        if os.path.exists(img_path):
-            print(f"Skipping {ref_type} reference (already exists at {img_path})")
-            image_references[ref_type] = f"{environment_id}_refs/{img_filename}"
-            continue
+        # Check if already exists and is not stale, to save quota
+        negative_prompt = environment_data.get("negative_prompt")
+        inputs = reference_inputs(environment_data, ENVIRONMENT_PROMPT_FIELDS, style_sheet, STYLE_PROMPT_FIELDS, prompt, negative_prompt,
+                                  {"model": IMAGEN_RENDER_ID, "format": fmt.cache_id, "variant": 0, **REFERENCE_IMAGE_PARAMS})
+        if not force and manifest.is_fresh(storage, catalog.root, asset_key, inputs):
+            logger.info("Skipping reference, image up to date", extra={"environment_id": environment_id, "key": asset_key})
+            emit("image_saved", type=ref_type, paths=[f"{environment_id}_refs/{img_filename}"], source="existing", duration=0.0)
+            return f"{environment_id}_refs/{img_filename}"
+
+        # Identical renders come from the render cache
+        key = render_key(prompt, negative_prompt, IMAGEN_RENDER_ID, output_format=fmt.cache_id, **REFERENCE_IMAGE_PARAMS)
+        blob = cache.lookup(key) if use_cache else None
+        if blob is not None:
+            storage.put_file(asset_key, blob)
+            manifest.record(catalog.root, asset_key, inputs)
+            IMAGES.labels("environment", "cache").inc()
+            logger.info("Linked reference from render cache", extra={"environment_id": environment_id, "key": asset_key})
+            schedule_thumbnails([asset_key], storage)
+            emit("image_saved", type=ref_type, paths=[f"{environment_id}_refs/{img_filename}"], source="cache",
+                 duration=round(time.monotonic() - angle_started, 3))
+            return f"{environment_id}_refs/{img_filename}"
 
-        print(f"\nGenerating {ref_type} reference...")
-        print(f"DEBUG: Environment Reference Prompt: {prompt}")
+        logger.info("Generating reference", extra={"environment_id": environment_id, "ref_type": ref_type})
+        logger.debug("Environment reference prompt", extra={"environment_id": environment_id, "ref_type": ref_type, "prompt": prompt})
         
-        from vertexai.preview.vision_models import ImageGenerationModel
-        model = ImageGenerationModel.from_pretrained("imagen-3.0-generate-002")
+        model = get_imagen_model()
+        emit("model_call_started", type=ref_type, variants=1)
         
-        images = model.generate_images(
+        # The shared governor paces the call and retries 429s
+        images = list(get_governor("imagen").call(
+            timed("environment", "model_call", model.generate_images),
             prompt=prompt,
             number_of_images=1,
-            aspect_ratio="1:1",
-            add_watermark=False,
-            safety_filter_level="block_only_high",
-            person_generation="allow_all",
-            negative_prompt=environment_data.get("negative_prompt"),
-        )
-        
-        images[0].save(img_path)
-        image_references[ref_type] = f"{environment_id}_refs/{img_filename}"
-        print(f"Saved {ref_type} reference to {img_path}")
-        
-        # Small delay to avoid 429 Quota Exceeded
-        print("Waiting 5 seconds for quota reset...")
-        time.sleep(5)
+            negative_prompt=negative_prompt,
+            **REFERENCE_IMAGE_PARAMS,
+        ))
+        if not images:
+            raise RuntimeError(f"No image was returned for {ref_type}")
+
+        # Encoded and written on the image writer pool; the buffer is freed once it is on disk
+        get_image_writer().submit(save_image, images.pop(0), key, asset_key, inputs).result()
+        size = storage.stat(asset_key)[0]
+        IMAGES.labels("environment", "generated").inc()
+        IMAGE_BYTES.labels("environment").inc(size)
+        logger.info("Saved reference", extra={"environment_id": environment_id, "key": asset_key, "bytes": size})
+        schedule_thumbnails([asset_key], storage)
+        emit("image_saved", type=ref_type, paths=[f"{environment_id}_refs/{img_filename}"], source="generated",
+             duration=round(time.monotonic() - angle_started, 3))
+        return f"{environment_id}_refs/{img_filename}"
+
+    # 4. Render angles concurrently; the shared quota governor sets the pace.
+    # A failed angle doesn't discard the others: they are recorded before the error is raised.
+    with ThreadPoolExecutor(max_workers=max(1, min(IMAGEN_MAX_WORKERS, len(prompts)))) as executor:
+        futures = {ref_type: executor.submit(render_angle, ref_type, prompt) for ref_type, prompt in prompts.items()}
+    image_references, failures = {}, []
+    for ref_type, future in futures.items():
+        if future.exception() is None:
+            image_references[ref_type] = future.result()
+        else:
+            failures.append((ref_type, [f"{environment_id}_refs/{ref_type}.{fmt.ext}"], future.exception()))
+    if failures and not image_references:
+        raise failures[0][2]
 
     # 5. Update JSON
-    environment_data["reference_images"] = image_references
-    with open(env_path, "w") as f:
-        json.dump(environment_data, f, indent=4)
+    # Merged into the latest on-disk sheet under a lock, so concurrent renders and edits all survive
+    def merge_references(sheet):
+        # Merge, so rendering a subset of types keeps the others
+        if isinstance(sheet.get("reference_images"), dict):
+            sheet["reference_images"].update(image_references)
+        else:
+            sheet["reference_images"] = image_references
+
+    with stage_timer("environment", "json_write"):
+        update_sheet(env_path, merge_references)
+    catalog.invalidate(category, environment_id)
+    emit("json_updated")
     
-    print(f"Updated {env_path} with reference images.")
+    logger.info("Updated sheet with reference images", extra={"path": env_path})
+    if failures:
+        raise PartialRenderError(
+            f"{len(failures)} reference(s) failed for {environment_id}, the rest were saved: {failures[0][2]}",
+            image_references, [{"type": ref_type, "paths": paths, "error": str(error)} for ref_type, paths, error in failures],
+        )
     return image_references
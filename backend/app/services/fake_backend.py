@@ -0,0 +1,163 @@
+import io
+import os
+import json
+import math
+import time
+import random
+import hashlib
+import threading
+
+from .model_registry import IMAGEN_MAX_IMAGES_PER_CALL
+
+# Offline stand-ins for the Vertex models, selected with GENERATION_BACKEND=fake.
+# Latency specs are in milliseconds: "fixed:800", "uniform:200,1200",
+# "normal:800,150" (clipped at 0) or "lognormal:800,0.5" (median, sigma; long tail).
+FAKE_IMAGEN_LATENCY = os.getenv("FAKE_IMAGEN_LATENCY", "lognormal:2500,0.35")
+FAKE_GEMINI_LATENCY = os.getenv("FAKE_GEMINI_LATENCY", "lognormal:1200,0.4")
+# Edge length of the synthetic images; FAKE_IMAGE_BYTES pads each JPEG up to that size.
+FAKE_IMAGE_SIZE = int(os.getenv("FAKE_IMAGE_SIZE", "1024"))
+FAKE_IMAGE_BYTES = int(os.getenv("FAKE_IMAGE_BYTES", "0"))
+# Fraction of calls failing with a 429 (quota) or a 500 error
+FAKE_ERROR_RATE_429 = float(os.getenv("FAKE_ERROR_RATE_429", "0"))
+FAKE_ERROR_RATE_500 = float(os.getenv("FAKE_ERROR_RATE_500", "0"))
+# Seed for latencies and injected errors; unset draws a fresh sequence per process
+FAKE_SEED = os.getenv("FAKE_SEED")
+
+_rng = random.Random(int(FAKE_SEED) if FAKE_SEED else None)
+_rng_lock = threading.Lock()
+
+
+class FakeAPIError(Exception):
+    """Shaped like google.api_core errors: a numeric 'code' and the status in the message."""
+
+    def __init__(self, code: int, status: str):
+        super().__init__(f"{code} {status} (fake backend)")
+        self.code = code
+
+
+def parse_latency(spec: str):
+    """Turn a latency spec into a function returning a delay in seconds."""
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v]
+    if kind == "fixed" and len(values) == 1:
+        return lambda rng: values[0] / 1000
+    if kind == "uniform" and len(values) == 2:
+        return lambda rng: rng.uniform(*values) / 1000
+    if kind == "normal" and len(values) == 2:
+        return lambda rng: max(0.0, rng.gauss(*values)) / 1000
+    if kind == "lognormal" and len(values) == 2:
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1]) / 1000
+    raise ValueError(f"Invalid latency spec: {spec!r}")
+
+
+def _simulate_call(latency):
+    """Sleep like a remote call, then fail as configured."""
+    with _rng_lock:
+        delay = latency(_rng)
+        roll = _rng.random()
+    time.sleep(delay)
+    if roll < FAKE_ERROR_RATE_429:
+        raise FakeAPIError(429, "RESOURCE_EXHAUSTED: Quota exceeded")
+    if roll < FAKE_ERROR_RATE_429 + FAKE_ERROR_RATE_500:
+        raise FakeAPIError(500, "INTERNAL: Internal error encountered")
+
+
+def synthetic_jpeg(seed: str, size: int = FAKE_IMAGE_SIZE, pad_to: int = FAKE_IMAGE_BYTES) -> bytes:
+    """A gradient image whose colours follow the seed, so the same prompt gives the same picture."""
+    from PIL import Image
+
+    digest = hashlib.sha256(seed.encode("utf-8")).digest()
+    start, end = digest[:3], digest[3:6]
+    ramp = Image.linear_gradient("L").resize((size, size))
+    img = Image.merge("RGB", [
+        ramp.point(lambda v, a=a, b=b: a + (b - a) * v // 255) for a, b in zip(start, end)
+    ])
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=90)
+    data = buf.getvalue()
+    # Decoders stop at the end-of-image marker, so trailing padding is harmless
+    if pad_to > len(data):
+        data += b"\0" * (pad_to - len(data))
+    return data
+
+
+class FakeGeneratedImage:
+    def __init__(self, image_bytes: bytes):
+        self._image_bytes = image_bytes
+
+    def save(self, location: str, include_generation_parameters: bool = False):
+        ext = os.path.splitext(location)[1].lower()
+        if ext in (".jpg", ".jpeg", ""):
+            with open(location, "wb") as f:
+                f.write(self._image_bytes)
+            return
+        # Like the SDK, re-encode for other extensions
+        from PIL import Image
+        with Image.open(io.BytesIO(self._image_bytes)) as img:
+            img.save(location)
+
+
+class FakeImageGenerationResponse:
+    def __init__(self, images):
+        self.images = images
+
+    def __getitem__(self, idx):
+        return self.images[idx]
+
+    def __iter__(self):
+        return iter(self.images)
+
+    def __len__(self):
+        return len(self.images)
+
+
+class FakeImageGenerationModel:
+    """Stand-in for vertexai's ImageGenerationModel."""
+
+    def __init__(self, model_id: str, latency: str = FAKE_IMAGEN_LATENCY):
+        self.model_id = model_id
+        self._latency = parse_latency(latency)
+
+    def generate_images(self, prompt: str, number_of_images: int = 1, negative_prompt: str = None, seed: int = None, **kwargs):
+        # Rejected like the real API, which caps images per request
+        if not 1 <= number_of_images <= IMAGEN_MAX_IMAGES_PER_CALL:
+            raise FakeAPIError(400, f"INVALID_ARGUMENT: number_of_images must be between 1 and {IMAGEN_MAX_IMAGES_PER_CALL}")
+        _simulate_call(self._latency)
+        return FakeImageGenerationResponse([
+            FakeGeneratedImage(synthetic_jpeg(f"{prompt}|{negative_prompt}|{seed}|{i}"))
+            for i in range(number_of_images)
+        ])
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    """Stand-in for vertexai's GenerativeModel; answers with a character sheet built from the prompt."""
+
+    def __init__(self, model_id: str, latency: str = FAKE_GEMINI_LATENCY):
+        self.model_id = model_id
+        self._latency = parse_latency(latency)
+
+    def generate_content(self, contents, generation_config=None, **kwargs):
+        _simulate_call(self._latency)
+        prompt = contents[-1] if isinstance(contents, (list, tuple)) else contents
+        words = [w.strip(".,;:!?") for w in str(prompt).split()]
+        name = " ".join(w.capitalize() for w in words[:2] if w) or "Unnamed"
+        return FakeResponse(json.dumps({
+            "character_id": "",
+            "name": name,
+            "physical_traits": {
+                "age_range": "30s",
+                "hair": "short, dark",
+                "eyes": "grey",
+                "physique": "average",
+            },
+            "style_id": "cyberpunk_v1",
+            "clothing": "Weathered jacket over a plain shirt",
+            "extra_details": str(prompt),
+            "negative_prompt": "text, watermark",
+            "reference_images": {"default": {"head": "", "full_body": "", "side": "", "back": ""}},
+        }))
@@ -0,0 +1,124 @@
+import io
+import os
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Defaults for every render; a style sheet's "output" block overrides them, e.g.
+# "output": {"format": "webp", "quality": 90} or {"format": "png"}.
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "jpeg").lower()
+# 0 leaves the encoder's default
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "0"))
+IMAGE_PROGRESSIVE = os.getenv("IMAGE_PROGRESSIVE", "0").lower() in ("1", "true", "yes")
+IMAGE_LOSSLESS = os.getenv("IMAGE_LOSSLESS", "0").lower() in ("1", "true", "yes")
+# Threads encoding and writing images while the render threads go on to the next model call
+IMAGE_WRITE_WORKERS = int(os.getenv("IMAGE_WRITE_WORKERS", "4"))
+
+EXTENSIONS = {"jpeg": "jpg", "webp": "webp", "png": "png"}
+
+# Where the SDK's save() puts the generation parameters (EXIF UserComment); re-encoded files keep them
+_EXIF_USER_COMMENT = 0x9286
+_GENERATION_PARAMETERS_KEY = "google.cloud.vertexai.image_generation.image_generation_parameters"
+
+
+class OutputFormat:
+    """How rendered images are encoded on disk."""
+
+    __slots__ = ("format", "quality", "progressive", "lossless")
+
+    def __init__(self, format: str = "jpeg", quality: int = None, progressive: bool = False, lossless: bool = False):
+        format = format.lower()
+        if format == "jpg":
+            format = "jpeg"
+        if format not in EXTENSIONS:
+            raise ValueError(f"Unsupported image format: {format}. Supported: {', '.join(EXTENSIONS)}")
+        if quality is not None and not 1 <= int(quality) <= 100:
+            raise ValueError(f"Image quality must be between 1 and 100, got {quality}")
+        self.format = format
+        self.quality = int(quality) if quality else None
+        self.progressive = bool(progressive) and format == "jpeg"
+        self.lossless = bool(lossless) and format == "webp"
+
+    @property
+    def ext(self) -> str:
+        return EXTENSIONS[self.format]
+
+    @property
+    def passthrough(self) -> bool:
+        """Plain JPEG: written by the SDK's own save(), exactly as before formats were configurable."""
+        return self.format == "jpeg" and self.quality is None and not self.progressive
+
+    @property
+    def cache_id(self) -> str:
+        """Part of the render cache key; 'jpg' for the passthrough format, so earlier renders still match."""
+        if self.passthrough:
+            return "jpg"
+        parts = [self.ext]
+        if self.quality:
+            parts.append(f"q{self.quality}")
+        if self.progressive:
+            parts.append("progressive")
+        if self.lossless:
+            parts.append("lossless")
+        return ":".join(parts)
+
+    def save_options(self) -> dict:
+        options = {}
+        if self.quality and self.format != "png":
+            options["quality"] = self.quality
+        if self.progressive:
+            options["progressive"] = True
+        if self.lossless:
+            options["lossless"] = True
+        if self.format == "png":
+            options["optimize"] = True
+        return options
+
+
+DEFAULT_OUTPUT = OutputFormat(IMAGE_FORMAT, IMAGE_QUALITY or None, IMAGE_PROGRESSIVE, IMAGE_LOSSLESS)
+
+
+def output_format(sheet: dict = None) -> OutputFormat:
+    """The output format set by a sheet's "output" block (usually the style's), else the defaults."""
+    block = (sheet or {}).get("output")
+    if not isinstance(block, dict):
+        return DEFAULT_OUTPUT
+    return OutputFormat(
+        block.get("format", DEFAULT_OUTPUT.format),
+        quality=block.get("quality", DEFAULT_OUTPUT.quality),
+        progressive=block.get("progressive", DEFAULT_OUTPUT.progressive),
+        lossless=block.get("lossless", DEFAULT_OUTPUT.lossless),
+    )
+
+
+def write_image(image, path: str, fmt: OutputFormat = DEFAULT_OUTPUT):
+    """Encode a generated image (SDK or fake) into path in the given format."""
+    if fmt.passthrough:
+        image.save(path)
+        return
+    from PIL import Image
+
+    with Image.open(io.BytesIO(image._image_bytes)) as img:
+        exif = img.getexif()
+        params = getattr(image, "generation_parameters", None)
+        if params:
+            exif[_EXIF_USER_COMMENT] = json.dumps({_GENERATION_PARAMETERS_KEY: params})
+        if fmt.format == "jpeg" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        # Pillow streams the encoder's output straight into the file
+        img.save(path, format=fmt.format.upper(), exif=exif, **fmt.save_options())
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_image_writer() -> ThreadPoolExecutor:
+    """
+    Process-wide pool for encoding and writing images. Pillow releases the GIL while
+    encoding, and threads avoid copying each image buffer into another process.
+    """
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = ThreadPoolExecutor(max_workers=max(1, IMAGE_WRITE_WORKERS), thread_name_prefix="image-writer")
+        return _writer
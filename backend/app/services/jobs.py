@@ -0,0 +1,294 @@
+import os
+import time
+import uuid
+import socket
+import sqlite3
+import contextlib
+import importlib
+import logging
+import threading
+import multiprocessing
+
+from ..config import STATE_DIR
+from .jsonio import loads, dumps
+from .model_registry import warm_up, WARM_UP_MODELS
+from ..logging_config import configure_logging
+
+logger = logging.getLogger(__name__)
+
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", os.path.join(STATE_DIR, "jobs.sqlite3"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+# How often progress streams check for new job events
+JOB_EVENTS_POLL_INTERVAL = float(os.getenv("JOB_EVENTS_POLL_INTERVAL", "0.25"))
+# A running job whose lease is not renewed within this window is considered
+# abandoned (worker crashed or uvicorn restarted) and is handed out again.
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "120"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+# Job kind -> "module:function", resolved relative to this package inside the worker.
+JOB_HANDLERS = {
+    "character": ".character_refs:generate_character_references",
+    "environment": ".environment_refs:generate_environment_references",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_expires REAL,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS job_events_job ON job_events (job_id, id);
+"""
+
+
+class JobQueue:
+    """
+    A small durable job queue backed by SQLite.
+    Jobs move queued -> running -> done/failed. Running jobs hold a lease that
+    the worker renews while it works; expired leases are reclaimed.
+    """
+
+    def __init__(self, db_path: str = JOB_DB_PATH):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def enqueue(self, kind: str, params: dict) -> str:
+        if kind not in JOB_HANDLERS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, params, status, created_at) VALUES (?, ?, ?, 'queued', ?)",
+                (job_id, kind, dumps(params), time.time()),
+            )
+        return job_id
+
+    def get(self, job_id: str):
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["params"] = loads(job["params"])
+        job["result"] = loads(job["result"]) if job["result"] is not None else None
+        return job
+
+    def add_event(self, job_id: str, event: dict):
+        """Record a progress event; readers stream them in insertion order."""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO job_events (job_id, created_at, data) VALUES (?, ?, ?)",
+                (job_id, time.time(), dumps(event)),
+            )
+
+    def events(self, job_id: str, after_id: int = 0):
+        """Progress events of a job newer than after_id, as (event_id, event) pairs."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, data FROM job_events WHERE job_id = ? AND id > ? ORDER BY id",
+                (job_id, after_id),
+            ).fetchall()
+        return [(row["id"], loads(row["data"])) for row in rows]
+
+    def claim(self, worker: str):
+        """Atomically take the oldest runnable job, or return None."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # Jobs that kept crashing their workers are not retried forever.
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Worker lost too many times', finished_at = ? "
+                "WHERE status = 'running' AND lease_expires < ? AND attempts >= ?",
+                (now, now, JOB_MAX_ATTEMPTS),
+            )
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' OR (status = 'running' AND lease_expires < ?) "
+                "ORDER BY created_at LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', worker = ?, lease_expires = ?, "
+                    "attempts = attempts + 1, started_at = ? WHERE id = ?",
+                    (worker, now + JOB_LEASE_SECONDS, now, row["id"]),
+                )
+            conn.execute("COMMIT")
+        if row is None:
+            return None
+        return self.get(row["id"])
+
+    def renew(self, job_id: str, worker: str):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                (time.time() + JOB_LEASE_SECONDS, job_id, worker),
+            )
+
+    def complete(self, job_id: str, worker: str, result):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, error = NULL, finished_at = ? "
+                "WHERE id = ? AND worker = ?",
+                (dumps(result), time.time(), job_id, worker),
+            )
+
+    def fail(self, job_id: str, worker: str, error: str):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ? AND worker = ?",
+                (error, time.time(), job_id, worker),
+            )
+
+    def recover_orphans(self):
+        """
+        Requeue running jobs whose worker process on this host no longer exists,
+        so a restart picks them up immediately instead of waiting for the lease.
+        """
+        if os.name != "posix":
+            return 0
+        host = socket.gethostname()
+        recovered = 0
+        with self._connect() as conn:
+            rows = conn.execute("SELECT id, worker FROM jobs WHERE status = 'running'").fetchall()
+            for row in rows:
+                worker_host, _, pid = (row["worker"] or "").rpartition(":")
+                if worker_host != host or not pid.isdigit() or _pid_alive(int(pid)):
+                    continue
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', worker = NULL, lease_expires = NULL "
+                    "WHERE id = ? AND worker = ?",
+                    (row["id"], row["worker"]),
+                )
+                recovered += 1
+        return recovered
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _resolve_handler(kind: str):
+    module_name, func_name = JOB_HANDLERS[kind].split(":")
+    module = importlib.import_module(module_name, package=__package__)
+    return getattr(module, func_name)
+
+
+def run_job(queue: JobQueue, job: dict, worker: str):
+    """Execute a claimed job, renewing its lease until the handler returns."""
+    stop = threading.Event()
+
+    def heartbeat():
+        while not stop.wait(JOB_LEASE_SECONDS / 3):
+            queue.renew(job["id"], worker)
+
+    beat = threading.Thread(target=heartbeat, daemon=True)
+    beat.start()
+    try:
+        logger.info("Running job", extra={"worker": worker, "job_id": job["id"], "kind": job["kind"], "attempt": job["attempts"]})
+        queue.add_event(job["id"], {"stage": "started", "attempt": job["attempts"]})
+        # Handlers report their stages (prompts built, images saved, ...) through on_event
+        result = _resolve_handler(job["kind"])(
+            **job["params"], on_event=lambda event: queue.add_event(job["id"], event),
+        )
+        queue.complete(job["id"], worker, result)
+        queue.add_event(job["id"], {"stage": "done"})
+        logger.info("Finished job", extra={"worker": worker, "job_id": job["id"]})
+    except Exception as e:
+        logger.exception("Job failed", extra={"worker": worker, "job_id": job["id"]})
+        queue.fail(job["id"], worker, str(e))
+        queue.add_event(job["id"], {"stage": "failed", "error": str(e)})
+    finally:
+        stop.set()
+        beat.join()
+
+
+def worker_loop(db_path: str = JOB_DB_PATH, stop_event=None):
+    """Drain the queue until stop_event is set. Entry point for worker processes."""
+    queue = JobQueue(db_path)
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    # Spawned processes start without the parent's logging setup
+    configure_logging()
+    logger.info("Job worker started", extra={"worker": worker})
+    if WARM_UP_MODELS:
+        warm_up(("imagen",))
+    while stop_event is None or not stop_event.is_set():
+        job = queue.claim(worker)
+        if job is None:
+            if stop_event is not None:
+                stop_event.wait(JOB_POLL_INTERVAL)
+            else:
+                time.sleep(JOB_POLL_INTERVAL)
+            continue
+        run_job(queue, job, worker)
+    logger.info("Job worker stopped", extra={"worker": worker})
+
+
+class WorkerPool:
+    """A pool of worker processes draining the job queue."""
+
+    def __init__(self, num_workers: int = JOB_WORKERS, db_path: str = JOB_DB_PATH):
+        self.num_workers = num_workers
+        self.db_path = db_path
+        # spawn keeps workers independent of the server's event loop and threads
+        self._ctx = multiprocessing.get_context("spawn")
+        self._stop = self._ctx.Event()
+        self._processes = []
+
+    def start(self):
+        recovered = JobQueue(self.db_path).recover_orphans()
+        if recovered:
+            logger.warning("Requeued jobs left running by a previous process", extra={"jobs": recovered})
+        for _ in range(self.num_workers):
+            # Not daemonic: workers start their own process pools (thumbnails)
+            p = self._ctx.Process(target=worker_loop, args=(self.db_path, self._stop))
+            p.start()
+            self._processes.append(p)
+
+    def join(self):
+        for p in self._processes:
+            p.join()
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        deadline = time.time() + timeout
+        for p in self._processes:
+            p.join(max(0.0, deadline - time.time()))
+            if p.is_alive():
+                # The job it was running keeps its lease and is reclaimed after expiry.
+                p.terminate()
+        self._processes = []
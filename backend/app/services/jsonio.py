@@ -0,0 +1,60 @@
+import json
+import functools
+
+import orjson
+
+# Subclasses json.JSONDecodeError, so existing handlers keep catching it
+JSONDecodeError = orjson.JSONDecodeError
+
+SHEET_SCHEMAS = {"characters": "CharacterSheet", "environments": "EnvironmentSheet"}
+
+
+def loads(data):
+    """Parse JSON from str or bytes."""
+    return orjson.loads(data)
+
+
+def dumps(obj) -> str:
+    """Compact JSON, for job rows, events and stream lines."""
+    return orjson.dumps(obj).decode("utf-8")
+
+
+def dumps_bytes(obj) -> bytes:
+    return orjson.dumps(obj)
+
+
+def dump_sheet(data: dict) -> str:
+    """
+    Sheets are hand-edited and reviewed as diffs, so they keep their 4-space
+    indent; orjson can only indent by 2.
+    """
+    return json.dumps(data, indent=4)
+
+
+@functools.lru_cache(maxsize=None)
+def sheet_adapter(category: str):
+    """
+    Validator for a category's sheets, built once per process; building one costs
+    far more than a validation. Pydantic loads on first use, keeping it out of the
+    parser's and the CLIs' import time.
+    """
+    if category not in SHEET_SCHEMAS:
+        return None
+    from pydantic import TypeAdapter
+    from ..models import schemas
+    return TypeAdapter(getattr(schemas, SHEET_SCHEMAS[category]))
+
+
+def validate_sheet(category: str, content) -> dict:
+    """
+    Parse a sheet and check it against its category's schema, if it has one.
+    Raises JSONDecodeError, ValueError (not an object) or pydantic.ValidationError.
+    Returns the parsed sheet.
+    """
+    data = loads(content)
+    if not isinstance(data, dict):
+        raise ValueError("A sheet must be a JSON object")
+    adapter = sheet_adapter(category)
+    if adapter is not None:
+        adapter.validate_python(data)
+    return data
@@ -1,14 +1,22 @@
 import os
+import re
+import copy
 import json
-import vertexai
-from vertexai.generative_models import GenerativeModel, Part, GenerationConfig
-from dotenv import load_dotenv
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
-load_dotenv()
+from pydantic import ValidationError
 
-PROJECT_ID = os.getenv("GCP_PROJECT_ID", "move-37")
-LOCATION = os.getenv("GCP_LOCATION", "us-central1")
-vertexai.init(project=PROJECT_ID, location=LOCATION)
+from .quota import get_governor, GEMINI_MAX_WORKERS
+from .model_registry import get_gemini_model, GEMINI_MODEL_ID, GENERATION_BACKEND
+from .metrics import LLM_CACHE_REQUESTS
+from ..models.schemas import CharacterSheet
+
+logger = logging.getLogger(__name__)
 
 SYSTEM_PROMPT = """
 You are an expert character designer for animation and film. 
@@ -41,23 +49,154 @@ The output must be a valid JSON object matching this schema:
 Be descriptive and creative. If the user prompt is brief, expand on it to make a high-quality character sheet.
 Do not include any text other than the JSON object.
 """
+# Changes whenever the system prompt is edited, so cached sheets from an older prompt are never served
+SYSTEM_PROMPT_VERSION = hashlib.sha256(SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:12]
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1").lower() not in ("0", "false", "no")
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512"))
+# Upper bound on prompts per batch request
+LLM_BATCH_MAX_PROMPTS = int(os.getenv("LLM_BATCH_MAX_PROMPTS", "100"))
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Case and whitespace differences don't change the sheet Gemini is asked for."""
+    return re.sub(r"\s+", " ", prompt).strip().casefold()
+
+
+def prompt_key(prompt: str) -> str:
+    model = GEMINI_MODEL_ID if GENERATION_BACKEND == "vertex" else f"{GENERATION_BACKEND}:{GEMINI_MODEL_ID}"
+    return hashlib.sha256(
+        json.dumps([normalize_prompt(prompt), SYSTEM_PROMPT_VERSION, model]).encode("utf-8")
+    ).hexdigest()
+
+
+class ResponseCache:
+    """In-process LRU of parsed Gemini responses with a TTL."""
+
+    def __init__(self, max_entries: int = LLM_CACHE_MAX_ENTRIES, ttl: float = LLM_CACHE_TTL, enabled: bool = LLM_CACHE_ENABLED):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = enabled and max_entries > 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                LLM_CACHE_REQUESTS.labels("miss").inc()
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        LLM_CACHE_REQUESTS.labels("hit").inc()
+        # Callers get their own copy to edit
+        return copy.deepcopy(entry[1])
+
+    def put(self, key: str, value: dict):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), copy.deepcopy(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        if not self.enabled:
+            return {"enabled": False}
+        with self._lock:
+            entries = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            "enabled": True,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
 
-def generate_character_json(prompt: str):
-    model = GenerativeModel("gemini-1.5-flash")
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+def get_response_cache() -> ResponseCache:
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache()
+        return _response_cache
+
+
+def generate_character_json(prompt: str, use_cache: bool = True):
+    cache = get_response_cache()
+    key = prompt_key(prompt)
+    if use_cache:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    model = get_gemini_model()
     
-    generation_config = GenerationConfig(
-        response_mime_type="application/json",
-    )
+    # A plain dict works for both the SDK and the fake backend, and needs no vertexai import
+    generation_config = {
+        "response_mime_type": "application/json",
+    }
     
-    response = model.generate_content(
+    response = get_governor("gemini").call(
+        model.generate_content,
         [SYSTEM_PROMPT, prompt],
         generation_config=generation_config
     )
     
     try:
         # Gemini with response_mime_type="application/json" returns a clean json string
-        return json.loads(response.text)
+        result = json.loads(response.text)
     except Exception as e:
-        print(f"Error parsing Gemini response: {e}")
-        print(f"Raw response: {response.text}")
+        logger.error("Could not parse Gemini response", extra={"error": str(e), "raw_response": response.text})
         raise e
+    cache.put(key, result)
+    return result
+
+
+def _generate_validated(prompt: str, use_cache: bool) -> dict:
+    try:
+        sheet = generate_character_json(prompt, use_cache=use_cache)
+        CharacterSheet.model_validate(sheet)
+    except ValidationError as e:
+        return {"prompt": prompt, "status": "invalid", "errors": e.errors(include_url=False, include_context=False, include_input=False)}
+    except Exception as e:
+        return {"prompt": prompt, "status": "error", "error": str(e)}
+    return {"prompt": prompt, "status": "ok", "sheet": sheet}
+
+
+def generate_character_jsons(prompts: list, use_cache: bool = True, max_workers: int = GEMINI_MAX_WORKERS) -> list:
+    """
+    Generate a sheet per prompt concurrently, paced by the shared Gemini governor.
+    Returns one {prompt, status, sheet | errors | error} result per prompt, in order;
+    a failed or invalid sheet does not fail the rest.
+    """
+    # Prompts that normalize to the same text are sent once
+    unique = {}
+    for prompt in prompts:
+        unique.setdefault(prompt_key(prompt), prompt)
+    if not unique:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(unique)))) as executor:
+        futures = {key: executor.submit(_generate_validated, prompt, use_cache) for key, prompt in unique.items()}
+        by_key = {key: future.result() for key, future in futures.items()}
+    results = []
+    for prompt in prompts:
+        result = copy.deepcopy(by_key[prompt_key(prompt)])
+        result["prompt"] = prompt
+        results.append(result)
+    return results
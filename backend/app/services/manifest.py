@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import contextlib
+
+from ..config import STATE_DIR
+from .parser import REFERENCE_PROMPT_VERSION
+
+REFERENCE_MANIFEST_PATH = os.getenv("REFERENCE_MANIFEST_PATH", os.path.join(STATE_DIR, "reference_manifest.sqlite3"))
+
+# What each generated image depends on, in the order reasons are reported
+INPUTS = ("sheet", "style", "template", "prompt", "render")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    root TEXT NOT NULL,
+    key TEXT NOT NULL,
+    inputs TEXT NOT NULL,
+    rendered REAL NOT NULL,
+    PRIMARY KEY (root, key)
+);
+"""
+
+
+def digest(value) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def pick(sheet: dict, fields) -> dict:
+    """The given (dotted) fields of a sheet, missing ones as None."""
+    picked = {}
+    for field in fields:
+        value = sheet
+        for part in field.split("."):
+            value = value.get(part) if isinstance(value, dict) else None
+        picked[field] = value
+    return picked
+
+
+def reference_inputs(sheet: dict, sheet_fields, style_sheet: dict, style_fields, prompt: str,
+                     negative_prompt: str, render_params: dict) -> dict:
+    """Digest of each input of one reference image, as recorded in the manifest."""
+    return {
+        "sheet": digest(pick(sheet, sheet_fields)),
+        "style": digest(pick(style_sheet or {}, style_fields)),
+        "template": REFERENCE_PROMPT_VERSION,
+        # Catches prompt changes the fields above don't explain
+        "prompt": digest([prompt, negative_prompt]),
+        # Model, image parameters, output format and variant
+        "render": digest(render_params),
+    }
+
+
+def stale_reasons(recorded: dict, current: dict) -> list:
+    """The inputs that changed since an image was rendered; empty when it is up to date."""
+    return [name for name in INPUTS if recorded.get(name) != current.get(name)]
+
+
+class ReferenceManifest:
+    """
+    The inputs every reference image was rendered from, keyed by data directory
+    and asset key. An image whose current inputs differ is stale. Images rendered
+    before the manifest existed are untracked until adopted, never stale.
+    """
+
+    def __init__(self, db_path: str = REFERENCE_MANIFEST_PATH):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def get(self, root: str, key: str):
+        """Recorded inputs of an image, or None if it is untracked."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT inputs FROM images WHERE root = ? AND key = ?", (os.path.abspath(root), key)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def record(self, root: str, key: str, inputs: dict):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO images (root, key, inputs, rendered) VALUES (?, ?, ?, ?)",
+                (os.path.abspath(root), key, json.dumps(inputs, sort_keys=True), time.time()),
+            )
+
+    def is_fresh(self, storage, root: str, key: str, inputs: dict) -> bool:
+        """Whether the image exists and is not stale (untracked images count as fresh)."""
+        if not storage.exists(key):
+            return False
+        recorded = self.get(root, key)
+        return recorded is None or not stale_reasons(recorded, inputs)
+
+
+_manifest = None
+_manifest_lock = threading.Lock()
+
+def get_manifest() -> ReferenceManifest:
+    global _manifest
+    with _manifest_lock:
+        if _manifest is None:
+            _manifest = ReferenceManifest()
+        return _manifest
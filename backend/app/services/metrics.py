@@ -0,0 +1,82 @@
+import os
+import re
+import time
+import contextlib
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+# Set by configure_metrics() at startup; prometheus_client read it on import, so
+# without it (e.g. the services used as a library) metrics stay in this process.
+MULTIPROCESS = "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+REQUEST_LATENCY = Histogram(
+    "move37_http_request_duration_seconds", "HTTP request latency by route.",
+    ["method", "route", "status"],
+)
+STAGE_SECONDS = Histogram(
+    "move37_generation_stage_seconds",
+    "Time per reference generation stage (prompt_build, model_call, image_save, json_write).",
+    ["kind", "stage"], buckets=STAGE_BUCKETS,
+)
+IMAGES = Counter(
+    "move37_images_total", "Reference images produced, by source (generated or cache).",
+    ["kind", "source"],
+)
+IMAGE_BYTES = Counter("move37_image_bytes_written_total", "Bytes of reference images written.", ["kind"])
+RENDER_CACHE_REQUESTS = Counter("move37_render_cache_requests_total", "Render cache lookups.", ["result"])
+LLM_CACHE_REQUESTS = Counter("move37_llm_cache_requests_total", "Gemini response cache lookups.", ["result"])
+QUOTA_WAIT = Histogram(
+    "move37_quota_wait_seconds", "Time spent waiting on the quota governor (pacing or 429 backoff).",
+    ["quota", "reason"], buckets=STAGE_BUCKETS,
+)
+QUOTA_THROTTLED = Counter("move37_quota_throttled_total", "Calls answered with 429 / RESOURCE_EXHAUSTED.", ["quota"])
+
+
+@contextlib.contextmanager
+def stage_timer(kind: str, stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(kind, stage).observe(time.perf_counter() - start)
+
+
+def timed(kind: str, stage: str, fn):
+    """fn wrapped so every call (each retry included) is observed as a stage."""
+    def wrapper(*args, **kwargs):
+        with stage_timer(kind, stage):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def latest():
+    """(body, content type) of the aggregated metrics of every process."""
+    if not MULTIPROCESS:
+        return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def remove_dead_process_files():
+    """
+    Drop metric files left by processes that no longer exist, so the directory doesn't
+    grow with every worker restart. Their counters reset, which Prometheus rate() tolerates.
+    """
+    if os.name != "posix" or not MULTIPROCESS:
+        return
+    directory = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    for name in os.listdir(directory):
+        match = re.search(r"_(\d+)\.db$", name)
+        if not match:
+            continue
+        try:
+            os.kill(int(match.group(1)), 0)
+        except ProcessLookupError:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(directory, name))
+        except PermissionError:
+            pass
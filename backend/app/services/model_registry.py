@@ -0,0 +1,94 @@
+import os
+import time
+import logging
+import threading
+
+from .. import config  # noqa: F401  (loads .env before the settings below are read)
+
+logger = logging.getLogger(__name__)
+
+# Model IDs are configurable so a model upgrade does not need a code change.
+IMAGEN_MODEL_ID = os.getenv("IMAGEN_MODEL_ID", "imagen-3.0-generate-002")
+GEMINI_MODEL_ID = os.getenv("GEMINI_MODEL_ID", "gemini-1.5-flash")
+# Images Imagen returns per request (1-4 for Imagen 3); larger variant counts are split into several calls.
+IMAGEN_MAX_IMAGES_PER_CALL = int(os.getenv("IMAGEN_MAX_IMAGES_PER_CALL", "4"))
+# "vertex" calls Google; "fake" uses the offline stand-ins in fake_backend.py.
+GENERATION_BACKEND = os.getenv("GENERATION_BACKEND", "vertex").lower()
+if GENERATION_BACKEND not in ("vertex", "fake"):
+    raise ValueError(f"Unknown GENERATION_BACKEND: {GENERATION_BACKEND}")
+# Render cache identity of the image model, so fake renders never satisfy real requests
+IMAGEN_RENDER_ID = IMAGEN_MODEL_ID if GENERATION_BACKEND == "vertex" else f"{GENERATION_BACKEND}:{IMAGEN_MODEL_ID}"
+# Build clients at startup (API and job workers) so the first request doesn't pay for it.
+WARM_UP_MODELS = os.getenv("WARM_UP_MODELS", "0").lower() in ("1", "true", "yes")
+
+_clients = {}
+_lock = threading.RLock()
+_initialized = False
+
+def init_vertex():
+    """Initialize the Vertex SDK once per process."""
+    global _initialized
+    if _initialized:
+        return
+    with _lock:
+        if not _initialized:
+            import vertexai
+            vertexai.init(
+                project=os.getenv("GCP_PROJECT_ID", "move-37"),
+                location=os.getenv("GCP_LOCATION", "us-central1"),
+            )
+            _initialized = True
+
+def _get_or_create(key, factory):
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                if GENERATION_BACKEND == "vertex":
+                    init_vertex()
+                client = factory()
+                _clients[key] = client
+    return client
+
+def get_imagen_model(model_id: str = None):
+    """Process-wide ImageGenerationModel; from_pretrained runs once per model ID."""
+    model_id = model_id or IMAGEN_MODEL_ID
+
+    def factory():
+        if GENERATION_BACKEND == "fake":
+            from .fake_backend import FakeImageGenerationModel
+            return FakeImageGenerationModel(model_id)
+        from vertexai.preview.vision_models import ImageGenerationModel
+        return ImageGenerationModel.from_pretrained(model_id)
+
+    return _get_or_create(("imagen", model_id), factory)
+
+def get_gemini_model(model_id: str = None):
+    """Process-wide GenerativeModel, reused so its gRPC channel stays open."""
+    model_id = model_id or GEMINI_MODEL_ID
+
+    def factory():
+        if GENERATION_BACKEND == "fake":
+            from .fake_backend import FakeGenerativeModel
+            return FakeGenerativeModel(model_id)
+        from vertexai.generative_models import GenerativeModel
+        return GenerativeModel(model_id)
+
+    return _get_or_create(("gemini", model_id), factory)
+
+def warm_up(kinds=("imagen", "gemini")):
+    """
+    Create the clients ahead of the first request.
+    Failures are reported but never fatal; the client is simply built on first use instead.
+    """
+    getters = {"imagen": get_imagen_model, "gemini": get_gemini_model}
+    for kind in kinds:
+        start = time.perf_counter()
+        try:
+            model = getters[kind]()
+            # GenerativeModel opens its prediction client lazily; open it now
+            getattr(model, "_prediction_client", None)
+            logger.info("Warmed up model", extra={"model": kind, "seconds": round(time.perf_counter() - start, 2)})
+        except Exception as e:
+            logger.warning("Could not warm up model", extra={"model": kind, "error": str(e)})
@@ -1,8 +1,14 @@
-import json
-import os
+import logging
+
+from .catalog import get_catalog
+
+logger = logging.getLogger(__name__)
 
 def load_json_data(directory, file_id):
-    """Helper to load JSON data from a specific data directory."""
+    """
+    Helper to load JSON data from a specific data directory.
+    Served from the in-memory catalog; the returned dict is shared, do not mutate it.
+    """
     if not file_id:
         return {}
     
@@ -10,26 +16,20 @@ def load_json_data(directory, file_id):
     if file_id.endswith(".json"):
         file_id = file_id[:-5]
         
-    path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..", "data", directory, f"{file_id}.json"))
-    if os.path.exists(path):
-        with open(path, "r") as f:
-            return json.load(f)
-    print(f"WARNING: File {file_id}.json not found at {path}")
+    catalog = get_catalog()
+    data = catalog.get(directory, file_id)
+    if data is not None:
+        return data
+    logger.warning("Sheet not found", extra={"path": catalog.path(directory, f"{file_id}.json")})
     return {}
 
-def parse_scene(scene_data: dict):
-    """
-    Implements the 5-part formula for optimal control:
-    [Cinematography] + [Subject] + [Action] + [Context] + [Style & Ambiance]
-    """
-    # 1. Cinematography
-    shot_type = scene_data.get('cinematography', 'medium_shot')
+def cinematography_text(shot_type: str):
+    """[Cinematography] part of the formula."""
     cinematography_data = load_json_data("cinematography", "default")
-    cinematography = cinematography_data.get(shot_type, shot_type.replace("_", " ").capitalize())
+    return cinematography_data.get(shot_type, shot_type.replace("_", " ").capitalize())
 
-    # 2. Subject (Character)
-    character_id = scene_data.get('character_id')
-    character_data = load_json_data("characters", character_id)
+def subject_text(character_id: str, character_data: dict):
+    """[Subject] part of the formula."""
     subject_name = character_data.get('name', character_id or 'Unknown Character')
     traits = character_data.get('physical_traits', {})
     hair = traits.get('hair', '')
@@ -39,22 +39,19 @@ def parse_scene(scene_data: dict):
     if hair or eyes or clothing:
         details = ", ".join(filter(None, [hair, eyes, clothing, character_data.get('extra_details', '')]))
         subject += f" ({details})"
+    return subject
 
-    # 3. Action
-    action = scene_data.get('action', 'standing still')
-
-    # 4. Context (Environment)
-    env_id = scene_data.get('environment_id')
-    env_data = load_json_data("environments", env_id)
+def context_text(env_data: dict):
+    """[Context] part of the formula."""
     location = env_data.get('location', 'unspecified location')
     weather = env_data.get('weather', '')
     context = f"in {location}"
     if weather:
         context += f" during {weather}"
+    return context
 
-    # 5. Style & Ambiance
-    style_id = scene_data.get('style_id') or character_data.get('style_id')
-    style_data = load_json_data("styles", style_id)
+def ambiance_text(style_data: dict):
+    """[Style & Ambiance] part of the formula."""
     art_style = style_data.get('art_style', 'Cinematic')
     lighting = style_data.get('lighting', '')
     camera = style_data.get('camera_language', {})
@@ -65,6 +62,32 @@ def parse_scene(scene_data: dict):
         ambiance += f", {lighting} lighting"
     if lens:
         ambiance += f", shot on {lens}"
+    return ambiance
+
+def parse_scene(scene_data: dict):
+    """
+    Implements the 5-part formula for optimal control:
+    [Cinematography] + [Subject] + [Action] + [Context] + [Style & Ambiance]
+    """
+    # 1. Cinematography
+    shot_type = scene_data.get('cinematography', 'medium_shot')
+    cinematography = cinematography_text(shot_type)
+
+    # 2. Subject (Character)
+    character_id = scene_data.get('character_id')
+    character_data = load_json_data("characters", character_id)
+    subject = subject_text(character_id, character_data)
+
+    # 3. Action
+    action = scene_data.get('action', 'standing still')
+
+    # 4. Context (Environment)
+    env_id = scene_data.get('environment_id')
+    context = context_text(load_json_data("environments", env_id))
+
+    # 5. Style & Ambiance
+    style_id = scene_data.get('style_id') or character_data.get('style_id')
+    ambiance = ambiance_text(load_json_data("styles", style_id))
 
     # Construct final prompt
     prompt = f"{cinematography}, {subject}, {action}, {context}. {ambiance}."
@@ -73,11 +96,9 @@ def parse_scene(scene_data: dict):
 def create_prompt_from_sheet(sheet_json: dict):
     """Main entry point for prompt generation. Supports scene and legacy formats."""
     if 'scenes' in sheet_json:
-        # Sequence format
-        prompts = []
-        for scene in sheet_json['scenes']:
-            prompts.append(parse_scene(scene))
-        return "\n\n".join(prompts)
+        # Sequence format, compiled scene by scene with shared templates
+        from .compiler import iter_sequence
+        return "\n\n".join(prompt for _, prompt, _ in iter_sequence(sheet_json['scenes']))
     
     # Legacy character sheet format (wrapped to use parse_scene logic)
     # We try to extract character_id if it's there, otherwise we use the name
@@ -89,6 +110,13 @@ def create_prompt_from_sheet(sheet_json: dict):
         "style_id": sheet_json.get('style_id')
     }
     return parse_scene(scene_mock)
+# Inputs of the reference prompts below, tracked by the reference manifest: editing
+# any of them makes the affected images stale. Bump the version when a template changes.
+REFERENCE_PROMPT_VERSION = "1"
+CHARACTER_PROMPT_FIELDS = ("name", "physical_traits.hair", "physical_traits.eyes", "clothing", "negative_prompt")
+ENVIRONMENT_PROMPT_FIELDS = ("location", "lighting", "weather", "mood", "negative_prompt")
+STYLE_PROMPT_FIELDS = ("art_style",)
+
 def create_character_reference_prompts(character_data: dict, style_id: str = None):
     """
     Generates 3 specialized prompts for Veo character references:
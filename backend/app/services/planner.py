@@ -0,0 +1,305 @@
+import os
+import math
+
+from ..config import DATA_DIR
+from .catalog import get_catalog
+from .storage import get_storage
+from .parser import (
+    create_character_reference_prompts, create_environment_reference_prompts,
+    CHARACTER_PROMPT_FIELDS, ENVIRONMENT_PROMPT_FIELDS, STYLE_PROMPT_FIELDS,
+)
+from .render_cache import get_render_cache, render_key, REFERENCE_IMAGE_PARAMS
+from .manifest import get_manifest, reference_inputs, stale_reasons
+from .image_output import output_format
+from .model_registry import IMAGEN_RENDER_ID, IMAGEN_MAX_IMAGES_PER_CALL
+from .quota import get_governor, IMAGEN_MAX_WORKERS
+from .batch import iter_batch, BATCH_MAX_WORKERS, CHARACTER_REFERENCE_TYPES, ENVIRONMENT_REFERENCE_TYPES
+
+# Typical duration of one Imagen call, for the dry-run wall-clock estimate
+PLAN_CALL_SECONDS = float(os.getenv("PLAN_CALL_SECONDS", "8"))
+
+
+def resolve_sequence(sequence: dict, data_dir: str = DATA_DIR):
+    """
+    The (character, style) pairs and environments a sequence's scenes use, in first-use order,
+    and per scene the task IDs it depends on. A scene without a style_id uses its
+    character's. Raises ValueError listing every unknown ID.
+    """
+    catalog = get_catalog(data_dir)
+    characters, environments, scenes = {}, {}, []
+    unknown = {"characters": set(), "environments": set(), "styles": set()}
+    for index, scene in enumerate(sequence.get("scenes", [])):
+        scene_id = scene.get("scene_id") or f"{index + 1:03d}"
+        needs = []
+        character_id = scene.get("character_id")
+        if character_id:
+            character = catalog.get("characters", character_id)
+            if character is None:
+                unknown["characters"].add(character_id)
+            else:
+                style_id = scene.get("style_id") or character.get("style_id")
+                if not style_id or catalog.get("styles", style_id) is None:
+                    unknown["styles"].add(style_id or f"(none for {character_id})")
+                else:
+                    task_id = f"character:{character_id}:{style_id}"
+                    characters.setdefault(task_id, (character_id, style_id))
+                    needs.append(task_id)
+        environment_id = scene.get("environment_id")
+        if environment_id:
+            if catalog.get("environments", environment_id) is None:
+                unknown["environments"].add(environment_id)
+            else:
+                task_id = f"environment:{environment_id}"
+                environments.setdefault(task_id, environment_id)
+                needs.append(task_id)
+        scenes.append({"scene_id": scene_id, "needs": needs})
+
+    problems = [f"{category}: {', '.join(sorted(ids))}" for category, ids in unknown.items() if ids]
+    if problems:
+        raise ValueError(f"Unknown {'; '.join(problems)}")
+    return characters, environments, scenes
+
+
+def _style_refs(sheet: dict, style_id: str) -> dict:
+    refs = sheet.get("reference_images")
+    if not isinstance(refs, dict):
+        return {}
+    # Legacy sheets keep one unstyled set, which belongs to the sheet's own style
+    if next(iter(refs), None) in ("front", "side", "back", "head", "full_body"):
+        return refs if style_id == sheet.get("style_id", "legacy") else {}
+    return refs.get(style_id) if isinstance(refs.get(style_id), dict) else {}
+
+
+class ReferenceSet:
+    """
+    One sheet's references (in one style, for characters): the prompts and settings
+    they render from, as the reference generators compute them, and the images the
+    sheet records.
+    """
+
+    def __init__(self, catalog, kind: str, sheet_id: str, style_id: str = None):
+        self.kind = kind
+        self.id = sheet_id
+        self.style_id = style_id
+        self.category = f"{kind}s"
+        self.root = catalog.root
+        self.sheet = catalog.get(self.category, sheet_id)
+        self.negative_prompt = self.sheet.get("negative_prompt")
+        if kind == "character":
+            self.style_sheet = catalog.get("styles", style_id)
+            self.fields = CHARACTER_PROMPT_FIELDS
+            self.prompts = create_character_reference_prompts(self.sheet, style_id=style_id)
+            self.fmt = output_format(self.style_sheet)
+            self.folder = f"{sheet_id}_refs/{style_id}"
+            self.recorded = _style_refs(self.sheet, style_id)
+            self.types = CHARACTER_REFERENCE_TYPES
+        else:
+            sheet_style = self.sheet.get("style_id")
+            self.style_sheet = catalog.get("styles", sheet_style) if sheet_style else None
+            self.fields = ENVIRONMENT_PROMPT_FIELDS
+            self.prompts = create_environment_reference_prompts(self.sheet)
+            self.fmt = output_format(self.sheet)
+            self.folder = f"{sheet_id}_refs"
+            recorded = self.sheet.get("reference_images")
+            self.recorded = recorded if isinstance(recorded, dict) else {}
+            self.types = ENVIRONMENT_REFERENCE_TYPES
+
+    def inputs(self, ref_type: str, variant: int = 0) -> dict:
+        return reference_inputs(
+            self.sheet, self.fields, self.style_sheet, STYLE_PROMPT_FIELDS, self.prompts[ref_type], self.negative_prompt,
+            {"model": IMAGEN_RENDER_ID, "format": self.fmt.cache_id, "variant": variant, **REFERENCE_IMAGE_PARAMS},
+        )
+
+    def render_key(self, ref_type: str, variant: int = 0) -> str:
+        return render_key(self.prompts[ref_type], self.negative_prompt, IMAGEN_RENDER_ID, variant_index=variant,
+                          output_format=self.fmt.cache_id, **REFERENCE_IMAGE_PARAMS)
+
+    def images(self, ref_type: str):
+        """(asset key, variant) of an angle's images: those the sheet records, else the one a render would write."""
+        paths = self.recorded.get(ref_type)
+        paths = [paths] if isinstance(paths, str) else paths
+        if not isinstance(paths, list) or not paths:
+            return [(f"{self.category}/{self.folder}/{ref_type}.{self.fmt.ext}", 0)]
+        return [(f"{self.category}/{path}", variant) for variant, path in enumerate(paths)]
+
+    def status(self, storage, manifest, ref_type: str, key: str, variant: int = 0):
+        """("fresh", "untracked", "stale" or "missing", [changed inputs]) of one image."""
+        if not storage.exists(key):
+            return "missing", []
+        recorded = manifest.get(self.root, key)
+        if recorded is None:
+            return "untracked", []
+        reasons = stale_reasons(recorded, self.inputs(ref_type, variant))
+        return ("stale", reasons) if reasons else ("fresh", [])
+
+
+def _plan_references(refs: ReferenceSet, storage, manifest, cache, force: bool, use_cache: bool, recorded_only: bool = False):
+    """
+    (angles to render, variants per angle, model calls, cache hits, files already on disk) for one sheet.
+    Each angle keeps the variant count the sheet records for it (1 if it has none yet), as the generators do.
+    An angle needs rendering if the sheet doesn't record it (unless recorded_only) or any of its images is missing or stale.
+    """
+    todo, variants, calls, cached, existing = [], {}, 0, 0, 0
+    for ref_type in refs.types:
+        if recorded_only and ref_type not in refs.recorded:
+            continue
+        images = refs.images(ref_type)
+        statuses = [refs.status(storage, manifest, ref_type, key, variant)[0] for key, variant in images]
+        up_to_date = [status in ("fresh", "untracked") for status in statuses]
+        if not force and ref_type in refs.recorded and all(up_to_date):
+            continue
+        todo.append(ref_type)
+        variants[ref_type] = len(images)
+        # Same checks, in the same order, as the reference generators
+        uncached = 0
+        for (key, variant), current in zip(images, up_to_date):
+            if not force and current:
+                existing += 1
+            elif use_cache and cache.contains(refs.render_key(ref_type, variant)):
+                cached += 1
+            else:
+                uncached += 1
+        calls += math.ceil(uncached / IMAGEN_MAX_IMAGES_PER_CALL)
+    return todo, variants, calls, cached, existing
+
+
+def _task_id(refs: ReferenceSet) -> str:
+    return f"character:{refs.id}:{refs.style_id}" if refs.kind == "character" else f"environment:{refs.id}"
+
+
+def _plan_tasks(sets, storage, manifest, cache, force: bool, use_cache: bool, recorded_only: bool = False):
+    """One task per reference set with angles to render, and the IDs of the sets that are complete."""
+    tasks, complete = [], []
+    for refs in sets:
+        todo, variants, calls, cached, existing = _plan_references(refs, storage, manifest, cache, force, use_cache, recorded_only)
+        if not todo:
+            complete.append(_task_id(refs))
+            continue
+        tasks.append({"task_id": _task_id(refs), "kind": refs.kind, "id": refs.id, "style_id": refs.style_id,
+                      "types": todo, "variants": variants, "model_calls": calls, "cache_hits": cached, "existing": existing})
+    return tasks, complete
+
+
+def estimate_seconds(calls: int, parallelism: int) -> float:
+    """Wall-clock estimate for 'calls' Imagen calls at the governor's current rate."""
+    if not calls:
+        return 0.0
+    governor = get_governor("imagen")
+    # Calls beyond the burst are paced at the current (AIMD-adjusted) rate
+    pacing = max(0.0, calls - governor.capacity) * 60 / governor.rate
+    waves = math.ceil(calls / max(1, parallelism)) * PLAN_CALL_SECONDS
+    return round(max(pacing + PLAN_CALL_SECONDS, waves), 1)
+
+
+def plan_sequence(sequence: dict, data_dir: str = DATA_DIR, force: bool = False, use_cache: bool = True) -> dict:
+    """
+    Dry run for rendering a sequence's references: which sheets and angles are missing
+    or stale (diffed against each sheet's reference_images, the stored files and the
+    reference manifest), deduplicated
+    into one task per character and style and one per environment, with the model
+    calls and wall-clock time they would take. 'tasks' can be passed to run_plan.
+    """
+    catalog = get_catalog(data_dir)
+    storage = get_storage(data_dir)
+    characters, environments, scenes = resolve_sequence(sequence, data_dir)
+
+    sets = [ReferenceSet(catalog, "character", character_id, style_id) for character_id, style_id in characters.values()]
+    sets += [ReferenceSet(catalog, "environment", environment_id) for environment_id in environments.values()]
+    tasks, complete = _plan_tasks(sets, storage, get_manifest(), get_render_cache(), force, use_cache)
+    pending = {task["task_id"] for task in tasks}
+    return {
+        "sequence_id": sequence.get("sequence_id"),
+        "scenes": [{**scene, "ready": not pending.intersection(scene["needs"])} for scene in scenes],
+        **_summary(tasks, complete),
+    }
+
+
+def _summary(tasks, complete) -> dict:
+    # Tasks run side by side, each rendering its angles side by side; the governor keeps it within quota
+    parallelism = min(BATCH_MAX_WORKERS, len(tasks)) * IMAGEN_MAX_WORKERS if tasks else 0
+    model_calls = sum(task["model_calls"] for task in tasks)
+    return {
+        "tasks": tasks,
+        "complete": complete,
+        "model_calls": model_calls,
+        "cache_hits": sum(task["cache_hits"] for task in tasks),
+        "quota_rpm": round(get_governor("imagen").rate, 2),
+        "parallelism": min(parallelism, model_calls) if model_calls else 0,
+        "estimated_seconds": estimate_seconds(model_calls, parallelism),
+    }
+
+
+def rendered_sets(data_dir: str = DATA_DIR):
+    """A ReferenceSet for every character style and environment whose sheet records references."""
+    catalog = get_catalog(data_dir)
+    sets = []
+    for character_id, sheet in catalog.index("characters").items():
+        refs = sheet.get("reference_images")
+        if not isinstance(refs, dict) or not refs:
+            continue
+        if next(iter(refs)) in ("front", "side", "back", "head", "full_body"):
+            style_ids = [sheet.get("style_id", "legacy")]
+        else:
+            style_ids = [style_id for style_id, style_refs in refs.items() if isinstance(style_refs, dict)]
+        # References of a style that no longer exists can't be re-rendered, so they aren't tracked
+        sets += [ReferenceSet(catalog, "character", character_id, style_id)
+                 for style_id in style_ids if catalog.get("styles", style_id) is not None]
+    for environment_id, sheet in catalog.index("environments").items():
+        if isinstance(sheet.get("reference_images"), dict) and sheet["reference_images"]:
+            sets.append(ReferenceSet(catalog, "environment", environment_id))
+    return sets
+
+
+def reference_status(data_dir: str = DATA_DIR):
+    """
+    Every recorded reference image in the data tree with its status: "fresh", "stale"
+    (with the inputs that changed: sheet, style, template, prompt, render), "missing"
+    or "untracked" (rendered before the manifest, or by hand).
+    """
+    storage = get_storage(data_dir)
+    manifest = get_manifest()
+    rows = []
+    for refs in rendered_sets(data_dir):
+        for ref_type in refs.types:
+            if ref_type not in refs.recorded:
+                continue
+            for key, variant in refs.images(ref_type):
+                status, reasons = refs.status(storage, manifest, ref_type, key, variant)
+                rows.append({"key": key, "kind": refs.kind, "id": refs.id, "style_id": refs.style_id,
+                             "type": ref_type, "status": status, "reasons": reasons})
+    return rows
+
+
+def plan_stale(data_dir: str = DATA_DIR, use_cache: bool = True) -> dict:
+    """Plan re-rendering exactly the stale or missing recorded references across the data tree; for run_plan."""
+    tasks, complete = _plan_tasks(rendered_sets(data_dir), get_storage(data_dir), get_manifest(), get_render_cache(),
+                                  force=False, use_cache=use_cache, recorded_only=True)
+    return _summary(tasks, complete)
+
+
+def adopt_untracked(data_dir: str = DATA_DIR) -> int:
+    """Record the current inputs of untracked images, accepting them as up to date. Returns how many."""
+    storage = get_storage(data_dir)
+    manifest = get_manifest()
+    adopted = 0
+    for refs in rendered_sets(data_dir):
+        for ref_type in refs.types:
+            if ref_type not in refs.recorded:
+                continue
+            for key, variant in refs.images(ref_type):
+                if refs.status(storage, manifest, ref_type, key, variant)[0] == "untracked":
+                    manifest.record(refs.root, key, refs.inputs(ref_type, variant))
+                    adopted += 1
+    return adopted
+
+
+def run_plan(plan: dict, data_dir: str = DATA_DIR, force: bool = False, use_cache: bool = True):
+    """
+    Render a plan's tasks, all of them at once up to BATCH_MAX_WORKERS, paced by the
+    shared quota governor. Yields the same events as batch.iter_batch.
+    """
+    # No num_images: every angle is rendered with the variant count it records, as planned
+    tasks = [{"kind": t["kind"], "id": t["id"], "style_id": t["style_id"], "types": t["types"]} for t in plan["tasks"]]
+    if not tasks:
+        return iter(())
+    return iter_batch(tasks, data_dir, force=force, use_cache=use_cache, max_workers=min(BATCH_MAX_WORKERS, len(tasks)))
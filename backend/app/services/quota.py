@@ -0,0 +1,190 @@
+import os
+import time
+import logging
+import random
+import sqlite3
+import threading
+import contextlib
+
+from ..config import STATE_DIR
+from .metrics import QUOTA_WAIT, QUOTA_THROTTLED
+
+logger = logging.getLogger(__name__)
+
+# Requests-per-minute ceilings. Set to the project's actual quota; the
+# governor adapts below these when Vertex answers with 429.
+IMAGEN_RPM = float(os.getenv("IMAGEN_RPM", "20"))
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", "60"))
+# How many requests may be sent back-to-back before pacing kicks in.
+IMAGEN_BURST = float(os.getenv("IMAGEN_BURST", "1"))
+GEMINI_BURST = float(os.getenv("GEMINI_BURST", "2"))
+# Upper bound on concurrent model calls per reference set.
+IMAGEN_MAX_WORKERS = int(os.getenv("IMAGEN_MAX_WORKERS", "4"))
+# Upper bound on concurrent Gemini calls per batch of prompts.
+GEMINI_MAX_WORKERS = int(os.getenv("GEMINI_MAX_WORKERS", "8"))
+
+# Shared by every uvicorn worker, job worker and CLI run on this machine.
+QUOTA_DB_PATH = os.getenv("QUOTA_DB_PATH", os.path.join(STATE_DIR, "quota.sqlite3"))
+QUOTA_MIN_RPM = float(os.getenv("QUOTA_MIN_RPM", "1"))
+# AIMD: add QUOTA_AIMD_INCREASE rpm per success, multiply by QUOTA_AIMD_DECREASE on 429.
+QUOTA_AIMD_INCREASE = float(os.getenv("QUOTA_AIMD_INCREASE", "1"))
+QUOTA_AIMD_DECREASE = float(os.getenv("QUOTA_AIMD_DECREASE", "0.5"))
+QUOTA_MAX_RETRIES = int(os.getenv("QUOTA_MAX_RETRIES", "5"))
+QUOTA_BACKOFF_BASE = float(os.getenv("QUOTA_BACKOFF_BASE", "2"))
+QUOTA_BACKOFF_CAP = float(os.getenv("QUOTA_BACKOFF_CAP", "60"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    name TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    rate REAL NOT NULL,
+    updated REAL NOT NULL
+);
+"""
+
+
+class QuotaExceededError(Exception):
+    """Raised when a call is still throttled after every retry."""
+
+    def __init__(self, message: str, retry_after: float = QUOTA_BACKOFF_CAP):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_quota_error(error: Exception) -> bool:
+    """True for Vertex 429 / RESOURCE_EXHAUSTED errors, without importing google.api_core."""
+    if isinstance(error, QuotaExceededError):
+        return True
+    if getattr(error, "code", None) == 429:
+        return True
+    message = str(error)
+    # Not a bare "429": it also turns up in prompts, ids and sizes quoted by unrelated errors
+    return "RESOURCE_EXHAUSTED" in message or "Quota exceeded" in message
+
+
+class QuotaGovernor:
+    """
+    A token bucket whose state lives in SQLite, so every process on the host
+    draws from the same budget. The refill rate follows AIMD: it creeps up
+    towards max_rpm on success and is cut multiplicatively on every 429.
+    """
+
+    def __init__(self, name: str, max_rpm: float, burst: float = 1, db_path: str = QUOTA_DB_PATH):
+        if max_rpm <= 0:
+            raise ValueError("max_rpm must be positive")
+        self.name = name
+        self.max_rpm = max_rpm
+        self.min_rpm = min(QUOTA_MIN_RPM, max_rpm)
+        self.capacity = max(1.0, burst)
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            conn.execute(
+                "INSERT OR IGNORE INTO buckets (name, tokens, rate, updated) VALUES (?, ?, ?, ?)",
+                (name, self.capacity, max_rpm, time.time()),
+            )
+            # A lowered ceiling in config takes effect immediately
+            conn.execute("UPDATE buckets SET rate = MIN(rate, ?) WHERE name = ?", (max_rpm, name))
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextlib.contextmanager
+    def _locked_state(self):
+        """Yield [tokens, rate] refilled to now under an exclusive lock; writes back on exit."""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                tokens, rate, updated = conn.execute(
+                    "SELECT tokens, rate, updated FROM buckets WHERE name = ?", (self.name,)
+                ).fetchone()
+                now = time.time()
+                state = [min(self.capacity, tokens + max(0.0, now - updated) * rate / 60.0), rate]
+                yield state
+                conn.execute(
+                    "UPDATE buckets SET tokens = ?, rate = ?, updated = ? WHERE name = ?",
+                    (state[0], state[1], now, self.name),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    @property
+    def rate(self) -> float:
+        with self._connect() as conn:
+            return conn.execute("SELECT rate FROM buckets WHERE name = ?", (self.name,)).fetchone()[0]
+
+    def acquire(self) -> float:
+        """Take one token, sleeping as needed. Returns the time spent waiting."""
+        waited = 0.0
+        while True:
+            with self._locked_state() as state:
+                if state[0] >= 1:
+                    state[0] -= 1
+                    return waited
+                delay = (1 - state[0]) * 60.0 / state[1]
+            # Other processes may take the token first; re-check after a short nap
+            delay = min(delay, 1.0) * random.uniform(0.8, 1.2)
+            time.sleep(delay)
+            waited += delay
+
+    def on_success(self):
+        with self._locked_state() as state:
+            state[1] = min(self.max_rpm, state[1] + QUOTA_AIMD_INCREASE)
+
+    def on_throttle(self):
+        with self._locked_state() as state:
+            state[1] = max(self.min_rpm, state[1] * QUOTA_AIMD_DECREASE)
+            state[0] = min(state[0], 0.0)
+        QUOTA_THROTTLED.labels(self.name).inc()
+        logger.warning("Quota hit, rate lowered", extra={"quota": self.name, "rpm": round(self.rate, 1)})
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Run fn under the governor. 429s are retried with full-jitter
+        exponential backoff; any other error is raised immediately.
+        """
+        for attempt in range(QUOTA_MAX_RETRIES + 1):
+            QUOTA_WAIT.labels(self.name, "pacing").observe(self.acquire())
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if not is_quota_error(e):
+                    raise
+                self.on_throttle()
+                backoff = min(QUOTA_BACKOFF_CAP, QUOTA_BACKOFF_BASE * (2 ** attempt))
+                if attempt == QUOTA_MAX_RETRIES:
+                    raise QuotaExceededError(f"{self.name} quota exceeded after {attempt + 1} attempts: {e}", retry_after=backoff) from e
+                delay = random.uniform(0, backoff)
+                logger.warning("429 from model, retrying", extra={
+                    "quota": self.name, "delay": round(delay, 1), "attempt": attempt + 1, "max_retries": QUOTA_MAX_RETRIES,
+                })
+                time.sleep(delay)
+                QUOTA_WAIT.labels(self.name, "backoff").observe(delay)
+                continue
+            self.on_success()
+            return result
+
+
+_governors = {}
+_governors_lock = threading.Lock()
+
+def get_governor(name: str) -> QuotaGovernor:
+    """Process-wide governor for 'imagen' or 'gemini'."""
+    with _governors_lock:
+        if name not in _governors:
+            if name == "imagen":
+                _governors[name] = QuotaGovernor(name, IMAGEN_RPM, IMAGEN_BURST)
+            elif name == "gemini":
+                _governors[name] = QuotaGovernor(name, GEMINI_RPM, GEMINI_BURST)
+            else:
+                raise ValueError(f"Unknown quota: {name}")
+        return _governors[name]
@@ -0,0 +1,197 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import contextlib
+
+from ..config import STATE_DIR
+from .metrics import RENDER_CACHE_REQUESTS
+from .image_output import write_image, DEFAULT_OUTPUT
+
+RENDER_CACHE_DIR = os.getenv("RENDER_CACHE_DIR", os.path.join(STATE_DIR, "render_cache"))
+# Least recently used blobs are evicted once the store grows past this size.
+RENDER_CACHE_MAX_BYTES = int(float(os.getenv("RENDER_CACHE_MAX_BYTES", str(5 * 1024 ** 3))))
+RENDER_CACHE_ENABLED = os.getenv("RENDER_CACHE_ENABLED", "1").lower() not in ("0", "false", "no")
+
+# Generation settings shared by every reference render; part of the render cache key
+REFERENCE_IMAGE_PARAMS = {
+    "aspect_ratio": "1:1",
+    "add_watermark": False,
+    "safety_filter_level": "block_only_high",
+    "person_generation": "allow_all",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    key TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_access REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS blobs_last_access ON blobs (last_access);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def render_key(prompt: str, negative_prompt: str = None, model_id: str = None, aspect_ratio: str = None,
+               safety_filter_level: str = None, person_generation: str = None, add_watermark: bool = None,
+               seed: int = None, variant_index: int = 0, output_format: str = "jpg") -> str:
+    """Hash of every parameter that determines a rendered image."""
+    params = {
+        "prompt": prompt,
+        "negative_prompt": negative_prompt,
+        "model_id": model_id,
+        "aspect_ratio": aspect_ratio,
+        "safety_filter_level": safety_filter_level,
+        "person_generation": person_generation,
+        "add_watermark": add_watermark,
+        "seed": seed,
+        "variant_index": variant_index,
+        "output_format": output_format,
+    }
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class RenderCache:
+    """
+    Content-addressed store of rendered images, keyed by render_key().
+    Local asset storage holds hard links into the store, so identical renders
+    share one file and cost no quota after the first time.
+    """
+
+    def __init__(self, root: str = RENDER_CACHE_DIR, max_bytes: int = RENDER_CACHE_MAX_BYTES, enabled: bool = RENDER_CACHE_ENABLED):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.enabled = enabled and max_bytes > 0
+        if self.enabled:
+            os.makedirs(os.path.join(root, "blobs"), exist_ok=True)
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(_SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(os.path.join(self.root, "index.sqlite3"), timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _blob_path(self, key: str, ext: str) -> str:
+        return os.path.join(self.root, "blobs", key[:2], f"{key}.{ext}")
+
+    def _count(self, conn, name: str):
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,),
+        )
+
+    def lookup(self, key: str):
+        """Path of a cached render in the store, or None (a miss)."""
+        if not self.enabled:
+            return None
+        with self._connect() as conn:
+            row = conn.execute("SELECT path FROM blobs WHERE key = ?", (key,)).fetchone()
+            if row is None or not os.path.exists(row[0]):
+                if row is not None:
+                    conn.execute("DELETE FROM blobs WHERE key = ?", (key,))
+                self._count(conn, "misses")
+                RENDER_CACHE_REQUESTS.labels("miss").inc()
+                return None
+            conn.execute("UPDATE blobs SET last_access = ?, hits = hits + 1 WHERE key = ?", (time.time(), key))
+            self._count(conn, "hits")
+        RENDER_CACHE_REQUESTS.labels("hit").inc()
+        return row[0]
+
+    def contains(self, key: str) -> bool:
+        """Whether a render is cached, without counting a lookup or touching its LRU position (for planning)."""
+        if not self.enabled:
+            return False
+        with self._connect() as conn:
+            row = conn.execute("SELECT path FROM blobs WHERE key = ?", (key,)).fetchone()
+        return row is not None and os.path.exists(row[0])
+
+    def save_blob(self, image, key: str, fmt=DEFAULT_OUTPUT) -> str:
+        """
+        Write a generated image into the store in the given output format and return its path.
+        With the cache disabled it goes to a scratch file instead, for the caller to move into place.
+        """
+        ext = fmt.ext
+        if not self.enabled:
+            scratch = os.path.join(self.root, "scratch")
+            os.makedirs(scratch, exist_ok=True)
+            path = os.path.join(scratch, f"{key}.{os.getpid()}.{threading.get_ident()}.{ext}")
+            write_image(image, path, fmt)
+            return path
+        blob = self._blob_path(key, ext)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        # Keep the real extension last: the SDK picks the encoder from it
+        tmp = os.path.join(os.path.dirname(blob), f"{key}.{os.getpid()}.{threading.get_ident()}.tmp.{ext}")
+        write_image(image, tmp, fmt)
+        os.replace(tmp, blob)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO blobs (key, path, size, created, last_access, hits) VALUES (?, ?, ?, ?, ?, 0)",
+                (key, blob, os.path.getsize(blob), now, now),
+            )
+        self.evict(keep=key)
+        return blob
+
+    def evict(self, keep: str = None):
+        """Drop least recently used blobs (other than keep) until the store fits in max_bytes."""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+            evicted = []
+            if total > self.max_bytes:
+                for key, path, size in conn.execute("SELECT key, path, size FROM blobs ORDER BY last_access").fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    if key == keep:
+                        continue
+                    conn.execute("DELETE FROM blobs WHERE key = ?", (key,))
+                    evicted.append(path)
+                    total -= size
+            conn.execute("COMMIT")
+        for path in evicted:
+            # Reference folders keep their hard links; only the store's copy goes
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+        return len(evicted)
+
+    def stats(self) -> dict:
+        if not self.enabled:
+            return {"enabled": False}
+        with self._connect() as conn:
+            counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+        hits = counters.get("hits", 0)
+        misses = counters.get("misses", 0)
+        return {
+            "enabled": True,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else None,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_render_cache() -> RenderCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = RenderCache()
+        return _cache
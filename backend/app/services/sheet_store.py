@@ -0,0 +1,137 @@
+import os
+import copy
+import hashlib
+import threading
+import contextlib
+
+from ..config import STATE_DIR
+from .jsonio import loads, dump_sheet
+
+SHEET_LOCK_DIR = os.getenv("SHEET_LOCK_DIR", os.path.join(STATE_DIR, "locks"))
+
+if os.name == "nt":
+    import msvcrt
+
+    def _lock_file(f):
+        # LK_LOCK gives up after ~10 s; keep waiting like flock does
+        while True:
+            try:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue
+
+    def _unlock_file(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _lock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+    def _unlock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class _SheetState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = []
+
+
+_states = {}
+_states_lock = threading.Lock()
+
+def _state(path: str) -> _SheetState:
+    with _states_lock:
+        return _states.setdefault(path, _SheetState())
+
+
+@contextlib.contextmanager
+def sheet_lock(path: str):
+    """
+    Exclusive lock on a sheet, across threads and processes (API, job workers, CLIs).
+    Lock files live in the state directory so data/ only ever holds sheets and images.
+    """
+    path = os.path.abspath(path)
+    os.makedirs(SHEET_LOCK_DIR, exist_ok=True)
+    lock_path = os.path.join(SHEET_LOCK_DIR, hashlib.sha1(path.encode("utf-8")).hexdigest() + ".lock")
+    with _state(path).lock:
+        with open(lock_path, "a+") as f:
+            _lock_file(f)
+            try:
+                yield
+            finally:
+                _unlock_file(f)
+
+
+def write_text_atomic(path: str, text: str):
+    """Write via a temp file and rename, so readers never see a half-written sheet."""
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, "w") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp)
+
+
+def write_json_atomic(path: str, data: dict):
+    write_text_atomic(path, dump_sheet(data))
+
+
+class _Update:
+    def __init__(self, mutate):
+        self.mutate = mutate
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def update_sheet(path: str, mutate):
+    """
+    Apply mutate(data) to the latest on-disk version of a sheet and write it back atomically.
+    Updates queued by other threads while the lock is held are coalesced into the same
+    read-modify-write. A mutate that raises fails only its own caller, and none of its
+    changes are written. Returns the sheet as written.
+    """
+    path = os.path.abspath(path)
+    state = _state(path)
+    update = _Update(mutate)
+    with _states_lock:
+        state.pending.append(update)
+
+    with sheet_lock(path):
+        if not update.done.is_set():
+            with _states_lock:
+                batch, state.pending = state.pending, []
+            try:
+                with open(path, "rb") as f:
+                    data = loads(f.read())
+                # Each mutation works on a copy, so one that raises partway leaves nothing behind
+                for item in batch:
+                    candidate = copy.deepcopy(data)
+                    try:
+                        item.mutate(candidate)
+                    except Exception as e:
+                        item.error = e
+                    else:
+                        data = candidate
+                if any(item.error is None for item in batch):
+                    write_json_atomic(path, data)
+                for item in batch:
+                    item.result = data
+            except Exception as e:
+                for item in batch:
+                    item.error = item.error or e
+            for item in batch:
+                item.done.set()
+
+    if update.error is not None:
+        raise update.error
+    return update.result
@@ -0,0 +1,90 @@
+import os
+import mmap
+import hashlib
+import threading
+
+from fastapi.responses import FileResponse
+
+# Versioned URLs never change content, so browsers may keep them for a year.
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+VERSIONED_PREFIX = "/static-v"
+
+# abs path -> (mtime_ns, size, digest)
+_digests = {}
+_digests_lock = threading.Lock()
+
+
+def file_digest(path: str) -> str:
+    """Short content hash of a file (first 16 hex chars of SHA-256)."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        # Hashed straight from the page cache, without copying the file into Python buffers
+        if os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                h.update(mapped)
+    return h.hexdigest()[:16]
+
+
+def content_digest(abs_path: str):
+    """Digest of a file, recomputed only when its mtime or size changes. None if missing."""
+    try:
+        st = os.stat(abs_path)
+    except OSError:
+        return None
+    with _digests_lock:
+        cached = _digests.get(abs_path)
+    if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+        return cached[2]
+    digest = file_digest(abs_path)
+    with _digests_lock:
+        _digests[abs_path] = (st.st_mtime_ns, st.st_size, digest)
+    return digest
+
+
+def versioned_url(rel_path: str, digest: str = None):
+    """Content-hashed URL for an asset (path relative to DATA_DIR), or None if it doesn't exist."""
+    if digest is None:
+        from .storage import get_storage
+        digest = get_storage().digest(rel_path)
+    if digest is None:
+        return None
+    return f"{VERSIONED_PREFIX}/{digest}/{rel_path}"
+
+
+def versioned_references(reference_images, category: str):
+    """
+    Mirror a sheet's reference_images (paths relative to its category folder)
+    with content-hashed URLs, keeping the same nesting of styles, angles and variants.
+    """
+    if isinstance(reference_images, str):
+        return versioned_url(f"{category}/{reference_images}") if reference_images else None
+    if isinstance(reference_images, list):
+        return [versioned_references(item, category) for item in reference_images]
+    if isinstance(reference_images, dict):
+        return {key: versioned_references(value, category) for key, value in reference_images.items()}
+    return None
+
+
+class SendfileResponse(FileResponse):
+    """
+    FileResponse that hands whole-file responses to the server (the ASGI pathsend
+    extension, i.e. sendfile) when the server offers it, instead of copying the
+    file through the event loop in 64 KiB reads.
+    """
+
+    async def __call__(self, scope, receive, send):
+        self._pathsend = "http.response.pathsend" in scope.get("extensions", {})
+        await super().__call__(scope, receive, send)
+
+    async def _handle_simple(self, send, send_header_only: bool):
+        if not self._pathsend or send_header_only:
+            return await super()._handle_simple(send, send_header_only)
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        await send({"type": "http.response.pathsend", "path": str(self.path)})
+
+
+class ImmutableFileResponse(SendfileResponse):
+    """FileResponse whose If-Range check accepts the content-hash ETag it was given."""
+
+    def _should_use_range(self, http_if_range, stat_result) -> bool:
+        return http_if_range == self.headers.get("etag") or super()._should_use_range(http_if_range, stat_result)
@@ -0,0 +1,376 @@
+import os
+import stat
+import time
+import shutil
+import sqlite3
+import hashlib
+import tempfile
+import posixpath
+import threading
+import contextlib
+
+from ..config import DATA_DIR, STATE_DIR
+from .static_assets import file_digest, content_digest
+
+# "local" keeps renders in DATA_DIR as browsable {id}_refs/ folders; "sharded"
+# spreads them over hash-prefixed directories; "s3" puts them in a bucket.
+ASSET_STORAGE = os.getenv("ASSET_STORAGE", "local").lower()
+if ASSET_STORAGE not in ("local", "sharded", "s3"):
+    raise ValueError(f"Unknown ASSET_STORAGE: {ASSET_STORAGE}")
+# Objects and object index of the sharded and s3 backends
+ASSET_STORAGE_DIR = os.getenv("ASSET_STORAGE_DIR", os.path.join(STATE_DIR, "assets"))
+ASSET_S3_BUCKET = os.getenv("ASSET_S3_BUCKET", "move37-assets")
+# Unset: a local S3 stand-in under ASSET_STORAGE_DIR. Set: a real S3/MinIO endpoint, through boto3.
+ASSET_S3_ENDPOINT = os.getenv("ASSET_S3_ENDPOINT")
+
+_INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    key TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    digest TEXT,
+    seq INTEGER NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS objects_seq ON objects (seq);
+"""
+
+
+def clean_key(path: str) -> str:
+    """Storage key for a path relative to the data directory. ValueError if it points outside."""
+    key = posixpath.normpath(path.replace("\\", "/")).lstrip("/")
+    if key in ("", ".") or key == ".." or key.startswith("../"):
+        raise ValueError(f"Invalid asset path: {path}")
+    return key
+
+
+def _place(src: str, dest: str, move: bool = False):
+    """Atomically put src's bytes at dest: renamed (move), hard-linked or copied."""
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    if move:
+        os.replace(src, dest)
+        return
+    # Never write through dest: it may be a hard link into the render cache
+    tmp = f"{dest}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dest)
+    # rename() is a no-op when both names are links to the same file
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(tmp)
+
+
+class AssetStorage:
+    """
+    Where rendered images and videos live, addressed by key: the path relative to
+    the data directory, e.g. 'characters/juri_refs/noir/head.jpg'. Sheets keep
+    storing paths relative to their category, so switching backends leaves them as they are.
+    """
+
+    def put_file(self, key: str, src: str, move: bool = False):
+        """Store the local file src under key; with move, src is consumed."""
+        raise NotImplementedError
+
+    def stat(self, key: str):
+        """(size, mtime_ns), or None if there is no such object."""
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        return self.stat(key) is not None
+
+    def digest(self, key: str):
+        """Content digest (as used in /static-v URLs), or None if missing."""
+        raise NotImplementedError
+
+    def local_path(self, key: str):
+        """A file the object can be read from directly (sendfile, Pillow), or None if it is remote or missing."""
+        return None
+
+    def open(self, key: str):
+        """Binary file object with the object's bytes."""
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def list(self, prefix: str = ""):
+        """(key, size, mtime_ns, digest) of every object under prefix, sorted by key."""
+        raise NotImplementedError
+
+    @contextlib.contextmanager
+    def local_copy(self, key: str):
+        """A local path with the object's bytes, downloaded to a scratch file when needed."""
+        path = self.local_path(key)
+        if path is not None:
+            yield path
+            return
+        fd, tmp = tempfile.mkstemp(suffix=os.path.splitext(key)[1])
+        try:
+            with os.fdopen(fd, "wb") as out, contextlib.closing(self.open(key)) as body:
+                shutil.copyfileobj(body, out, 1024 * 1024)
+            yield tmp
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp)
+
+
+class LocalStorage(AssetStorage):
+    """The data directory itself: keys are plain relative paths."""
+
+    def __init__(self, root: str = DATA_DIR):
+        self.root = os.path.abspath(root)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def put_file(self, key: str, src: str, move: bool = False):
+        _place(src, self._path(key), move)
+
+    def stat(self, key: str):
+        try:
+            st = os.stat(self._path(key))
+        except OSError:
+            return None
+        return (st.st_size, st.st_mtime_ns) if stat.S_ISREG(st.st_mode) else None
+
+    def digest(self, key: str):
+        return content_digest(self._path(key))
+
+    def local_path(self, key: str):
+        path = self._path(key)
+        return path if os.path.isfile(path) else None
+
+    def open(self, key: str):
+        return open(self._path(key), "rb")
+
+    def delete(self, key: str):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self._path(key))
+
+    def list(self, prefix: str = ""):
+        results = []
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            for name in filenames:
+                key = os.path.relpath(os.path.join(dirpath, name), self.root).replace("\\", "/")
+                if key.startswith(prefix) and not name.startswith("."):
+                    st = os.stat(os.path.join(dirpath, name))
+                    results.append((key, st.st_size, st.st_mtime_ns, None))
+        return sorted(results)
+
+
+class ObjectIndex:
+    """
+    SQLite catalog of the objects in a sharded or S3 store: listing by prefix is
+    a B-tree range scan, and every put or delete bumps a sequence number so the
+    asset index can pick up just the changes.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_INDEX_SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _write(self, key: str, size: int, mtime_ns: int, digest, deleted: int):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            seq = conn.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM objects").fetchone()[0]
+            conn.execute(
+                "INSERT OR REPLACE INTO objects (key, size, mtime_ns, digest, seq, deleted) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, size, mtime_ns, digest, seq, deleted),
+            )
+            conn.execute("COMMIT")
+
+    def put(self, key: str, size: int, mtime_ns: int, digest: str):
+        self._write(key, size, mtime_ns, digest, 0)
+
+    def remove(self, key: str):
+        # Kept as a tombstone so change readers see the delete
+        self._write(key, 0, time.time_ns(), None, 1)
+
+    def get(self, key: str):
+        """(size, mtime_ns, digest), or None."""
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT size, mtime_ns, digest FROM objects WHERE key = ? AND deleted = 0", (key,)
+            ).fetchone()
+
+    def list(self, prefix: str = ""):
+        with self._connect() as conn:
+            if prefix:
+                rows = conn.execute(
+                    "SELECT key, size, mtime_ns, digest FROM objects WHERE key >= ? AND key < ? AND deleted = 0 ORDER BY key",
+                    (prefix, prefix + "\U0010ffff"),
+                )
+            else:
+                rows = conn.execute("SELECT key, size, mtime_ns, digest FROM objects WHERE deleted = 0 ORDER BY key")
+            return rows.fetchall()
+
+    def changes(self, since: int = 0):
+        """(latest seq, [(key, size, mtime_ns, digest, deleted)] changed after since)."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT key, size, mtime_ns, digest, deleted, seq FROM objects WHERE seq > ? ORDER BY seq", (since,)
+            ).fetchall()
+        latest = rows[-1][5] if rows else since
+        return latest, [row[:5] for row in rows]
+
+
+class ShardedStorage(AssetStorage):
+    """
+    Objects in hash-prefixed directories (ab/cd/abcd...-head.jpg), so no directory
+    grows past a few dozen entries even with millions of renders. Lookups and
+    listings go through the object index rather than the filesystem.
+    """
+
+    def __init__(self, root: str, index: ObjectIndex):
+        self.root = os.path.abspath(root)
+        self.index = index
+
+    def _path(self, key: str) -> str:
+        h = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.root, h[:2], h[2:4], f"{h}-{posixpath.basename(key)}")
+
+    def put_file(self, key: str, src: str, move: bool = False):
+        digest = file_digest(src)
+        path = self._path(key)
+        _place(src, path, move)
+        st = os.stat(path)
+        self.index.put(key, st.st_size, st.st_mtime_ns, digest)
+
+    def stat(self, key: str):
+        row = self.index.get(key)
+        return (row[0], row[1]) if row else None
+
+    def digest(self, key: str):
+        row = self.index.get(key)
+        return row[2] if row else None
+
+    def local_path(self, key: str):
+        return self._path(key) if self.index.get(key) else None
+
+    def open(self, key: str):
+        return open(self._path(key), "rb")
+
+    def delete(self, key: str):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self._path(key))
+        self.index.remove(key)
+
+    def list(self, prefix: str = ""):
+        return self.index.list(prefix)
+
+    def changes(self, since: int = 0):
+        return self.index.changes(since)
+
+
+class LocalS3Client:
+    """
+    Stand-in for the subset of boto3's S3 client used here (upload_file, get_object,
+    delete_object), keeping each bucket as a directory. For development and load
+    tests without an object store.
+    """
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+
+    def _path(self, bucket: str, key: str) -> str:
+        return os.path.join(self.root, bucket, clean_key(key))
+
+    def upload_file(self, Filename: str, Bucket: str, Key: str, ExtraArgs: dict = None):
+        dest = self._path(Bucket, Key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp = f"{dest}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copyfile(Filename, tmp)
+        os.replace(tmp, dest)
+
+    def get_object(self, Bucket: str, Key: str):
+        path = self._path(Bucket, Key)
+        return {"Body": open(path, "rb"), "ContentLength": os.path.getsize(path)}
+
+    def delete_object(self, Bucket: str, Key: str):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self._path(Bucket, Key))
+        return {}
+
+
+class S3Storage(AssetStorage):
+    """Objects in an S3 bucket, with the object index kept locally for listing and digests."""
+
+    def __init__(self, client, bucket: str, index: ObjectIndex):
+        self.client = client
+        self.bucket = bucket
+        self.index = index
+
+    def put_file(self, key: str, src: str, move: bool = False):
+        digest = file_digest(src)
+        size = os.path.getsize(src)
+        self.client.upload_file(src, self.bucket, key)
+        self.index.put(key, size, time.time_ns(), digest)
+        if move:
+            os.remove(src)
+
+    def stat(self, key: str):
+        row = self.index.get(key)
+        return (row[0], row[1]) if row else None
+
+    def digest(self, key: str):
+        row = self.index.get(key)
+        return row[2] if row else None
+
+    def open(self, key: str):
+        return self.client.get_object(Bucket=self.bucket, Key=key)["Body"]
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+        self.index.remove(key)
+
+    def list(self, prefix: str = ""):
+        return self.index.list(prefix)
+
+    def changes(self, since: int = 0):
+        return self.index.changes(since)
+
+
+def _s3_client(store_dir: str):
+    if not ASSET_S3_ENDPOINT:
+        return LocalS3Client(os.path.join(store_dir, "s3"))
+    try:
+        import boto3
+    except ImportError as e:
+        raise RuntimeError("ASSET_S3_ENDPOINT is set but boto3 is not installed (pip install boto3)") from e
+    return boto3.client("s3", endpoint_url=ASSET_S3_ENDPOINT)
+
+
+_storages = {}
+_storages_lock = threading.Lock()
+
+def get_storage(root: str = None) -> AssetStorage:
+    """Process-wide asset storage for a data directory (DATA_DIR by default)."""
+    root = os.path.abspath(root or DATA_DIR)
+    with _storages_lock:
+        if root not in _storages:
+            if ASSET_STORAGE == "local":
+                _storages[root] = LocalStorage(root)
+            else:
+                # Other data directories (scratch copies, benchmarks) get a store of their own
+                store_dir = ASSET_STORAGE_DIR
+                if root != os.path.abspath(DATA_DIR):
+                    store_dir = os.path.join(ASSET_STORAGE_DIR, "roots", hashlib.sha1(root.encode("utf-8")).hexdigest()[:12])
+                if ASSET_STORAGE == "sharded":
+                    _storages[root] = ShardedStorage(os.path.join(store_dir, "objects"), ObjectIndex(os.path.join(store_dir, "objects.sqlite3")))
+                else:
+                    _storages[root] = S3Storage(_s3_client(store_dir), ASSET_S3_BUCKET, ObjectIndex(os.path.join(store_dir, "s3.sqlite3")))
+        return _storages[root]
@@ -0,0 +1,141 @@
+import os
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from ..config import DATA_DIR, STATE_DIR
+
+logger = logging.getLogger(__name__)
+
+THUMB_DIR = os.getenv("THUMB_DIR", os.path.join(STATE_DIR, "thumbs"))
+# Only these edge lengths are served, so the on-disk cache stays bounded.
+THUMB_SIZES = tuple(int(s) for s in os.getenv("THUMB_SIZES", "128,256,512").split(","))
+THUMB_FORMAT = os.getenv("THUMB_FORMAT", "webp")
+THUMB_QUALITY = int(os.getenv("THUMB_QUALITY", "80"))
+THUMB_WORKERS = int(os.getenv("THUMB_WORKERS", "2"))
+# Sizes rendered right after a reference image is saved
+THUMB_EAGER_SIZES = tuple(int(s) for s in os.getenv("THUMB_EAGER_SIZES", "256").split(",") if s)
+
+MEDIA_TYPES = {"webp": "image/webp", "avif": "image/avif"}
+SOURCE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def supported_formats():
+    """Thumbnail formats this Pillow build can encode."""
+    from PIL import features
+    formats = ["webp"] if features.check("webp") else []
+    if features.check("avif"):
+        formats.append("avif")
+    return formats
+
+
+def thumb_path(rel_path: str, digest: str, size: int, fmt: str = THUMB_FORMAT) -> str:
+    """
+    Cache file of a thumbnail, named after the source's content digest: a changed source
+    never matches an old thumbnail, whatever its mtime (hard-linked cache hits keep the blob's).
+    """
+    return os.path.join(THUMB_DIR, str(size), f"{rel_path}.{digest}.{fmt}")
+
+
+def _remove_other_versions(dest: str):
+    """Delete thumbnails of earlier versions of dest's source."""
+    folder, name = os.path.split(dest)
+    stem, digest, fmt = name.rsplit(".", 2)
+    try:
+        names = os.listdir(folder)
+    except OSError:
+        return
+    for other in names:
+        parts = other.rsplit(".", 2)
+        if len(parts) == 3 and parts[0] == stem and parts[2] == fmt and parts[1] != digest:
+            try:
+                os.remove(os.path.join(folder, other))
+            except OSError:
+                pass
+
+
+def make_thumbnail(src: str, dest: str, size: int, fmt: str = THUMB_FORMAT, quality: int = THUMB_QUALITY) -> str:
+    """
+    Downscale src to fit in size x size and write it to dest (a thumb_path).
+    Skipped when dest already exists. Runs in pool processes, so it only takes plain arguments.
+    """
+    from PIL import Image
+
+    if os.path.exists(dest):
+        return dest
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    with Image.open(src) as img:
+        # Let the JPEG decoder skip detail the thumbnail would throw away
+        img.draft("RGB", (size, size))
+        img.thumbnail((size, size))
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGB")
+        tmp = f"{dest}.{os.getpid()}.{threading.get_ident()}.tmp"
+        img.save(tmp, format=fmt.upper(), quality=quality)
+    os.replace(tmp, dest)
+    _remove_other_versions(dest)
+    return dest
+
+
+def ensure_thumbnail(rel_path: str, size: int, fmt: str = THUMB_FORMAT, storage=None) -> str:
+    """Path to an up-to-date thumbnail of the asset rel_path in storage (the configured one by default), rendering it if needed."""
+    if storage is None:
+        # Imported here: pool processes load this module only for make_thumbnail
+        from .storage import get_storage
+        storage = get_storage()
+    digest = storage.digest(rel_path)
+    if digest is None:
+        raise FileNotFoundError(rel_path)
+    dest = thumb_path(rel_path, digest, size, fmt)
+    if os.path.exists(dest):
+        return dest
+    # Remote objects are fetched to a scratch file first
+    with storage.local_copy(rel_path) as src:
+        return make_thumbnail(src, dest, size, fmt)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: callers (job workers) run threads, which fork does not copy safely
+            _pool = ProcessPoolExecutor(max_workers=THUMB_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def schedule_thumbnails(keys, storage=None, sizes=THUMB_EAGER_SIZES, fmt: str = THUMB_FORMAT):
+    """
+    Queue thumbnails for freshly written images (storage keys) in the background process pool.
+    Only DATA_DIR's locally readable assets are queued; the rest render on first request.
+    Failures never affect the caller.
+    """
+    from .storage import get_storage
+
+    if not sizes or (storage is not None and storage is not get_storage(DATA_DIR)):
+        return []
+    storage = get_storage(DATA_DIR)
+    futures = []
+    for rel_path in keys:
+        path = storage.local_path(rel_path)
+        if path is None or not path.lower().endswith(SOURCE_EXTENSIONS):
+            continue
+        digest = storage.digest(rel_path)
+        for size in sizes:
+            try:
+                future = _get_pool().submit(make_thumbnail, path, thumb_path(rel_path, digest, size, fmt), size, fmt)
+            except RuntimeError as e:
+                # Pool already shut down (interpreter exiting)
+                logger.warning("Could not schedule thumbnail", extra={"path": rel_path, "error": str(e)})
+                continue
+            future.add_done_callback(_report_failure)
+            futures.append(future)
+    return futures
+
+
+def _report_failure(future):
+    if future.exception() is not None:
+        logger.warning("Thumbnail generation failed", extra={"error": str(future.exception())})
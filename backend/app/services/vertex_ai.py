@@ -1,29 +1,29 @@
 import os
-import vertexai
+import logging
 from .parser import create_prompt_from_sheet
-from dotenv import load_dotenv
-from vertexai.preview.vision_models import ImageGenerationModel
+from .quota import get_governor
+# The registry imports and initializes the Vertex SDK on first use
+from .model_registry import get_imagen_model
+from .image_output import write_image, get_image_writer, output_format
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-PROJECT_ID = os.getenv("GCP_PROJECT_ID", "move-37")
-LOCATION = os.getenv("GCP_LOCATION", "us-central1")
-vertexai.init(project=PROJECT_ID, location=LOCATION)
-
-def generate_visual_from_sheet(sheet_data: dict, sheet_type: str = "character", number_of_images: int = 4):
-    
+def generate_visual_from_sheet(sheet_data: dict, sheet_type: str = "character", number_of_images: int = 4, output_dir: str = None, fmt=None):
+    """
+    Render images for a sheet. Without output_dir the image objects are returned.
+    With output_dir each image is encoded (fmt, or the sheet's "output" block) and
+    written on the image writer pool, its buffer freed once written, and the file
+    paths are returned instead.
+    """
     # 1. Generate Prompt
-    print("DEBUG: Starting Prompt Generation...")
     refined_prompt = create_prompt_from_sheet(sheet_data)
     negative_prompt = sheet_data.get("negative_prompt")
-    print(f"DEBUG: Refined Prompt: {refined_prompt[:50]}...")
-    if negative_prompt:
-        print(f"DEBUG: Negative Prompt: {negative_prompt}")
+    logger.debug("Built prompt", extra={"prompt": refined_prompt[:50], "negative_prompt": negative_prompt})
 
     # 2. Generate Image
-    print("DEBUG: Starting Image Generation...")
-    imagen_model = ImageGenerationModel.from_pretrained("imagen-3.0-generate-002")
-    images = imagen_model.generate_images(
+    imagen_model = get_imagen_model()
+    response = get_governor("imagen").call(
+        imagen_model.generate_images,
         prompt=refined_prompt,
         number_of_images=number_of_images,
         aspect_ratio="16:9",
@@ -34,7 +34,18 @@ def generate_visual_from_sheet(sheet_data: dict, sheet_type: str = "character",
         person_generation="allow_all",
         negative_prompt=negative_prompt,
     )
-    print(f"Created output image using {len(images[0]._image_bytes)} bytes")
+    images = list(response.images)
+    del response
+    logger.info("Created output images", extra={"images": len(images), "bytes": sum(len(i._image_bytes) for i in images)})
+    if output_dir is None:
+        # Return the list of image objects directly
+        return images
 
-    # Return the list of image objects directly
-    return images.images
\ No newline at end of file
+    fmt = fmt or output_format(sheet_data)
+    os.makedirs(output_dir, exist_ok=True)
+    base = sheet_data.get("character_id") or sheet_data.get("name") or sheet_type
+    paths = [os.path.join(output_dir, f"{base}_{i + 1}.{fmt.ext}") for i in range(len(images))]
+    writes = [get_image_writer().submit(write_image, images.pop(0), path, fmt) for path in paths]
+    for write in writes:
+        write.result()
+    return paths
\ No newline at end of file
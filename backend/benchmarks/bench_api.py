@@ -0,0 +1,34 @@
+import json
+
+from fastapi import Response
+
+
+# Endpoints are called directly, so Query() defaults have to be passed explicitly
+
+def test_list_assets(benchmark, api):
+    assets = benchmark(api.list_assets, Response(), type=None, limit=None)
+    assert assets
+
+
+def test_list_assets_page(benchmark, api):
+    # First page, as the asset browser requests it
+    assets = benchmark(api.list_assets, Response(), category="characters", type="image", limit=100)
+    assert assets
+
+
+def test_list_files(benchmark, api):
+    files = benchmark(api.list_files, "characters")
+    assert files
+
+
+def test_read_data_file(benchmark, api, tree):
+    filename = f"{tree[1]['characters'][0]}.json"
+    result = benchmark(api.read_data_file, "characters", filename)
+    assert result["content"]
+
+
+def test_save_data_file(benchmark, api, tree):
+    filename = f"{tree[1]['characters'][1 % len(tree[1]['characters'])]}.json"
+    sheet = json.loads(api.read_data_file("characters", filename)["content"])
+    request = api.FileSaveRequest(content=json.dumps(sheet, indent=4))
+    benchmark(api.save_data_file, "characters", filename, request)
@@ -0,0 +1,42 @@
+import random
+
+from app.services.catalog import get_catalog
+from app.services.parser import parse_scene, create_prompt_from_sheet, create_character_reference_prompts
+
+
+def _scene(ids, rng):
+    return {
+        "scene_id": "0001",
+        "cinematography": rng.choice(ids["shots"]),
+        "character_id": rng.choice(ids["characters"]),
+        "action": "Walks through the rain",
+        "environment_id": rng.choice(ids["environments"]),
+        "style_id": rng.choice(ids["styles"]),
+    }
+
+
+def test_parse_scene(benchmark, tree, data_dir):
+    rng = random.Random(1)
+    scenes = [_scene(tree[1], rng) for _ in range(256)]
+    get_catalog(data_dir).warm()
+    it = iter(range(1 << 62))
+    benchmark(lambda: parse_scene(scenes[next(it) % len(scenes)]))
+
+
+def test_create_prompt_from_sheet_sequence(benchmark, tree, data_dir):
+    catalog = get_catalog(data_dir)
+    catalog.warm()
+    sequence = catalog.get("sequences", "synthetic")
+    benchmark(create_prompt_from_sheet, sequence)
+
+
+def test_create_prompt_from_sheet_legacy(benchmark, tree, data_dir):
+    catalog = get_catalog(data_dir)
+    sheet = catalog.get("characters", tree[1]["characters"][0])
+    benchmark(create_prompt_from_sheet, sheet)
+
+
+def test_create_character_reference_prompts(benchmark, tree, data_dir):
+    catalog = get_catalog(data_dir)
+    sheet = catalog.get("characters", tree[1]["characters"][-1])
+    benchmark(create_character_reference_prompts, sheet, "noir")
@@ -0,0 +1,89 @@
+"""
+Scenes-per-second benchmark for the streaming prompt compiler.
+
+Builds a synthetic sequence from the characters, environments, styles and shot
+types in data/, then times the streaming compiler against the per-scene
+parse_scene path.
+
+    python benchmarks/compile_sequence.py
+    python benchmarks/compile_sequence.py --scenes 100000 --legacy-scenes 10000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.catalog import get_catalog
+from app.services.compiler import iter_sequence
+from app.services.parser import parse_scene
+
+
+def synthetic_scenes(count: int, seed: int = 37):
+    """Yield scenes lazily so the input never dominates memory."""
+    catalog = get_catalog()
+    characters = [f[:-5] for f in catalog.list_files("characters")] or ["kaelen"]
+    environments = [f[:-5] for f in catalog.list_files("environments")] or ["Neon_Alleway"]
+    styles = [f[:-5] for f in catalog.list_files("styles")] + [None]
+    shots = list(catalog.get("cinematography", "default") or {"medium_shot": ""})
+    rng = random.Random(seed)
+    for i in range(count):
+        yield {
+            "scene_id": f"{i:06d}",
+            "cinematography": rng.choice(shots),
+            "character_id": rng.choice(characters),
+            "action": f"Beat {i}: walks through the frame",
+            "environment_id": rng.choice(environments),
+            "style_id": rng.choice(styles),
+        }
+
+
+def run(label: str, scenes: int, compile_fn, memory: bool = False):
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    count = compile_fn(synthetic_scenes(scenes))
+    elapsed = time.perf_counter() - start
+    line = f"{label:<10} {count:>8} scenes in {elapsed:7.2f}s  {count / elapsed:>10.0f} scenes/s"
+    if memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        line += f"  peak {peak / 1e6:6.2f} MB"
+    print(line)
+    return count / elapsed
+
+
+def streaming(scenes):
+    count = 0
+    for _ in iter_sequence(scenes):
+        count += 1
+    return count
+
+
+def legacy(scenes):
+    # What create_prompt_from_sheet did before: parse every scene, keep every prompt
+    prompts = [parse_scene(scene) for scene in scenes]
+    return len(prompts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark prompt compilation on a synthetic sequence.")
+    parser.add_argument("--scenes", type=int, default=100000, help="Scenes for the streaming compiler (default: 100000).")
+    parser.add_argument("--legacy-scenes", type=int, default=10000, help="Scenes for the parse_scene path; 0 to skip (default: 10000).")
+    parser.add_argument("--memory", action="store_true", help="Also report peak traced memory (slows both runs).")
+    args = parser.parse_args()
+
+    # Warm the catalog so both runs measure compilation, not first reads
+    get_catalog().warm()
+
+    fast = run("streaming", args.scenes, streaming, args.memory)
+    if args.legacy_scenes:
+        slow = run("legacy", args.legacy_scenes, legacy, args.memory)
+        print(f"speed-up: {fast / slow:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Keep job/quota/cache state out of the repo and never touch Vertex
+os.environ.setdefault("MOVE37_STATE_DIR", tempfile.mkdtemp(prefix="move37-bench-state-"))
+os.environ.setdefault("JOB_WORKERS", "0")
+os.environ.setdefault("GENERATION_BACKEND", "fake")
+os.environ.setdefault("THUMB_EAGER_SIZES", "")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import configure_metrics  # noqa: E402
+
+configure_metrics()
+
+from synthetic import build_data_tree  # noqa: E402
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--tree-sizes", default="10,1000",
+        help="Comma-separated synthetic data tree sizes (sheets/assets), e.g. 10,1000,100000.",
+    )
+
+
+def pytest_generate_tests(metafunc):
+    if "tree_size" in metafunc.fixturenames:
+        sizes = [int(s) for s in metafunc.config.getoption("--tree-sizes").split(",") if s]
+        metafunc.parametrize("tree_size", sizes, ids=[f"n{s}" for s in sizes], scope="session")
+
+
+@pytest.fixture(scope="session")
+def tree(tree_size, tmp_path_factory):
+    """(root, ids) of a synthetic data tree, built once per size."""
+    root = str(tmp_path_factory.mktemp(f"data-{tree_size}"))
+    return root, build_data_tree(root, tree_size)
+
+
+@pytest.fixture
+def data_dir(tree, monkeypatch):
+    """Point the catalog-backed services (parser, compiler) at the synthetic tree."""
+    from app.services import catalog
+
+    root, _ = tree
+    monkeypatch.setattr(catalog, "DATA_DIR", root)
+    return root
+
+
+@pytest.fixture
+def api(data_dir, tmp_path, monkeypatch):
+    """app.main with its data directory, catalog and asset index bound to the synthetic tree."""
+    from app import main
+    from app.services.catalog import get_catalog
+    from app.services.asset_index import AssetIndex
+    from app.services.storage import LocalStorage
+
+    # The synthetic tree is written as plain files, whatever ASSET_STORAGE is set to
+    storage = LocalStorage(data_dir)
+    index = AssetIndex(root=data_dir, snapshot_path=str(tmp_path / "asset_index.json"), storage=storage)
+    index.refresh(True)
+    monkeypatch.setattr(main, "DATA_DIR", data_dir)
+    monkeypatch.setattr(main, "storage", storage)
+    monkeypatch.setattr(main, "data_files", storage)
+    monkeypatch.setattr(main, "catalog", get_catalog(data_dir))
+    monkeypatch.setattr(main, "get_asset_index", lambda: index)
+    return main
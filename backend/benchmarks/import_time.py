@@ -0,0 +1,117 @@
+"""
+Cold-start import benchmark built on `python -X importtime`.
+
+Each target is started in a fresh interpreter several times; the median total
+import time is reported along with the slowest top-level imports. Targets also
+list modules they must never pull in (e.g. the Vertex SDK on the parser path).
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --save benchmarks/import_baseline.json
+    python benchmarks/import_time.py --compare benchmarks/import_baseline.json --threshold 20
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_SDK = ["vertexai", "google.cloud.aiplatform"]
+
+# name -> (argv after `python -X importtime`, modules that must not be imported)
+TARGETS = {
+    "api": (["-c", "import app.main"], HEAVY_SDK),
+    "parser": (["-c", "import app.services.parser"], HEAVY_SDK),
+    "parser_cli": (["test_parser_local.py", "--help"], HEAVY_SDK),
+    "character_cli": (["generate_character_references.py", "--help"], HEAVY_SDK),
+    "environment_cli": (["generate_environment_references.py", "--help"], HEAVY_SDK),
+}
+
+
+def parse_importtime(stderr: str):
+    """Return ({top-level module: cumulative us}, set of every imported module)."""
+    top_level = {}
+    modules = set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative_us, name = line.split(":", 1)[1].split("|")
+        module = name.strip()
+        modules.add(module)
+        # Nested imports are indented two extra spaces per level under their parent
+        if len(name) - len(name.lstrip()) == 1:
+            top_level[module] = top_level.get(module, 0) + int(cumulative_us)
+    return top_level, modules
+
+
+def measure(argv, repeat: int):
+    runs = []
+    last_top_level, all_modules = {}, set()
+    env = dict(os.environ, JOB_WORKERS="0")
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", *argv],
+            cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            raise RuntimeError(f"{' '.join(argv)} exited with {proc.returncode}:\n{proc.stderr[-2000:]}")
+        top_level, modules = parse_importtime(proc.stderr)
+        runs.append(sum(top_level.values()) / 1000.0)
+        last_top_level, all_modules = top_level, modules
+    return statistics.median(runs), last_top_level, all_modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold-start import cost of the API, parser and CLIs.")
+    parser.add_argument("targets", nargs="*", help=f"Targets to measure: {', '.join(TARGETS)} (default: all).")
+    parser.add_argument("--repeat", "-r", type=int, default=5, help="Fresh interpreters per target (default: 5).")
+    parser.add_argument("--top", type=int, default=5, help="Slowest top-level imports to show per target.")
+    parser.add_argument("--save", help="Write results to this JSON file.")
+    parser.add_argument("--compare", help="Baseline JSON to compare against.")
+    parser.add_argument("--threshold", type=float, default=20.0, help="Allowed slowdown vs baseline in percent (default: 20).")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.targets if name not in TARGETS]
+    if unknown:
+        parser.error(f"unknown target(s): {', '.join(unknown)}")
+
+    results = {}
+    failed = False
+    for name in args.targets or TARGETS:
+        argv, forbidden = TARGETS[name]
+        median_ms, top_level, modules = measure(argv, args.repeat)
+        leaked = [m for m in forbidden if m in modules]
+        results[name] = {"median_ms": round(median_ms, 2), "leaked": leaked}
+
+        print(f"{name:<16} {median_ms:8.1f} ms")
+        for module, us in sorted(top_level.items(), key=lambda kv: kv[1], reverse=True)[:args.top]:
+            print(f"    {us / 1000.0:8.1f} ms  {module}")
+        if leaked:
+            print(f"    REGRESSION: imports {', '.join(leaked)} at startup")
+            failed = True
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {args.compare} (threshold {args.threshold:.0f}%):")
+        for name, result in results.items():
+            if name not in baseline:
+                continue
+            before = baseline[name]["median_ms"]
+            change = (result["median_ms"] - before) / before * 100 if before else 0.0
+            flag = "REGRESSION" if change > args.threshold else "ok"
+            failed = failed or flag == "REGRESSION"
+            print(f"  {name:<16} {before:8.1f} -> {result['median_ms']:8.1f} ms ({change:+.0f}%) {flag}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=4)
+        print(f"\nSaved results to {args.save}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+"""
+End-to-end load test for the FastAPI app.
+
+By default it builds a synthetic data tree, starts the app under uvicorn with the
+fake generation backend (GENERATION_BACKEND=fake) and a throwaway state directory,
+then drives it with concurrent users following a workload profile. Point --url at
+an already running app to skip the local server.
+
+Reports throughput, p50/p95/p99 latency and error rate per endpoint, plus threadpool
+saturation sampled from /stats/threadpool, and saves the run as JSON for diffing.
+
+    python benchmarks/load_test.py --profile mixed --users 32 --duration 60
+    python benchmarks/load_test.py --profile browse --tree-size 100000 --compare load_results/browse_20250101-120000.json
+    python benchmarks/load_test.py --url http://localhost:8000 --profile edit
+"""
+import argparse
+import collections
+import http.client
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import BACKEND_DIR, build_data_tree
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "load_results")
+
+# Operation -> relative weight
+PROFILES = {
+    "browse": {"list_assets_page": 4, "list_assets": 1, "list_files": 2, "read_data": 4},
+    "edit": {"read_data": 4, "save_data": 2, "list_files": 1, "list_assets_page": 1},
+    "generate": {"generate_character": 1, "character_json": 1, "read_data": 2, "list_assets_page": 2},
+    "mixed": {
+        "list_assets_page": 3, "list_assets": 1, "list_files": 2, "read_data": 4,
+        "save_data": 1, "generate_character": 1, "character_json": 1,
+    },
+}
+
+JOB_TIMEOUT = 300
+
+
+class Client:
+    """One keep-alive HTTP connection per simulated user."""
+
+    def __init__(self, base_url: str, timeout: float = 60):
+        parts = urllib.parse.urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.timeout = timeout
+        self.conn = None
+
+    def request(self, method: str, path: str, body=None):
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        try:
+            self.conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+            response = self.conn.getresponse()
+            return response.status, response.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.conn = None
+            raise
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = collections.defaultdict(list)
+        self.statuses = collections.defaultdict(collections.Counter)
+
+    def add(self, label: str, status, seconds: float):
+        with self.lock:
+            self.latencies[label].append(seconds)
+            self.statuses[label][str(status)] += 1
+
+
+def timed(client, recorder, label, method, path, body=None):
+    start = time.perf_counter()
+    try:
+        status, data = client.request(method, path, body)
+    except Exception as e:
+        recorder.add(label, type(e).__name__, time.perf_counter() - start)
+        return None, None
+    recorder.add(label, status, time.perf_counter() - start)
+    return status, data
+
+
+def op_list_assets(client, recorder, ids, rng):
+    timed(client, recorder, "GET /assets", "GET", "/assets")
+
+
+def op_list_assets_page(client, recorder, ids, rng):
+    query = urllib.parse.urlencode({"category": "characters", "limit": 100})
+    timed(client, recorder, "GET /assets?limit=100", "GET", f"/assets?{query}")
+
+
+def op_list_files(client, recorder, ids, rng):
+    timed(client, recorder, "GET /files/{category}", "GET", f"/files/{rng.choice(['characters', 'environments', 'styles'])}")
+
+
+def op_read_data(client, recorder, ids, rng):
+    timed(client, recorder, "GET /data/{category}/{filename}", "GET", f"/data/characters/{rng.choice(ids['characters'])}.json")
+
+
+def op_save_data(client, recorder, ids, rng):
+    filename = f"{rng.choice(ids['characters'])}.json"
+    status, data = client.request("GET", f"/data/characters/{filename}")
+    if status != 200:
+        return
+    sheet = json.loads(json.loads(data)["content"])
+    sheet["extra_details"] = f"Edited at {time.time():.3f}"
+    timed(client, recorder, "POST /data/{category}/{filename}", "POST", f"/data/characters/{filename}",
+          {"content": json.dumps(sheet, indent=4)})
+
+
+def op_generate_character(client, recorder, ids, rng):
+    """Enqueue a reference job and wait for it, recording both the request and the end-to-end time."""
+    start = time.perf_counter()
+    body = {"id": rng.choice(ids["characters"]), "style_id": rng.choice(ids["styles"]), "force": rng.random() < 0.5}
+    status, data = timed(client, recorder, "POST /generate/character", "POST", "/generate/character", body)
+    if status != 202:
+        return
+    job_id = json.loads(data)["job_id"]
+    while time.perf_counter() - start < JOB_TIMEOUT:
+        time.sleep(0.5)
+        status, data = timed(client, recorder, "GET /jobs/{job_id}", "GET", f"/jobs/{job_id}")
+        if status == 200 and json.loads(data)["status"] in ("done", "failed"):
+            recorder.add("job end-to-end", 200 if json.loads(data)["status"] == "done" else 500, time.perf_counter() - start)
+            return
+    recorder.add("job end-to-end", "Timeout", time.perf_counter() - start)
+
+
+def op_character_json(client, recorder, ids, rng):
+    timed(client, recorder, "POST /generate/character-json", "POST", "/generate/character-json",
+          {"prompt": f"A weary courier number {rng.randint(1, 9999)} with a mechanical arm"})
+
+
+OPERATIONS = {name[3:]: fn for name, fn in globals().items() if name.startswith("op_")}
+
+
+def percentile(sorted_values, pct: float):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = math.ceil(pct / 100 * len(sorted_values))
+    return sorted_values[max(0, rank - 1)]
+
+
+def summarize(recorder, elapsed: float):
+    endpoints = {}
+    for label, values in sorted(recorder.latencies.items()):
+        values = sorted(values)
+        statuses = recorder.statuses[label]
+        errors = sum(n for status, n in statuses.items() if not (status.isdigit() and int(status) < 400))
+        endpoints[label] = {
+            "requests": len(values),
+            "throughput_rps": round(len(values) / elapsed, 2),
+            "p50_ms": round(percentile(values, 50) * 1000, 2),
+            "p95_ms": round(percentile(values, 95) * 1000, 2),
+            "p99_ms": round(percentile(values, 99) * 1000, 2),
+            "max_ms": round(values[-1] * 1000, 2),
+            "error_rate": round(errors / len(values), 4),
+            "statuses": dict(statuses),
+        }
+    return endpoints
+
+
+def sample_threadpool(base_url: str, stop: threading.Event, samples: list, interval: float = 0.5):
+    client = Client(base_url, timeout=10)
+    while not stop.wait(interval):
+        try:
+            status, data = client.request("GET", "/stats/threadpool")
+        except Exception:
+            continue
+        if status == 200:
+            samples.append(json.loads(data))
+
+
+def threadpool_summary(samples):
+    if not samples:
+        return None
+    busy = [s["busy"] for s in samples]
+    return {
+        "total": samples[-1]["total"],
+        "busy_max": max(busy),
+        "busy_mean": round(sum(busy) / len(busy), 2),
+        "waiting_max": max(s["waiting"] for s in samples),
+        # Share of samples where every thread was taken and requests were queuing
+        "saturated_ratio": round(sum(1 for s in samples if s["waiting"] > 0) / len(samples), 4),
+        "samples": len(samples),
+    }
+
+
+def discover_ids(base_url: str):
+    client = Client(base_url)
+    ids = {}
+    for category in ("characters", "styles"):
+        status, data = client.request("GET", f"/files/{category}")
+        if status != 200:
+            raise RuntimeError(f"GET /files/{category} returned {status}")
+        ids[category] = [f[:-5] for f in json.loads(data)]
+    if not ids["characters"]:
+        raise RuntimeError("The target app has no character sheets to load-test with")
+    return ids
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(data_dir: str, state_dir: str, log_path: str):
+    """Run the app under uvicorn with the fake backend; returns (process, base_url)."""
+    port = free_port()
+    env = dict(os.environ, GENERATION_BACKEND="fake", MOVE37_DATA_DIR=data_dir, MOVE37_STATE_DIR=state_dir)
+    # Pace like production unless asked otherwise, but don't let quota be the only bottleneck
+    env.setdefault("IMAGEN_RPM", "600")
+    env.setdefault("GEMINI_RPM", "600")
+    log = open(log_path, "w")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Server exited with {proc.returncode}; see {log_path}")
+        try:
+            if Client(base_url, timeout=2).request("GET", "/")[0] == 200:
+                return proc, base_url
+        except OSError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f"Server did not start within 60s; see {log_path}")
+
+
+def run_load(base_url: str, profile: str, users: int, duration: float, seed: int):
+    ids = discover_ids(base_url)
+    weights = PROFILES[profile]
+    names = list(weights)
+    recorder = Recorder()
+    stop = threading.Event()
+
+    def user(n):
+        rng = random.Random(seed + n)
+        client = Client(base_url)
+        while not stop.is_set():
+            op = rng.choices(names, weights=[weights[name] for name in names])[0]
+            try:
+                OPERATIONS[op](client, recorder, ids, rng)
+            except Exception as e:
+                recorder.add(op, type(e).__name__, 0.0)
+
+    samples = []
+    sampler = threading.Thread(target=sample_threadpool, args=(base_url, stop, samples), daemon=True)
+    threads = [threading.Thread(target=user, args=(n,), daemon=True) for n in range(users)]
+    start = time.perf_counter()
+    sampler.start()
+    for t in threads:
+        t.start()
+    time.sleep(duration)
+    stop.set()
+    # Let in-flight requests finish so they count
+    for t in threads:
+        t.join(timeout=JOB_TIMEOUT)
+    elapsed = time.perf_counter() - start
+
+    endpoints = summarize(recorder, elapsed)
+    total = sum(e["requests"] for e in endpoints.values())
+    errors = sum(e["requests"] * e["error_rate"] for e in endpoints.values())
+    return {
+        "profile": profile,
+        "users": users,
+        "duration_s": round(elapsed, 2),
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "total_requests": total,
+        "throughput_rps": round(total / elapsed, 2),
+        "error_rate": round(errors / total, 4) if total else None,
+        "endpoints": endpoints,
+        "threadpool": threadpool_summary(samples),
+    }
+
+
+def print_report(result, baseline=None):
+    print(f"\nprofile={result['profile']} users={result['users']} duration={result['duration_s']}s "
+          f"requests={result['total_requests']} rps={result['throughput_rps']} error_rate={result['error_rate']}")
+    print(f"{'endpoint':<36} {'reqs':>7} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for label, e in result["endpoints"].items():
+        line = (f"{label:<36} {e['requests']:>7} {e['throughput_rps']:>8} {e['p50_ms']:>9} "
+                f"{e['p95_ms']:>9} {e['p99_ms']:>9} {e['error_rate']:>7.2%}")
+        old = (baseline or {}).get("endpoints", {}).get(label)
+        if old and old["p95_ms"]:
+            line += f"   p95 {100 * (e['p95_ms'] - old['p95_ms']) / old['p95_ms']:+.1f}%"
+            line += f"  rps {100 * (e['throughput_rps'] - old['throughput_rps']) / old['throughput_rps']:+.1f}%"
+        print(line)
+    pool = result["threadpool"]
+    if pool:
+        print(f"threadpool: {pool['busy_max']}/{pool['total']} threads busy at peak (mean {pool['busy_mean']}), "
+              f"up to {pool['waiting_max']} requests waiting, saturated {pool['saturated_ratio']:.1%} of samples")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the API with a mixed workload.")
+    parser.add_argument("--profile", default="mixed", help=f"Workload profile: {', '.join(PROFILES)} (default: mixed).")
+    parser.add_argument("--users", type=int, default=16, help="Concurrent simulated users (default: 16).")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to generate load (default: 30).")
+    parser.add_argument("--url", help="Target an already running app instead of starting one.")
+    parser.add_argument("--tree-size", type=int, default=1000, help="Synthetic data tree size for the local app (default: 1000).")
+    parser.add_argument("--seed", type=int, default=37)
+    parser.add_argument("--output", help="Where to save the JSON results (default: benchmarks/load_results/<profile>_<time>.json).")
+    parser.add_argument("--compare", help="Earlier results JSON to show p95/throughput changes against.")
+    args = parser.parse_args()
+
+    if args.profile not in PROFILES:
+        parser.error(f"Unknown profile: {args.profile}. Choose from: {', '.join(PROFILES)}")
+
+    proc = None
+    workdir = tempfile.mkdtemp(prefix="move37-load-")
+    try:
+        base_url = args.url
+        if not base_url:
+            data_dir = os.path.join(workdir, "data")
+            print(f"Building a synthetic data tree of size {args.tree_size} in {data_dir}")
+            build_data_tree(data_dir, args.tree_size, seed=args.seed)
+            proc, base_url = start_server(data_dir, os.path.join(workdir, "state"), os.path.join(workdir, "server.log"))
+            print(f"Started the app at {base_url} with the fake generation backend (log: {workdir}/server.log)")
+        print(f"Running profile '{args.profile}' with {args.users} users for {args.duration:.0f}s")
+        result = run_load(base_url, args.profile, args.users, args.duration, args.seed)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{args.profile}_{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=4)
+    print(f"\nSaved results to {output}")
+
+
+if __name__ == "__main__":
+    main()
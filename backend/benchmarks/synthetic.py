@@ -0,0 +1,104 @@
+"""
+Synthetic data trees for benchmarks and load tests.
+
+A tree of size N holds N character sheets, N/10 environments, the real styles and
+cinematography from data/, a sequence, and about N reference images spread over
+the characters' _refs folders. Images are tiny placeholders: listings and digests
+only care about file count, not pixels.
+"""
+import json
+import os
+import random
+import shutil
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DATA_DIR = os.path.join(os.path.dirname(BACKEND_DIR), "data")
+
+ANGLES = ("head", "full_body", "side", "back")
+HAIR = ("Electric blue undercut", "Silver braids", "Shaved", "Long auburn waves", "Messy black crop")
+EYES = ("Cybernetic silver", "Amber", "Green", "Heterochromatic", "Deep brown")
+CLOTHING = ("Distressed denim jacket", "Tailored trench coat", "Tech-wear hoodie", "Flight suit", "Kimono")
+PLACEHOLDER_JPEG = b"\xff\xd8\xff\xe0" + b"\0" * 256 + b"\xff\xd9"
+
+
+def character_sheet(i: int, style_id: str, rng: random.Random) -> dict:
+    return {
+        "character_id": f"c_{i:06d}",
+        "name": f"Character {i}",
+        "physical_traits": {
+            "age_range": f"{rng.randint(18, 70)}",
+            "hair": rng.choice(HAIR),
+            "eyes": rng.choice(EYES),
+            "physique": "Lean, athletic",
+        },
+        "style_id": style_id,
+        "clothing": rng.choice(CLOTHING),
+        "extra_details": "Glowing tattoos on forearms",
+        "negative_prompt": "glasses, text, watermark",
+        "reference_images": {},
+    }
+
+
+def environment_sheet(i: int, rng: random.Random) -> dict:
+    return {
+        "env_id": f"e_{i:06d}",
+        "location": f"Location {i}",
+        "lighting": "Cinematic low-light, neon backlight",
+        "time_of_day": rng.choice(("Dawn", "Noon", "Dusk", "Midnight")),
+        "weather": rng.choice(("Heavy rain", "Clear", "Fog", "Snow")),
+        "mood": "Gritty",
+        "reference_images": {},
+    }
+
+
+def build_data_tree(root: str, size: int, seed: int = 37) -> dict:
+    """Write a synthetic data directory of the given size. Returns the IDs it created."""
+    rng = random.Random(seed)
+    for category in ("characters", "environments", "styles", "cinematography", "sequences"):
+        os.makedirs(os.path.join(root, category), exist_ok=True)
+    for category in ("styles", "cinematography"):
+        src = os.path.join(REPO_DATA_DIR, category)
+        for name in os.listdir(src):
+            if name.endswith(".json"):
+                shutil.copyfile(os.path.join(src, name), os.path.join(root, category, name))
+
+    styles = sorted(f[:-5] for f in os.listdir(os.path.join(root, "styles")) if f.endswith(".json"))
+    with open(os.path.join(root, "cinematography", "default.json")) as f:
+        shots = sorted(json.load(f))
+
+    characters = [f"char_{i:06d}" for i in range(size)]
+    environments = [f"env_{i:06d}" for i in range(max(1, size // 10))]
+    for i, character_id in enumerate(characters):
+        sheet = character_sheet(i, rng.choice(styles), rng)
+        # About one image per character: 4 angles on every 4th one
+        if i % 4 == 0:
+            style_id = sheet["style_id"]
+            folder = os.path.join(root, "characters", f"{character_id}_refs", style_id)
+            os.makedirs(folder, exist_ok=True)
+            refs = {}
+            for angle in ANGLES:
+                with open(os.path.join(folder, f"{angle}.jpg"), "wb") as f:
+                    f.write(PLACEHOLDER_JPEG + str(i).encode())
+                refs[angle] = f"{character_id}_refs/{style_id}/{angle}.jpg"
+            sheet["reference_images"][style_id] = refs
+        with open(os.path.join(root, "characters", f"{character_id}.json"), "w") as f:
+            json.dump(sheet, f, indent=4)
+    for i, environment_id in enumerate(environments):
+        with open(os.path.join(root, "environments", f"{environment_id}.json"), "w") as f:
+            json.dump(environment_sheet(i, rng), f, indent=4)
+
+    scenes = [
+        {
+            "scene_id": f"{i:04d}",
+            "cinematography": rng.choice(shots),
+            "character_id": rng.choice(characters),
+            "action": f"Beat {i}: crosses the frame",
+            "environment_id": rng.choice(environments),
+            "style_id": rng.choice(styles),
+        }
+        for i in range(min(size, 200))
+    ]
+    with open(os.path.join(root, "sequences", "synthetic.json"), "w") as f:
+        json.dump({"sequence_id": "synthetic", "scenes": scenes}, f, indent=4)
+
+    return {"characters": characters, "environments": environments, "styles": styles, "shots": shots}
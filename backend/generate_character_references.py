@@ -5,7 +5,15 @@ import os
 # Add backend to sys.path if needed
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "app")))
 
-from app.services.character_refs import generate_character_references
+from app.config import configure_metrics
+
+# Before the services import prometheus_client, so this process's metrics reach /metrics
+configure_metrics()
+
+from app.services.character_refs import generate_character_references, PartialRenderError
+from app.logging_config import configure_logging
+from app.services.render_cache import get_render_cache
+from app.services.model_registry import IMAGEN_MAX_IMAGES_PER_CALL
 
 def main():
     parser = argparse.ArgumentParser(description="Generate character reference images for Veo.")
@@ -14,9 +22,11 @@ def main():
     parser.add_argument("--type", "-t", choices=["head", "full_body", "side", "back"], help="Optional specific reference type to generate.")
     parser.add_argument("--num-images", "-n", type=int, default=1, help="Number of images to generate per reference angle (default: 1).")
     parser.add_argument("--force", "-f", action="store_true", help="Force regeneration of images even if they exist.")
+    parser.add_argument("--no-cache", action="store_true", help="Always call the model instead of reusing identical renders from the render cache.")
     parser.add_argument("--data-dir", default="data/characters", help="Directory containing character JSON files.")
     
     args = parser.parse_args()
+    configure_logging()
     
     if args.num_images < 1:
         print("Error: --num-images must be at least 1.")
@@ -32,13 +42,22 @@ def main():
             print("Force mode enabled: Regenerating existing images.")
         if args.num_images > 1:
             print(f"Generating {args.num_images} images per angle.")
+        if args.num_images > IMAGEN_MAX_IMAGES_PER_CALL:
+            print(f"Split into {-(-args.num_images // IMAGEN_MAX_IMAGES_PER_CALL)} model calls of up to {IMAGEN_MAX_IMAGES_PER_CALL} per angle.")
             
-        image_refs = generate_character_references(args.character_id, args.data_dir, style_id=args.style, force=args.force, num_images=args.num_images, target_type=args.type)
+        image_refs = generate_character_references(args.character_id, args.data_dir, style_id=args.style, force=args.force, num_images=args.num_images, target_type=args.type, use_cache=not args.no_cache)
         print("\nSuccess!")
         print(f"Character images generated and saved. JSON updated.")
         for ref_type, path in image_refs.items():
             print(f"  - {ref_type}: {path}")
+        print(f"Render cache: {get_render_cache().stats()}")
             
+    except PartialRenderError as e:
+        print(f"Error: {e}")
+        print("Saved and recorded in the JSON (rerun without --force to fill in the rest):")
+        for ref_type, path in e.references.items():
+            print(f"  - {ref_type}: {path}")
+        sys.exit(1)
     except Exception as e:
         print(f"Error: {e}")
         sys.exit(1)
@@ -5,23 +5,41 @@ import os
 # Add backend to sys.path if needed
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "app")))
 
+from app.config import configure_metrics
+
+# Before the services import prometheus_client, so this process's metrics reach /metrics
+configure_metrics()
+
 from app.services.environment_refs import generate_environment_references
+from app.services.character_refs import PartialRenderError
+from app.logging_config import configure_logging
+from app.services.render_cache import get_render_cache
 
 def main():
     parser = argparse.ArgumentParser(description="Generate environment reference images for Veo.")
     parser.add_argument("environment_id", help="The ID of the environment (e.g., 'Neon_Alleway' if Neon_Alleway.json exists in data/environments/)")
+    parser.add_argument("--force", "-f", action="store_true", help="Force regeneration of images even if they exist.")
+    parser.add_argument("--no-cache", action="store_true", help="Always call the model instead of reusing identical renders from the render cache.")
     parser.add_argument("--data-dir", default="data/environments", help="Directory containing environment JSON files.")
     
     args = parser.parse_args()
+    configure_logging()
     
     try:
         print(f"Starting environment reference generation for: {args.environment_id}")
-        image_refs = generate_environment_references(args.environment_id, args.data_dir)
+        image_refs = generate_environment_references(args.environment_id, args.data_dir, force=args.force, use_cache=not args.no_cache)
         print("\nSuccess!")
         print(f"Environment images generated and saved. JSON updated.")
         for ref_type, path in image_refs.items():
             print(f"  - {ref_type}: {path}")
+        print(f"Render cache: {get_render_cache().stats()}")
             
+    except PartialRenderError as e:
+        print(f"Error: {e}")
+        print("Saved and recorded in the JSON (rerun without --force to fill in the rest):")
+        for ref_type, path in e.references.items():
+            print(f"  - {ref_type}: {path}")
+        sys.exit(1)
     except Exception as e:
         print(f"Error: {e}")
         sys.exit(1)
@@ -0,0 +1,63 @@
+import argparse
+import sys
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Add backend to sys.path if needed
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from app.config import configure_metrics
+
+# Before the services import prometheus_client, so this process's metrics reach /metrics
+configure_metrics()
+
+from app.logging_config import configure_logging
+from app.services.storage import get_storage
+from app.services.asset_index import get_asset_index
+from app.services.thumbnails import make_thumbnail, thumb_path, supported_formats, THUMB_SIZES, THUMB_FORMAT, THUMB_WORKERS
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill thumbnails for existing reference images.")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in THUMB_SIZES), help="Comma-separated edge lengths (default: all served sizes).")
+    parser.add_argument("--format", default=THUMB_FORMAT, help=f"Thumbnail format (default: {THUMB_FORMAT}).")
+    parser.add_argument("--workers", "-w", type=int, default=THUMB_WORKERS, help="Worker processes.")
+    parser.add_argument("--category", help="Only images in this category (e.g. characters).")
+
+    args = parser.parse_args()
+    configure_logging()
+
+    if args.format not in supported_formats():
+        print(f"Error: This Pillow build cannot encode {args.format}. Supported: {supported_formats()}")
+        sys.exit(1)
+    sizes = [int(s) for s in args.sizes.split(",")]
+
+    storage = get_storage()
+    assets, _ = get_asset_index().query(category=args.category, asset_type="image")
+    # Objects in a remote bucket have no file to hand the workers; /thumbs renders those on first request
+    local = [(asset["full_path"], storage.local_path(asset["full_path"])) for asset in assets]
+    local = [(key, path) for key, path in local if path is not None]
+    tasks = [
+        (path, thumb_path(key, storage.digest(key), size, args.format), size, args.format)
+        for key, path in local
+        for size in sizes
+    ]
+    if len(local) < len(assets):
+        print(f"Skipping {len(assets) - len(local)} remote image(s).")
+    print(f"Rendering up to {len(tasks)} thumbnail(s) for {len(local)} image(s) with {args.workers} worker(s)...")
+
+    failures = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(make_thumbnail, *task): task for task in tasks}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                failures += 1
+                print(f"Failed {futures[future][0]}: {e}")
+
+    print(f"\nDone. {len(tasks) - failures} thumbnail(s) up to date, {failures} failure(s).")
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import argparse
+import sys
+import os
+
+# Add backend to sys.path if needed
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from app.config import DATA_DIR, configure_metrics
+
+# Before the services import prometheus_client, so this process's metrics reach /metrics
+configure_metrics()
+
+from app.logging_config import configure_logging
+from app.services.asset_index import ASSET_TYPES
+from app.services.storage import get_storage, LocalStorage, ASSET_STORAGE
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy rendered assets from the data directory into the configured ASSET_STORAGE.")
+    parser.add_argument("--category", help="Only assets in this category (e.g. characters).")
+    parser.add_argument("--delete", action="store_true", help="Remove each file from the data directory once stored.")
+
+    args = parser.parse_args()
+    configure_logging()
+
+    target = get_storage(DATA_DIR)
+    if isinstance(target, LocalStorage):
+        print(f"ASSET_STORAGE is '{ASSET_STORAGE}': assets already live in {DATA_DIR}, nothing to migrate.")
+        return
+
+    source = LocalStorage(DATA_DIR)
+    assets = [
+        (key, size) for key, size, _, _ in source.list(f"{args.category}/" if args.category else "")
+        if os.path.splitext(key)[1].lower() in ASSET_TYPES
+    ]
+    print(f"Migrating {len(assets)} asset(s) to {ASSET_STORAGE} storage...")
+
+    copied = 0
+    for key, size in assets:
+        stat = target.stat(key)
+        if stat is None or stat[0] != size:
+            target.put_file(key, source.local_path(key))
+            copied += 1
+        if args.delete:
+            source.delete(key)
+
+    print(f"\nDone. {copied} copied, {len(assets) - copied} already present.")
+
+if __name__ == "__main__":
+    main()
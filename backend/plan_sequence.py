@@ -0,0 +1,69 @@
+import argparse
+import sys
+import os
+
+# Add backend to sys.path if needed
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from app.config import DATA_DIR, configure_metrics
+
+# Before the services import prometheus_client, so this process's metrics reach /metrics
+configure_metrics()
+
+from app.logging_config import configure_logging
+from app.services.catalog import get_catalog
+from app.services.jsonio import dumps
+from app.services.planner import plan_sequence, run_plan
+
+def main():
+    parser = argparse.ArgumentParser(description="Plan (and optionally render) the reference images a sequence needs.")
+    parser.add_argument("sequence_id", help="The ID of the sequence (e.g., 'opening_crawl' if opening_crawl.json exists in data/sequences/)")
+    parser.add_argument("--run", action="store_true", help="Render the plan instead of only printing it.")
+    parser.add_argument("--force", "-f", action="store_true", help="Plan every angle, even those already rendered.")
+    parser.add_argument("--no-cache", action="store_true", help="Always call the model instead of reusing identical renders from the render cache.")
+    parser.add_argument("--json", action="store_true", help="Print the plan as JSON.")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="Data directory containing sequences/, characters/, environments/ and styles/.")
+
+    args = parser.parse_args()
+    configure_logging()
+
+    sequence = get_catalog(args.data_dir).get("sequences", args.sequence_id)
+    if sequence is None:
+        print(f"Error: Sequence file not found: {args.sequence_id}")
+        sys.exit(1)
+    try:
+        plan = plan_sequence(sequence, args.data_dir, force=args.force, use_cache=not args.no_cache)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    if args.json:
+        print(dumps(plan))
+    else:
+        print(f"Sequence {args.sequence_id}: {len(plan['scenes'])} scene(s), {len(plan['tasks'])} task(s) to render, {len(plan['complete'])} up to date.")
+        for task in plan["tasks"]:
+            print(f"  - {task['task_id']}: {', '.join(task['types'])} "
+                  f"({task['model_calls']} call(s), {task['cache_hits']} cached, {task['existing']} on disk)")
+        waiting = [scene["scene_id"] for scene in plan["scenes"] if not scene["ready"]]
+        if waiting:
+            print(f"Scenes waiting on references: {', '.join(waiting)}")
+        print(f"Model calls: {plan['model_calls']} at {plan['quota_rpm']} rpm, up to {plan['parallelism']} at once; "
+              f"estimated {plan['estimated_seconds']}s.")
+
+    if not args.run or not plan["tasks"]:
+        return
+    print("\nRendering...")
+    errors = 0
+    for event in run_plan(plan, args.data_dir, force=args.force, use_cache=not args.no_cache):
+        if event["status"] == "image":
+            print(f"  + {event['kind']} {event['id']} {event['type']} ({event['source']})")
+        elif event["status"] == "error":
+            errors += 1
+            print(f"  ! {event['kind']} {event['id']}: {event['detail']}")
+        elif event["status"] == "done":
+            print(f"\nDone. {event['images']} image(s), {event['errors']} error(s) in {event['elapsed']}s.")
+    if errors:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import argparse
+import sys
+import os
+
+# Add backend to sys.path if needed
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from app.config import DATA_DIR, configure_metrics
+
+# Before the services import prometheus_client, so this process's metrics reach /metrics
+configure_metrics()
+
+from app.logging_config import configure_logging
+from app.services.jsonio import dumps
+from app.services.planner import reference_status, plan_stale, run_plan, adopt_untracked
+
+def main():
+    parser = argparse.ArgumentParser(description="List reference images whose sheet, style or prompt template changed since they were rendered.")
+    parser.add_argument("--all", action="store_true", help="List up-to-date and untracked images too.")
+    parser.add_argument("--json", action="store_true", help="Print the status rows as JSON.")
+    parser.add_argument("--render", action="store_true", help="Re-render exactly the stale and missing images.")
+    parser.add_argument("--adopt", action="store_true", help="Accept untracked images (rendered before tracking) as up to date.")
+    parser.add_argument("--no-cache", action="store_true", help="Always call the model instead of reusing identical renders from the render cache.")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="Data directory containing characters/, environments/ and styles/.")
+
+    args = parser.parse_args()
+    configure_logging()
+
+    if args.adopt:
+        print(f"Adopted {adopt_untracked(args.data_dir)} untracked image(s).")
+
+    rows = reference_status(args.data_dir)
+    if args.json:
+        print(dumps([row for row in rows if args.all or row["status"] in ("stale", "missing")]))
+    else:
+        for row in rows:
+            if args.all or row["status"] in ("stale", "missing"):
+                why = f" ({', '.join(row['reasons'])} changed)" if row["reasons"] else ""
+                print(f"{row['status']:<9} {row['key']}{why}")
+        counts = {}
+        for row in rows:
+            counts[row["status"]] = counts.get(row["status"], 0) + 1
+        print(f"\n{len(rows)} image(s): " + ", ".join(f"{n} {status}" for status, n in sorted(counts.items())) if rows else "No recorded reference images.")
+
+    if not args.render:
+        return
+    plan = plan_stale(args.data_dir, use_cache=not args.no_cache)
+    if not plan["tasks"]:
+        print("Nothing to re-render.")
+        return
+    print(f"\nRe-rendering {len(plan['tasks'])} sheet(s): {plan['model_calls']} model call(s), "
+          f"{plan['cache_hits']} from the render cache, estimated {plan['estimated_seconds']}s...")
+    errors = 0
+    for event in run_plan(plan, args.data_dir, use_cache=not args.no_cache):
+        if event["status"] == "image":
+            print(f"  + {event['kind']} {event['id']} {event['type']} ({event['source']})")
+        elif event["status"] == "error":
+            errors += 1
+            print(f"  ! {event['kind']} {event['id']}: {event['detail']}")
+        elif event["status"] == "done":
+            print(f"\nDone. {event['images']} image(s), {event['errors']} error(s) in {event['elapsed']}s.")
+    if errors:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
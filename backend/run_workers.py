@@ -0,0 +1,39 @@
+import argparse
+import sys
+import os
+
+# Add backend to sys.path if needed
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from app.config import configure_metrics
+
+# Before the services import prometheus_client, so this process's metrics reach /metrics
+configure_metrics()
+
+from app.logging_config import configure_logging
+from app.services.jobs import WorkerPool, JOB_WORKERS, JOB_DB_PATH
+
+def main():
+    parser = argparse.ArgumentParser(description="Run job worker processes that drain the generation queue.")
+    parser.add_argument("--workers", "-w", type=int, default=JOB_WORKERS or 1, help="Number of worker processes (default: JOB_WORKERS or 1).")
+    parser.add_argument("--db", default=JOB_DB_PATH, help="Path to the job queue database.")
+
+    args = parser.parse_args()
+    configure_logging()
+
+    if args.workers < 1:
+        print("Error: --workers must be at least 1.")
+        sys.exit(1)
+
+    pool = WorkerPool(args.workers, db_path=args.db)
+    pool.start()
+    print(f"Started {args.workers} job worker(s) on {args.db}. Press Ctrl+C to stop.")
+    try:
+        pool.join()
+    except KeyboardInterrupt:
+        print("\nStopping workers...")
+    finally:
+        pool.stop()
+
+if __name__ == "__main__":
+    main()
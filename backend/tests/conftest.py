@@ -0,0 +1,25 @@
+import os
+import sys
+import tempfile
+
+# Set before any app module reads its settings: state and data stay in
+# throwaway directories and nothing ever calls Vertex
+os.environ["MOVE37_STATE_DIR"] = tempfile.mkdtemp(prefix="move37-test-state-")
+os.environ["MOVE37_DATA_DIR"] = tempfile.mkdtemp(prefix="move37-test-data-")
+os.environ["GENERATION_BACKEND"] = "fake"
+os.environ["JOB_WORKERS"] = "0"
+os.environ["THUMB_EAGER_SIZES"] = ""
+# Fake model calls return at once and are not paced like the real quota
+os.environ["FAKE_IMAGEN_LATENCY"] = "fixed:0"
+os.environ["FAKE_GEMINI_LATENCY"] = "fixed:0"
+os.environ["IMAGEN_RPM"] = "6000"
+os.environ["IMAGEN_BURST"] = "10"
+os.environ["GEMINI_RPM"] = "6000"
+os.environ["GEMINI_BURST"] = "10"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import configure_metrics  # noqa: E402
+
+# As at app startup: metrics go to the throwaway state directory, shared with subprocesses
+configure_metrics()
@@ -0,0 +1,175 @@
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from app.services.asset_index import AssetIndex
+from app.services.static_assets import file_digest
+
+FILES = [
+    "characters/juri_refs/noir/head.jpg",
+    "characters/juri_refs/noir/side.jpg",
+    "characters/juri_refs/anime/head.jpg",
+    "characters/kaelen_refs/noir/head.png",
+    "environments/dojo_refs/wide.jpg",
+    "videos/opening.mp4",
+]
+
+
+@pytest.fixture
+def root(tmp_path):
+    root = tmp_path / "data"
+    for rel_path in FILES:
+        path = root / rel_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x")
+    (root / "characters" / "juri.json").write_text("{}")
+    (root / "characters" / ".hidden.jpg").write_bytes(b"x")
+    return root
+
+
+@pytest.fixture
+def index(root, tmp_path):
+    return AssetIndex(str(root), str(tmp_path / "state" / "asset_index.json"), refresh_interval=0)
+
+
+def paths(assets):
+    return [asset["full_path"] for asset in assets]
+
+
+def bump_mtime(path):
+    """Directory mtimes can be coarse; make a change visible regardless."""
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_lists_assets_sorted_by_path(index):
+    assets, next_cursor = index.query()
+    assert paths(assets) == sorted(FILES)
+    assert next_cursor is None
+
+
+def test_records_describe_owner_and_style(index, root):
+    assets, _ = index.query(character="kaelen")
+    assert assets == [{
+        "path": "/static/characters/kaelen_refs/noir/head.png",
+        "url": f"/static-v/{file_digest(str(root / 'characters/kaelen_refs/noir/head.png'))}/characters/kaelen_refs/noir/head.png",
+        "name": "head.png",
+        "type": "image",
+        "full_path": "characters/kaelen_refs/noir/head.png",
+        "category": "characters",
+        "character": "kaelen",
+        "environment": None,
+        "style": "noir",
+    }]
+
+
+@pytest.mark.parametrize("filters, expected", [
+    ({"category": "environments"}, ["environments/dojo_refs/wide.jpg"]),
+    ({"environment": "dojo"}, ["environments/dojo_refs/wide.jpg"]),
+    ({"character": "juri", "style": "noir"}, ["characters/juri_refs/noir/head.jpg", "characters/juri_refs/noir/side.jpg"]),
+    ({"asset_type": "video"}, ["videos/opening.mp4"]),
+    ({"style": "watercolor"}, []),
+])
+def test_filters(index, filters, expected):
+    assets, _ = index.query(**filters)
+    assert paths(assets) == expected
+
+
+def test_cursor_pages_through_every_asset(index):
+    seen, cursor = [], None
+    while True:
+        assets, cursor = index.query(limit=4, cursor=cursor)
+        seen += paths(assets)
+        if cursor is None:
+            break
+    assert seen == sorted(FILES)
+
+
+def test_cursor_is_stable_across_inserts(index, root):
+    first, cursor = index.query(limit=2)
+    # An asset sorting before the cursor doesn't shift the next page
+    (root / "characters" / "juri_refs" / "anime" / "back.jpg").write_bytes(b"x")
+    second, _ = index.query(limit=2, cursor=cursor)
+    assert paths(second) == sorted(FILES)[2:4]
+
+
+def test_refresh_picks_up_added_and_removed_files(index, root):
+    index.query()
+    refs = root / "characters" / "juri_refs" / "noir"
+    (refs / "back.jpg").write_bytes(b"x")
+    (refs / "side.jpg").unlink()
+    bump_mtime(refs)
+
+    assets, _ = index.query(character="juri", style="noir")
+    assert paths(assets) == ["characters/juri_refs/noir/back.jpg", "characters/juri_refs/noir/head.jpg"]
+
+
+def test_removed_directory_drops_its_assets(index, root):
+    index.query()
+    for name in os.listdir(root / "environments" / "dojo_refs"):
+        os.remove(root / "environments" / "dojo_refs" / name)
+    os.rmdir(root / "environments" / "dojo_refs")
+    bump_mtime(root / "environments")
+
+    assets, _ = index.query(category="environments")
+    assert assets == []
+
+
+def test_replaced_file_gets_a_new_url(index, root):
+    old_url = index.query(environment="dojo")[0][0]["url"]
+    image = root / "environments" / "dojo_refs" / "wide.jpg"
+    image.unlink()
+    image.write_bytes(b"regenerated")
+    bump_mtime(image.parent)
+
+    assert index.query(environment="dojo")[0][0]["url"] != old_url
+
+
+def test_refresh_is_deferred_within_the_interval(root, tmp_path):
+    index = AssetIndex(str(root), str(tmp_path / "asset_index.json"), refresh_interval=3600)
+    index.query()
+    (root / "videos" / "ending.mp4").write_bytes(b"x")
+    bump_mtime(root / "videos")
+
+    assert "videos/ending.mp4" not in paths(index.query()[0])
+    index.refresh(force=True)
+    assert "videos/ending.mp4" in paths(index.query()[0])
+
+
+def test_restart_starts_from_the_snapshot(index, root, tmp_path, monkeypatch):
+    index.query()
+    listed = []
+    real_scandir = os.scandir
+    monkeypatch.setattr(os, "scandir", lambda path: listed.append(path) or real_scandir(path))
+
+    restarted = AssetIndex(str(root), index.snapshot_path, refresh_interval=0)
+    assert paths(restarted.query()[0]) == sorted(FILES)
+    # Nothing changed on disk, so no directory is listed again
+    assert listed == []
+
+
+class TestEndpoint:
+    @pytest.fixture
+    def client(self, index, monkeypatch):
+        monkeypatch.setattr(main, "get_asset_index", lambda: index)
+        return TestClient(main.app)
+
+    def test_next_cursor_header(self, client):
+        first = client.get("/assets", params={"limit": 5})
+        assert len(first.json()) == 5
+        second = client.get("/assets", params={"limit": 5, "cursor": first.headers["X-Next-Cursor"]})
+        assert paths(first.json() + second.json()) == sorted(FILES)
+        assert "X-Next-Cursor" not in second.headers
+
+    def test_full_list_without_limit(self, client):
+        response = client.get("/assets")
+        assert paths(response.json()) == sorted(FILES)
+        assert "X-Next-Cursor" not in response.headers
+
+    def test_invalid_cursor(self, client):
+        assert client.get("/assets", params={"cursor": "_w=="}).status_code == 400
+
+    def test_invalid_type(self, client):
+        assert client.get("/assets", params={"type": "audio"}).status_code == 422
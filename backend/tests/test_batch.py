@@ -0,0 +1,169 @@
+import json
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from app.services import character_refs, environment_refs, static_assets, storage
+from app.services.character_refs import generate_character_references
+from app.services.batch import expand_matrix, iter_batch
+from app.services.render_cache import RenderCache
+
+SHEETS = {
+    "characters": {
+        "juri": {"name": "Juri", "physical_traits": {"hair": "Pink"}, "style_id": "noir"},
+        "kaelen": {"name": "Kaelen", "clothing": "Grey cloak", "style_id": "noir"},
+    },
+    "environments": {"dojo": {"location": "a rooftop dojo"}},
+    "styles": {"noir": {"art_style": "Film noir"}, "anime": {"art_style": "Anime"}},
+}
+
+
+class StubImage:
+    def save(self, location, include_generation_parameters=False):
+        with open(location, "wb") as f:
+            f.write(location.encode())
+
+
+class StubModel:
+    """Stands in for ImageGenerationModel; prompts containing 'fail_on' raise."""
+
+    def __init__(self):
+        self.calls = []
+        self.fail_on = None
+        self._lock = threading.Lock()
+
+    def generate_images(self, prompt, number_of_images=1, **kwargs):
+        with self._lock:
+            self.calls.append(prompt)
+        if self.fail_on and self.fail_on in prompt:
+            raise RuntimeError("500 INTERNAL")
+        return [StubImage() for _ in range(number_of_images)]
+
+
+@pytest.fixture
+def model(tmp_path, monkeypatch):
+    model = StubModel()
+    cache = RenderCache(root=str(tmp_path / "render_cache"))
+    for module in (character_refs, environment_refs):
+        monkeypatch.setattr(module, "get_imagen_model", lambda *args, **kwargs: model)
+        monkeypatch.setattr(module, "get_render_cache", lambda: cache)
+    return model
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    root = tmp_path / "data"
+    for category, sheets in SHEETS.items():
+        (root / category).mkdir(parents=True)
+        for file_id, sheet in sheets.items():
+            (root / category / f"{file_id}.json").write_text(json.dumps(sheet))
+    monkeypatch.setattr(main, "DATA_DIR", str(root))
+    monkeypatch.setattr(storage, "DATA_DIR", str(root))
+    monkeypatch.setattr(storage, "_storages", {})
+    return root
+
+
+@pytest.fixture
+def client(data_dir, model):
+    return TestClient(main.app)
+
+
+def read_sheet(data_dir, category, file_id):
+    with open(data_dir / category / f"{file_id}.json") as f:
+        return json.load(f)
+
+
+def events(response):
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_characters_expand_per_style(data_dir):
+    tasks = expand_matrix(["juri", "kaelen"], ["dojo"], ["noir", "anime"], data_dir=str(data_dir))
+    assert [(t["kind"], t["id"], t["style_id"]) for t in tasks] == [
+        ("character", "juri", "noir"), ("character", "kaelen", "noir"),
+        ("character", "juri", "anime"), ("character", "kaelen", "anime"),
+        ("environment", "dojo", None),
+    ]
+
+
+def test_types_apply_to_matching_sheets(data_dir):
+    tasks = expand_matrix(["juri"], ["dojo"], types=["head", "wide"], data_dir=str(data_dir))
+    assert [(t["id"], t["types"]) for t in tasks] == [("juri", ["head"]), ("dojo", ["wide"])]
+    # Only character types: environments have nothing to render
+    assert [t["id"] for t in expand_matrix(["juri"], ["dojo"], types=["head"], data_dir=str(data_dir))] == ["juri"]
+
+
+@pytest.mark.parametrize("kwargs, message", [
+    ({"character_ids": ["ryu"]}, "Unknown characters: ryu"),
+    ({"character_ids": ["juri"], "style_ids": ["pastel"]}, "Unknown styles: pastel"),
+    ({"character_ids": ["juri"], "types": ["front"]}, "Invalid reference type: front"),
+])
+def test_invalid_requests(data_dir, kwargs, message):
+    with pytest.raises(ValueError, match=message):
+        expand_matrix(data_dir=str(data_dir), **kwargs)
+
+
+def test_styles_of_one_character_all_land_in_its_sheet(data_dir, model):
+    tasks = expand_matrix(["juri"], style_ids=["noir", "anime"], types=["head"], data_dir=str(data_dir))
+    list(iter_batch(tasks, str(data_dir)))
+
+    refs = read_sheet(data_dir, "characters", "juri")["reference_images"]
+    assert refs == {"noir": {"head": "juri_refs/noir/head.jpg"}, "anime": {"head": "juri_refs/anime/head.jpg"}}
+
+
+def test_streams_one_line_per_angle(client, model):
+    response = client.post("/batch-render", json={"character_ids": ["juri", "kaelen"], "environment_ids": ["dojo"], "types": ["head", "wide"]})
+    assert response.headers["content-type"] == "application/x-ndjson"
+
+    lines = events(response)
+    assert lines[0] == {"status": "started", "tasks": 3}
+    images = sorted((e["id"], e["type"], e["source"]) for e in lines if e["status"] == "image")
+    assert images == [("dojo", "wide", "generated"), ("juri", "head", "generated"), ("kaelen", "head", "generated")]
+    assert lines[-1]["status"] == "done"
+    assert (lines[-1]["images"], lines[-1]["errors"]) == (3, 0)
+    assert len(model.calls) == 3
+
+
+def test_image_lines_carry_versioned_urls(client, data_dir):
+    lines = events(client.post("/batch-render", json={"character_ids": ["juri"], "types": ["head"]}))
+    image, = [e for e in lines if e["status"] == "image"]
+    assert image["paths"] == ["characters/juri_refs/noir/head.jpg"]
+    assert image["urls"] == [static_assets.versioned_url("characters/juri_refs/noir/head.jpg")]
+
+
+def test_existing_angles_are_not_rendered_again(client, model):
+    client.post("/batch-render", json={"character_ids": ["juri"], "types": ["head"]})
+    lines = events(client.post("/batch-render", json={"character_ids": ["juri"], "types": ["head", "side"]}))
+
+    sources = {e["type"]: e["source"] for e in lines if e["status"] == "image"}
+    assert sources == {"head": "existing", "side": "generated"}
+    assert len(model.calls) == 2
+
+
+def test_recorded_variant_counts_are_kept(data_dir, model):
+    generate_character_references("kaelen", str(data_dir / "characters"), num_images=4, target_type="head")
+    tasks = expand_matrix(["kaelen"], types=["head", "side"], data_dir=str(data_dir))
+    list(iter_batch(tasks, str(data_dir), force=True, use_cache=False))
+
+    refs = read_sheet(data_dir, "characters", "kaelen")["reference_images"]["noir"]
+    assert refs["head"] == [f"kaelen_refs/noir/head_{i}.jpg" for i in range(1, 5)]
+    # Angles the sheet doesn't have yet get one image
+    assert refs["side"] == "kaelen_refs/noir/side.jpg"
+    assert len(model.calls) == 3
+
+
+def test_failed_sheet_does_not_stop_the_others(client, model):
+    model.fail_on = "Kaelen"
+    lines = events(client.post("/batch-render", json={"character_ids": ["juri", "kaelen"], "types": ["head"]}))
+
+    error, = [e for e in lines if e["status"] == "error"]
+    assert (error["id"], error["detail"]) == ("kaelen", "500 INTERNAL")
+    assert [e["id"] for e in lines if e["status"] == "image"] == ["juri"]
+    assert (lines[-1]["images"], lines[-1]["errors"]) == (1, 1)
+
+
+@pytest.mark.parametrize("body", [{}, {"character_ids": ["ryu"]}])
+def test_rejects_empty_and_unknown(client, body):
+    assert client.post("/batch-render", json=body).status_code == 400
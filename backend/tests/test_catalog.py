@@ -0,0 +1,95 @@
+import os
+import json
+
+import pytest
+
+from app.services.catalog import DataCatalog, catalog_for_dir
+
+
+@pytest.fixture
+def root(tmp_path):
+    (tmp_path / "characters").mkdir()
+    write(tmp_path, "juri", {"name": "Juri"})
+    return tmp_path
+
+
+def write(root, file_id, sheet, category="characters"):
+    path = root / category / f"{file_id}.json"
+    path.write_text(json.dumps(sheet))
+    return path
+
+
+def touch_later(path):
+    """Move a file's mtime forward, as a later edit would."""
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+def test_get_parses_once_and_shares_the_result(root):
+    catalog = DataCatalog(str(root), stat_interval=0)
+    assert catalog.get("characters", "juri") == {"name": "Juri"}
+    assert catalog.get("characters", "juri.json") is catalog.get("characters", "juri")
+    assert catalog.get("characters", "kaelen") is None
+
+
+def test_changed_file_is_reread(root):
+    catalog = DataCatalog(str(root), stat_interval=0)
+    catalog.get("characters", "juri")
+    touch_later(write(root, "juri", {"name": "Juri Han"}))
+    assert catalog.get("characters", "juri") == {"name": "Juri Han"}
+
+
+def test_unchanged_file_is_not_reread(root, monkeypatch):
+    catalog = DataCatalog(str(root), stat_interval=0)
+    catalog.get("characters", "juri")
+
+    def fail(*args, **kwargs):
+        raise AssertionError("file read again")
+
+    monkeypatch.setattr("builtins.open", fail)
+    assert catalog.get("characters", "juri") == {"name": "Juri"}
+
+
+def test_stat_interval_defers_checks_until_invalidated(root):
+    catalog = DataCatalog(str(root), stat_interval=60)
+    catalog.get("characters", "juri")
+    touch_later(write(root, "juri", {"name": "Juri Han"}))
+
+    assert catalog.get("characters", "juri") == {"name": "Juri"}
+    catalog.invalidate("characters", "juri")
+    assert catalog.get("characters", "juri") == {"name": "Juri Han"}
+
+
+def test_deleted_file_disappears(root):
+    catalog = DataCatalog(str(root), stat_interval=0)
+    catalog.get("characters", "juri")
+    os.remove(root / "characters" / "juri.json")
+    assert catalog.get("characters", "juri") is None
+
+
+def test_get_copy_is_private(root):
+    catalog = DataCatalog(str(root), stat_interval=0)
+    copy = catalog.get_copy("characters", "juri")
+    copy["name"] = "Changed"
+    assert catalog.get("characters", "juri") == {"name": "Juri"}
+
+
+def test_listing_follows_the_directory(root):
+    catalog = DataCatalog(str(root), stat_interval=0)
+    assert catalog.list_files("characters") == ["juri.json"]
+    write(root, "kaelen", {"name": "Kaelen"})
+    touch_later(root / "characters")
+    assert catalog.list_files("characters") == ["juri.json", "kaelen.json"]
+    assert catalog.list_files("environments") == []
+
+
+def test_index_skips_invalid_sheets(root):
+    (root / "characters" / "broken.json").write_text("{not json")
+    catalog = DataCatalog(str(root), stat_interval=0)
+    assert catalog.index("characters") == {"juri": {"name": "Juri"}}
+
+
+def test_catalog_for_dir(root):
+    catalog, category = catalog_for_dir(str(root / "characters"))
+    assert (catalog.root, category) == (str(root), "characters")
+    assert catalog_for_dir(str(root / "characters"))[0] is catalog
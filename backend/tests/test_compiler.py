@@ -0,0 +1,95 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.services import catalog
+from app.services.catalog import get_catalog
+from app.services.compiler import iter_sequence
+from app.services.parser import parse_scene
+
+SHEETS = {
+    "characters": {
+        "juri": {"name": "Juri", "physical_traits": {"hair": "Pink"}, "style_id": "noir", "negative_prompt": "glasses"},
+        "kaelen": {"name": "Kaelen", "clothing": "Grey {hooded} cloak", "style_id": "noir"},
+    },
+    "environments": {"dojo": {"location": "a rooftop dojo", "weather": "light rain"}},
+    "styles": {"noir": {"art_style": "Film noir", "lighting": "hard", "camera_language": {"lens": "35mm"}}},
+    "cinematography": {"default": {"close_up": "Close-up shot"}},
+}
+SCENES = [
+    {"scene_id": "intro", "character_id": "juri", "environment_id": "dojo", "cinematography": "close_up", "action": "bowing"},
+    {"character_id": "kaelen", "environment_id": "dojo", "negative_prompt": "blurry"},
+    {"character_id": "juri", "environment_id": "dojo", "style_id": "noir", "negative_prompt": "glasses"},
+]
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    for category, sheets in SHEETS.items():
+        (tmp_path / category).mkdir()
+        for file_id, sheet in sheets.items():
+            (tmp_path / category / f"{file_id}.json").write_text(json.dumps(sheet))
+    (tmp_path / "sequences").mkdir()
+    (tmp_path / "sequences" / "opening.json").write_text(json.dumps({"scenes": SCENES}))
+    monkeypatch.setattr(catalog, "DATA_DIR", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def client(data_dir, monkeypatch):
+    from app import main
+
+    monkeypatch.setattr(main, "catalog", get_catalog(str(data_dir)))
+    with TestClient(main.app) as client:
+        yield client
+
+
+def records(response):
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_prompts_match_parse_scene(data_dir):
+    compiled = list(iter_sequence(SCENES))
+    assert [prompt for _, prompt, _ in compiled] == [parse_scene(scene) for scene in SCENES]
+
+
+def test_scene_ids_and_negative_prompts(data_dir):
+    compiled = list(iter_sequence(SCENES))
+    assert [scene_id for scene_id, _, _ in compiled] == ["intro", "002", "003"]
+    # Scene and character negatives are merged without repeats
+    assert [negative for _, _, negative in compiled] == ["glasses", "blurry", "glasses"]
+
+
+def test_scenes_are_compiled_lazily(data_dir):
+    def scenes():
+        yield SCENES[0]
+        raise AssertionError("read ahead of the consumer")
+
+    assert next(iter_sequence(scenes()))[0] == "intro"
+
+
+def test_endpoint_streams_one_record_per_scene(client):
+    response = client.post("/compile/sequence", json={"scenes": SCENES})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert records(response) == [
+        {"scene_id": scene_id, "prompt": prompt, "negative_prompt": negative}
+        for scene_id, prompt, negative in iter_sequence(SCENES)
+    ]
+
+
+def test_endpoint_loads_a_sequence_by_id(client):
+    response = client.post("/compile/sequence", json={"sequence_id": "opening"})
+    assert [record["scene_id"] for record in records(response)] == ["intro", "002", "003"]
+
+
+def test_endpoint_streams_long_sequences_whole(client):
+    scenes = [dict(SCENES[i % 3], scene_id=f"s{i}") for i in range(3000)]
+    response = client.post("/compile/sequence", json={"scenes": scenes})
+    assert [record["scene_id"] for record in records(response)] == [f"s{i}" for i in range(3000)]
+
+
+def test_endpoint_errors(client):
+    assert client.post("/compile/sequence", json={"sequence_id": "missing"}).status_code == 404
+    assert client.post("/compile/sequence", json={}).status_code == 400
@@ -0,0 +1,108 @@
+import io
+import json
+
+import pytest
+from PIL import Image
+
+from app.services import fake_backend, model_registry
+from app.services.fake_backend import (
+    FakeAPIError, FakeImageGenerationModel, FakeGenerativeModel, FakeGeneratedImage, parse_latency, synthetic_jpeg,
+)
+from app.services.quota import is_quota_error
+
+
+class MaxRng:
+    """Returns the top of every range, so specs can be checked without sampling."""
+
+    def uniform(self, low, high):
+        return high
+
+    def gauss(self, mu, sigma):
+        return mu - 10 * sigma
+
+    def lognormvariate(self, mu, sigma):
+        import math
+        return math.exp(mu)
+
+
+@pytest.mark.parametrize("spec, seconds", [
+    ("fixed:800", 0.8),
+    ("uniform:200,1200", 1.2),
+    # Clipped at zero
+    ("normal:800,150", 0.0),
+    # Median of the distribution
+    ("lognormal:800,0.5", 0.8),
+])
+def test_parse_latency(spec, seconds):
+    assert parse_latency(spec)(MaxRng()) == pytest.approx(seconds)
+
+
+@pytest.mark.parametrize("spec", ["fixed", "uniform:200", "pareto:1,2", ""])
+def test_parse_latency_rejects_bad_specs(spec):
+    with pytest.raises(ValueError):
+        parse_latency(spec)
+
+
+def test_synthetic_jpeg_follows_the_seed():
+    assert synthetic_jpeg("a knight", size=32) == synthetic_jpeg("a knight", size=32)
+    assert synthetic_jpeg("a knight", size=32) != synthetic_jpeg("a dragon", size=32)
+    with Image.open(io.BytesIO(synthetic_jpeg("a knight", size=32))) as img:
+        assert (img.format, img.size) == ("JPEG", (32, 32))
+
+
+def test_padded_jpeg_still_decodes():
+    data = synthetic_jpeg("a knight", size=32, pad_to=50_000)
+    assert len(data) == 50_000
+    with Image.open(io.BytesIO(data)) as img:
+        img.load()
+
+
+def test_saved_image_is_reencoded_for_other_extensions(tmp_path):
+    image = FakeGeneratedImage(synthetic_jpeg("a knight", size=32))
+    image.save(str(tmp_path / "head.jpg"))
+    image.save(str(tmp_path / "head.png"))
+    assert (tmp_path / "head.jpg").read_bytes() == synthetic_jpeg("a knight", size=32)
+    with Image.open(tmp_path / "head.png") as img:
+        assert img.format == "PNG"
+
+
+def test_image_model_returns_the_requested_count():
+    model = FakeImageGenerationModel("imagen-3", latency="fixed:0")
+    images = model.generate_images("a knight", number_of_images=3, negative_prompt="blurry")
+    assert len(images) == 3
+    assert len({image._image_bytes for image in images}) == 3
+
+
+@pytest.mark.parametrize("count", [0, 5])
+def test_image_model_caps_images_per_call(count):
+    with pytest.raises(FakeAPIError) as raised:
+        FakeImageGenerationModel("imagen-3", latency="fixed:0").generate_images("a knight", number_of_images=count)
+    assert raised.value.code == 400
+
+
+@pytest.mark.parametrize("rate_429, rate_500, code", [(1.0, 0.0, 429), (0.0, 1.0, 500)])
+def test_injected_errors(monkeypatch, rate_429, rate_500, code):
+    monkeypatch.setattr(fake_backend, "FAKE_ERROR_RATE_429", rate_429)
+    monkeypatch.setattr(fake_backend, "FAKE_ERROR_RATE_500", rate_500)
+    with pytest.raises(FakeAPIError) as raised:
+        FakeImageGenerationModel("imagen-3", latency="fixed:0").generate_images("a knight")
+    assert raised.value.code == code
+    # The governor retries 429s exactly as it would Vertex's
+    assert is_quota_error(raised.value) is (code == 429)
+
+
+def test_gemini_answers_with_a_character_sheet():
+    response = FakeGenerativeModel("gemini", latency="fixed:0").generate_content(["system", "grizzled detective in the rain"])
+    sheet = json.loads(response.text)
+    assert sheet["name"] == "Grizzled Detective"
+    assert sheet["extra_details"] == "grizzled detective in the rain"
+
+
+def test_registry_hands_out_fakes(monkeypatch):
+    monkeypatch.setattr(model_registry, "_clients", {})
+    monkeypatch.setattr(model_registry, "_initialized", False)
+    assert isinstance(model_registry.get_imagen_model(), FakeImageGenerationModel)
+    assert isinstance(model_registry.get_gemini_model(), FakeGenerativeModel)
+    # Vertex is never initialized in fake mode
+    assert model_registry._initialized is False
+    assert model_registry.IMAGEN_RENDER_ID == f"fake:{model_registry.IMAGEN_MODEL_ID}"
@@ -0,0 +1,82 @@
+import json
+
+import pytest
+from PIL import Image
+
+from app.services.image_output import OutputFormat, output_format, write_image, DEFAULT_OUTPUT
+from app.services.character_refs import generate_character_references
+from app.services.fake_backend import FakeGeneratedImage, synthetic_jpeg
+
+
+def image():
+    return FakeGeneratedImage(synthetic_jpeg("a knight", size=64))
+
+
+@pytest.mark.parametrize("fmt, cache_id", [
+    (OutputFormat("jpeg"), "jpg"),
+    (OutputFormat("jpg"), "jpg"),
+    (OutputFormat("jpeg", quality=85, progressive=True), "jpg:q85:progressive"),
+    (OutputFormat("webp", quality=90), "webp:q90"),
+    (OutputFormat("webp", lossless=True), "webp:lossless"),
+    (OutputFormat("png"), "png"),
+    # Options that don't apply to a format are dropped
+    (OutputFormat("png", progressive=True, lossless=True), "png"),
+])
+def test_cache_id_names_every_option(fmt, cache_id):
+    assert fmt.cache_id == cache_id
+
+
+@pytest.mark.parametrize("kwargs", [{"format": "gif"}, {"format": "webp", "quality": 0.5}, {"format": "jpeg", "quality": 101}])
+def test_invalid_formats_are_rejected(kwargs):
+    with pytest.raises(ValueError):
+        OutputFormat(**kwargs)
+
+
+def test_style_output_block_overrides_the_defaults():
+    fmt = output_format({"style_id": "noir", "output": {"format": "webp", "quality": 90}})
+    assert (fmt.format, fmt.quality, fmt.ext) == ("webp", 90, "webp")
+    assert output_format({"style_id": "noir"}) is DEFAULT_OUTPUT
+    assert output_format(None) is DEFAULT_OUTPUT
+
+
+@pytest.mark.parametrize("fmt, pil_format", [
+    (OutputFormat("jpeg", quality=80, progressive=True), "JPEG"),
+    (OutputFormat("webp", quality=80), "WEBP"),
+    (OutputFormat("png"), "PNG"),
+])
+def test_write_image_encodes_the_format(tmp_path, fmt, pil_format):
+    path = str(tmp_path / f"head.{fmt.ext}")
+    write_image(image(), path, fmt)
+    with Image.open(path) as img:
+        assert img.format == pil_format
+        assert img.size == (64, 64)
+
+
+def test_passthrough_jpeg_is_written_unchanged(tmp_path):
+    path = tmp_path / "head.jpg"
+    write_image(image(), str(path))
+    assert path.read_bytes() == synthetic_jpeg("a knight", size=64)
+
+
+def test_generation_parameters_survive_reencoding(tmp_path):
+    generated = image()
+    generated.generation_parameters = {"prompt": "a knight"}
+    path = str(tmp_path / "head.webp")
+    write_image(generated, path, OutputFormat("webp"))
+    with Image.open(path) as img:
+        assert "a knight" in img.getexif()[0x9286]
+
+
+def test_style_format_applies_to_references(tmp_path):
+    root = tmp_path / "data"
+    for category, file_id, sheet in (
+        ("characters", "juri", {"name": "Juri", "style_id": "noir"}),
+        ("styles", "noir", {"art_style": "Film noir", "output": {"format": "webp", "quality": 85}}),
+    ):
+        (root / category).mkdir(parents=True)
+        (root / category / f"{file_id}.json").write_text(json.dumps(sheet))
+
+    refs = generate_character_references("juri", str(root / "characters"), target_types=["head"], use_cache=False)
+    assert refs == {"head": "juri_refs/noir/head.webp"}
+    with Image.open(root / "characters" / refs["head"]) as img:
+        assert img.format == "WEBP"
@@ -0,0 +1,98 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from app.services import static_assets, storage
+from app.services.jobs import JobQueue
+
+HEAD = "juri_refs/noir/head.jpg"
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setattr(main, "job_queue", queue)
+    return queue
+
+
+@pytest.fixture
+def client(queue, tmp_path, monkeypatch):
+    image = tmp_path / "data" / "characters" / HEAD
+    image.parent.mkdir(parents=True)
+    image.write_bytes(b"jpeg")
+    monkeypatch.setattr(storage, "DATA_DIR", str(tmp_path / "data"))
+    monkeypatch.setattr(storage, "_storages", {})
+    return TestClient(main.app)
+
+
+def finished_job(queue, *events, error=None):
+    """A job that ran to the end and recorded the given events."""
+    job_id = queue.enqueue("character", {"character_id": "juri"})
+    queue.claim("w1")
+    for event in events:
+        queue.add_event(job_id, event)
+    if error:
+        queue.fail(job_id, "w1", error)
+    else:
+        queue.complete(job_id, "w1", {"head": HEAD})
+    return job_id
+
+
+def parse(body: str):
+    """SSE messages as (id, event, data) tuples; id is None when not sent."""
+    messages = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+        messages.append((fields.get("id"), fields["event"], json.loads(fields["data"])))
+    return messages
+
+
+def test_events_are_kept_in_order(queue):
+    job_id = queue.enqueue("character", {"character_id": "juri"})
+    other = queue.enqueue("character", {"character_id": "kaelen"})
+    queue.add_event(job_id, {"stage": "started"})
+    queue.add_event(other, {"stage": "started"})
+    queue.add_event(job_id, {"stage": "prompts_built"})
+
+    events = queue.events(job_id)
+    assert [event["stage"] for _, event in events] == ["started", "prompts_built"]
+    assert queue.events(job_id, after_id=events[0][0]) == events[1:]
+
+
+def test_stream_replays_progress_and_closes(queue, client):
+    job_id = finished_job(
+        queue,
+        {"stage": "started", "attempt": 1},
+        {"stage": "image_saved", "type": "head", "paths": [HEAD]},
+        {"stage": "done"},
+    )
+    response = client.get(f"/jobs/{job_id}/events")
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.headers["cache-control"] == "no-cache"
+
+    messages = parse(response.text)
+    assert [event for _, event, _ in messages] == ["started", "image_saved", "done"]
+    assert all(event_id.isdigit() for event_id, _, _ in messages)
+    image = messages[1][2]
+    assert image["urls"] == [static_assets.versioned_url(f"characters/{HEAD}")]
+
+
+def test_stream_resumes_after_last_event_id(queue, client):
+    job_id = finished_job(queue, {"stage": "started"}, {"stage": "prompts_built"}, {"stage": "done"})
+    first_id = queue.events(job_id)[0][0]
+
+    response = client.get(f"/jobs/{job_id}/events", headers={"Last-Event-ID": str(first_id)})
+    assert [event for _, event, _ in parse(response.text)] == ["prompts_built", "done"]
+
+
+def test_missing_final_event_is_synthesized(queue, client):
+    job_id = finished_job(queue, {"stage": "started"}, error="worker lost")
+
+    messages = parse(client.get(f"/jobs/{job_id}/events").text)
+    assert messages[-1] == (None, "failed", {"stage": "failed", "error": "worker lost"})
+
+
+def test_unknown_job(client):
+    assert client.get("/jobs/nope/events").status_code == 404
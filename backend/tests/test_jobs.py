@@ -0,0 +1,152 @@
+import os
+import sys
+import time
+import socket
+import subprocess
+
+import pytest
+
+from app.services import jobs
+from app.services.jobs import JobQueue, run_job
+
+PARAMS = {"character_id": "juri"}
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.sqlite3"))
+
+
+def expire_leases(monkeypatch):
+    """Make leases run out almost immediately."""
+    monkeypatch.setattr(jobs, "JOB_LEASE_SECONDS", 0.01)
+
+
+def dead_worker() -> str:
+    """Worker ID of a process on this host that has exited."""
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    return f"{socket.gethostname()}:{proc.pid}"
+
+
+def test_claim_leases_the_oldest_job(queue):
+    first = queue.enqueue("character", PARAMS)
+    queue.enqueue("character", PARAMS)
+
+    job = queue.claim("w1")
+    assert job["id"] == first
+    assert job["status"] == "running"
+    assert job["worker"] == "w1"
+    assert job["attempts"] == 1
+    assert job["lease_expires"] > time.time()
+
+
+def test_leased_job_is_not_handed_out_twice(queue):
+    queue.enqueue("character", PARAMS)
+    assert queue.claim("w1") is not None
+    assert queue.claim("w2") is None
+
+
+def test_unknown_kind_is_rejected(queue):
+    with pytest.raises(ValueError):
+        queue.enqueue("video", PARAMS)
+
+
+def test_renew_extends_only_the_holders_lease(queue):
+    job_id = queue.enqueue("character", PARAMS)
+    leased = queue.claim("w1")["lease_expires"]
+    time.sleep(0.01)
+
+    queue.renew(job_id, "w2")
+    assert queue.get(job_id)["lease_expires"] == leased
+    queue.renew(job_id, "w1")
+    assert queue.get(job_id)["lease_expires"] > leased
+
+
+def test_expired_lease_is_reclaimed(queue, monkeypatch):
+    expire_leases(monkeypatch)
+    job_id = queue.enqueue("character", PARAMS)
+    queue.claim("w1")
+    time.sleep(0.02)
+
+    job = queue.claim("w2")
+    assert job["id"] == job_id
+    assert job["worker"] == "w2"
+    assert job["attempts"] == 2
+
+    # The worker that lost the lease can no longer finish the job
+    queue.complete(job_id, "w1", {"head": "stale.jpg"})
+    assert queue.get(job_id)["status"] == "running"
+    queue.complete(job_id, "w2", {"head": "head.jpg"})
+    job = queue.get(job_id)
+    assert job["status"] == "done"
+    assert job["result"] == {"head": "head.jpg"}
+
+
+def test_job_fails_after_max_attempts(queue, monkeypatch):
+    expire_leases(monkeypatch)
+    monkeypatch.setattr(jobs, "JOB_MAX_ATTEMPTS", 2)
+    job_id = queue.enqueue("character", PARAMS)
+    for worker in ("w1", "w2"):
+        assert queue.claim(worker)["id"] == job_id
+        time.sleep(0.02)
+
+    assert queue.claim("w3") is None
+    job = queue.get(job_id)
+    assert job["status"] == "failed"
+    assert job["error"] == "Worker lost too many times"
+
+
+@pytest.mark.skipif(os.name != "posix", reason="orphan recovery checks PIDs on POSIX only")
+def test_recover_orphans_requeues_jobs_of_dead_workers(queue):
+    orphan = queue.enqueue("character", PARAMS)
+    alive = queue.enqueue("character", PARAMS)
+    queue.claim(dead_worker())
+    queue.claim(f"{socket.gethostname()}:{os.getpid()}")
+
+    assert queue.recover_orphans() == 1
+    job = queue.get(orphan)
+    assert job["status"] == "queued"
+    assert job["worker"] is None
+    assert queue.get(alive)["status"] == "running"
+
+    # Handed out again straight away, without waiting for the lease
+    assert queue.claim("w2")["id"] == orphan
+
+
+@pytest.mark.skipif(os.name != "posix", reason="orphan recovery checks PIDs on POSIX only")
+def test_recover_orphans_ignores_other_hosts(queue):
+    job_id = queue.enqueue("character", PARAMS)
+    queue.claim("elsewhere.example:1")
+
+    assert queue.recover_orphans() == 0
+    assert queue.get(job_id)["status"] == "running"
+
+
+def test_run_job_records_result_and_events(queue, monkeypatch):
+    def handler(character_id, on_event):
+        on_event({"stage": "prompts_built"})
+        return {"head": f"{character_id}_refs/head.jpg"}
+
+    monkeypatch.setattr(jobs, "_resolve_handler", lambda kind: handler)
+    job_id = queue.enqueue("character", PARAMS)
+    run_job(queue, queue.claim("w1"), "w1")
+
+    job = queue.get(job_id)
+    assert job["status"] == "done"
+    assert job["result"] == {"head": "juri_refs/head.jpg"}
+    assert [event["stage"] for _, event in queue.events(job_id)] == ["started", "prompts_built", "done"]
+
+
+def test_run_job_records_failure(queue, monkeypatch):
+    def handler(character_id, on_event):
+        raise FileNotFoundError("Character file not found")
+
+    monkeypatch.setattr(jobs, "_resolve_handler", lambda kind: handler)
+    job_id = queue.enqueue("character", PARAMS)
+    run_job(queue, queue.claim("w1"), "w1")
+
+    job = queue.get(job_id)
+    assert job["status"] == "failed"
+    assert job["error"] == "Character file not found"
+    assert queue.events(job_id)[-1][1] == {"stage": "failed", "error": "Character file not found"}
@@ -0,0 +1,90 @@
+import json
+
+import pytest
+from pydantic import ValidationError
+from fastapi.testclient import TestClient
+
+from app import main
+from app.services import jsonio
+from app.services.catalog import get_catalog
+from app.services.jsonio import JSONDecodeError, dump_sheet, dumps, loads, validate_sheet
+
+CHARACTER = {"name": "Juri", "physical_traits": {"hair": "Pink"}, "clothing": "Navy uniform", "style_id": "noir"}
+ENVIRONMENT = {"location": "a rooftop dojo", "lighting": "Neon", "time_of_day": "Midnight", "mood": "Tense"}
+
+
+def test_round_trip():
+    sheet = {"name": "Jūri", "tags": ["a", "b"], "nested": {"n": 1.5, "none": None}}
+    assert loads(dumps(sheet)) == sheet
+    assert loads(dumps(sheet).encode()) == sheet
+
+
+def test_sheets_keep_the_four_space_layout():
+    assert dump_sheet({"name": "Juri"}) == '{\n    "name": "Juri"\n}'
+
+
+def test_decode_errors_are_stdlib_decode_errors():
+    with pytest.raises(json.JSONDecodeError):
+        loads("{broken")
+    assert issubclass(JSONDecodeError, ValueError)
+
+
+@pytest.mark.parametrize("category, sheet", [("characters", CHARACTER), ("environments", ENVIRONMENT), ("styles", {"anything": 1})])
+def test_valid_sheets(category, sheet):
+    assert validate_sheet(category, json.dumps(sheet)) == sheet
+
+
+def test_missing_field_fails_validation():
+    with pytest.raises(ValidationError):
+        validate_sheet("characters", json.dumps({"name": "Juri"}))
+
+
+def test_non_object_is_rejected():
+    with pytest.raises(ValueError):
+        validate_sheet("styles", "[1, 2]")
+
+
+def test_validators_are_built_once():
+    assert jsonio.sheet_adapter("characters") is jsonio.sheet_adapter("characters")
+    assert jsonio.sheet_adapter("styles") is None
+
+
+class TestSave:
+    @pytest.fixture
+    def data_dir(self, tmp_path, monkeypatch):
+        for category in ("characters", "environments", "styles"):
+            (tmp_path / category).mkdir()
+        (tmp_path / "characters" / "juri.json").write_text(dump_sheet(CHARACTER))
+        monkeypatch.setattr(main, "DATA_DIR", str(tmp_path))
+        monkeypatch.setattr(main, "catalog", get_catalog(str(tmp_path)))
+        return tmp_path
+
+    @pytest.fixture
+    def client(self, data_dir):
+        return TestClient(main.app)
+
+    def save(self, client, category, filename, content):
+        return client.post(f"/data/{category}/{filename}", json={"content": content})
+
+    def test_saved_sheet_is_served_back(self, client, data_dir):
+        content = dump_sheet({**CHARACTER, "clothing": "Red hoodie"})
+        assert self.save(client, "characters", "juri.json", content).json() == {"status": "success"}
+        assert (data_dir / "characters" / "juri.json").read_text() == content
+        assert client.get("/data/characters/juri.json").json()["content"] == content
+        assert main.catalog.get("characters", "juri")["clothing"] == "Red hoodie"
+
+    def test_invalid_sheet_is_422_with_field_errors(self, client, data_dir):
+        response = self.save(client, "characters", "juri.json", json.dumps({"name": "Juri"}))
+        assert response.status_code == 422
+        assert {tuple(error["loc"]) for error in response.json()["detail"]} == {("physical_traits",), ("clothing",)}
+        # The file on disk is untouched
+        assert json.loads((data_dir / "characters" / "juri.json").read_text()) == CHARACTER
+
+    @pytest.mark.parametrize("content", ["{broken", "[1, 2]"])
+    def test_non_json_is_400(self, client, content):
+        assert self.save(client, "styles", "noir.json", content).status_code == 400
+
+    def test_responses_are_json(self, client):
+        response = client.get("/files/characters")
+        assert response.headers["content-type"] == "application/json"
+        assert response.json() == ["juri.json"]
@@ -0,0 +1,109 @@
+import json
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from app.services import llm
+from app.services.fake_backend import FakeGenerativeModel, FakeResponse
+from app.services.llm import ResponseCache, generate_character_json, generate_character_jsons, normalize_prompt, prompt_key
+
+
+class CountingModel(FakeGenerativeModel):
+    """The fake Gemini, counting calls; prompts mentioning 'nameless' or 'offline' misbehave."""
+
+    def __init__(self):
+        super().__init__("gemini", latency="fixed:0")
+        self.prompts = []
+        self._lock = threading.Lock()
+
+    def generate_content(self, contents, generation_config=None, **kwargs):
+        with self._lock:
+            self.prompts.append(contents[-1])
+        if "offline" in contents[-1]:
+            raise RuntimeError("503 UNAVAILABLE")
+        if "nameless" in contents[-1]:
+            return FakeResponse(json.dumps({"physical_traits": {}, "clothing": "rags"}))
+        return super().generate_content(contents, generation_config)
+
+
+@pytest.fixture
+def model(monkeypatch):
+    model = CountingModel()
+    monkeypatch.setattr(llm, "get_gemini_model", lambda *args, **kwargs: model)
+    monkeypatch.setattr(llm, "_response_cache", ResponseCache(max_entries=8, ttl=60))
+    return model
+
+
+def test_normalized_prompts_share_a_key():
+    assert normalize_prompt("  Grizzled\tDetective \n") == "grizzled detective"
+    assert prompt_key("Grizzled Detective") == prompt_key("grizzled   detective")
+    assert prompt_key("grizzled detective") != prompt_key("young detective")
+
+
+def test_repeated_prompt_is_served_from_the_cache(model):
+    first = generate_character_json("grizzled detective")
+    assert generate_character_json("Grizzled  Detective") == first
+    assert len(model.prompts) == 1
+    assert llm.get_response_cache().stats()["hits"] == 1
+
+
+def test_cached_sheets_are_copies(model):
+    generate_character_json("grizzled detective")["name"] = "Edited"
+    assert generate_character_json("grizzled detective")["name"] != "Edited"
+
+
+def test_use_cache_false_calls_the_model(model):
+    generate_character_json("grizzled detective")
+    generate_character_json("grizzled detective", use_cache=False)
+    assert len(model.prompts) == 2
+
+
+def test_entries_expire(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(llm.time, "monotonic", lambda: clock[0])
+    cache = ResponseCache(max_entries=8, ttl=60)
+    cache.put("k", {"name": "Juri"})
+    clock[0] = 59
+    assert cache.get("k") == {"name": "Juri"}
+    clock[0] = 121
+    assert cache.get("k") is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(max_entries=2, ttl=60)
+    cache.put("a", {})
+    cache.put("b", {})
+    cache.get("a")
+    cache.put("c", {})
+    assert cache.get("b") is None
+    assert cache.get("a") == {} and cache.get("c") == {}
+
+
+def test_batch_dedupes_and_keeps_order(model):
+    results = generate_character_jsons(["grizzled detective", "young pilot", "Grizzled Detective"])
+    assert [r["prompt"] for r in results] == ["grizzled detective", "young pilot", "Grizzled Detective"]
+    assert [r["status"] for r in results] == ["ok"] * 3
+    assert results[0]["sheet"] == results[2]["sheet"]
+    assert len(model.prompts) == 2
+
+
+def test_batch_reports_each_failure_on_its_own(model):
+    results = generate_character_jsons(["grizzled detective", "nameless drifter", "offline oracle"])
+    assert [r["status"] for r in results] == ["ok", "invalid", "error"]
+    assert results[1]["errors"][0]["loc"] == ("name",)
+    assert results[2]["error"] == "503 UNAVAILABLE"
+
+
+def test_batch_endpoint(model):
+    client = TestClient(main.app)
+    response = client.post("/generate/character-json/batch", json={"prompts": ["grizzled detective", "nameless drifter"]})
+    body = response.json()
+    assert (body["ok"], body["failed"]) == (1, 1)
+    assert client.get("/cache/llm").json()["entries"] == 2
+
+
+@pytest.mark.parametrize("prompts", [[], ["x"] * 101])
+def test_batch_endpoint_limits(model, prompts):
+    assert TestClient(main.app).post("/generate/character-json/batch", json={"prompts": prompts}).status_code == 400
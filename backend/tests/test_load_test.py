@@ -0,0 +1,67 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from benchmarks.load_test import Recorder, percentile, summarize, threadpool_summary, print_report, PROFILES, OPERATIONS
+
+
+def recorder_with(label, seconds, statuses):
+    recorder = Recorder()
+    for value, status in zip(seconds, statuses):
+        recorder.add(label, status, value)
+    return recorder
+
+
+@pytest.mark.parametrize("pct, expected", [(50, 50), (95, 95), (99, 99), (100, 100), (1, 1)])
+def test_nearest_rank_percentile(pct, expected):
+    assert percentile(list(range(1, 101)), pct) == expected
+
+
+def test_percentile_of_nothing():
+    assert percentile([], 95) is None
+
+
+def test_summary_per_endpoint():
+    seconds = [i / 1000 for i in range(1, 101)]
+    statuses = [200] * 97 + [500, 429, "ConnectionResetError"]
+    endpoints = summarize(recorder_with("GET /assets", seconds, statuses), elapsed=10)
+
+    assert endpoints["GET /assets"] == {
+        "requests": 100,
+        "throughput_rps": 10.0,
+        "p50_ms": 50.0,
+        "p95_ms": 95.0,
+        "p99_ms": 99.0,
+        "max_ms": 100.0,
+        "error_rate": 0.03,
+        "statuses": {"200": 97, "500": 1, "429": 1, "ConnectionResetError": 1},
+    }
+
+
+def test_threadpool_saturation():
+    samples = [{"total": 40, "busy": busy, "waiting": waiting} for busy, waiting in [(4, 0), (40, 3), (40, 0), (12, 0)]]
+    assert threadpool_summary(samples) == {
+        "total": 40, "busy_max": 40, "busy_mean": 24.0, "waiting_max": 3, "saturated_ratio": 0.25, "samples": 4,
+    }
+    assert threadpool_summary([]) is None
+
+
+def test_report_compares_against_a_baseline(capsys):
+    endpoint = summarize(recorder_with("GET /files", [0.1] * 10, [200] * 10), elapsed=1)["GET /files"]
+    slower = {**endpoint, "p95_ms": endpoint["p95_ms"] * 2, "throughput_rps": endpoint["throughput_rps"] / 2}
+    result = {"profile": "browse", "users": 1, "duration_s": 1, "total_requests": 10, "throughput_rps": 10,
+              "error_rate": 0, "endpoints": {"GET /files": slower}, "threadpool": None}
+
+    print_report(result, baseline={"endpoints": {"GET /files": endpoint}})
+    assert "p95 +100.0%  rps -50.0%" in capsys.readouterr().out
+
+
+def test_profiles_only_use_known_operations():
+    for weights in PROFILES.values():
+        assert set(weights) <= set(OPERATIONS)
+
+
+def test_threadpool_endpoint():
+    stats = TestClient(main.app).get("/stats/threadpool").json()
+    assert set(stats) == {"total", "busy", "waiting"}
+    assert stats["total"] > 0
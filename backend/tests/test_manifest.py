@@ -0,0 +1,144 @@
+import os
+
+import pytest
+
+from app.services.manifest import ReferenceManifest, reference_inputs, stale_reasons, pick, digest
+from app.services.parser import CHARACTER_PROMPT_FIELDS, STYLE_PROMPT_FIELDS
+from app.services.storage import LocalStorage
+from app.services.sheet_store import update_sheet, write_json_atomic
+from app.services.catalog import get_catalog
+from app.services.character_refs import generate_character_references
+
+KEY = "characters/juri_refs/noir/head.jpg"
+SHEET = {
+    "name": "Juri",
+    "physical_traits": {"hair": "Pink, spiky, short", "eyes": "Light brown", "physique": "Athletic"},
+    "style_id": "noir",
+    "clothing": "Navy martial arts uniform with a red hoodie collar",
+    "negative_prompt": "glasses, low quality",
+}
+STYLE = {"style_id": "noir", "art_style": "Film noir, high contrast black and white"}
+
+
+def inputs(sheet=SHEET, style=STYLE, prompt="a portrait of Juri", render=None):
+    return reference_inputs(sheet, CHARACTER_PROMPT_FIELDS, style, STYLE_PROMPT_FIELDS, prompt,
+                            sheet.get("negative_prompt"), render or {"model": "imagen", "variant": 0})
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    return ReferenceManifest(str(tmp_path / "manifest.sqlite3"))
+
+
+@pytest.fixture
+def storage(tmp_path):
+    root = tmp_path / "data"
+    path = root / KEY
+    path.parent.mkdir(parents=True)
+    path.write_bytes(b"jpeg")
+    return LocalStorage(str(root))
+
+
+def test_pick_reads_dotted_fields():
+    assert pick(SHEET, ["name", "physical_traits.hair", "physical_traits.scars", "outfit.color"]) == {
+        "name": "Juri", "physical_traits.hair": "Pink, spiky, short", "physical_traits.scars": None, "outfit.color": None,
+    }
+
+
+def test_digest_ignores_key_order():
+    assert digest({"a": 1, "b": 2}) == digest({"b": 2, "a": 1})
+
+
+@pytest.mark.parametrize("change, reasons", [
+    (lambda sheet, style: sheet.update(clothing="Leather jacket"), ["sheet"]),
+    (lambda sheet, style: sheet["physical_traits"].update(hair="Black"), ["sheet"]),
+    (lambda sheet, style: style.update(art_style="Claymation"), ["style"]),
+    # Fields the prompt doesn't use never make an image stale
+    (lambda sheet, style: sheet["physical_traits"].update(physique="Slim"), []),
+    (lambda sheet, style: style.update(output={"format": "webp"}), []),
+])
+def test_stale_reasons_name_the_changed_inputs(change, reasons):
+    sheet = {**SHEET, "physical_traits": dict(SHEET["physical_traits"])}
+    style = dict(STYLE)
+    change(sheet, style)
+    assert stale_reasons(inputs(), inputs(sheet, style)) == reasons
+
+
+def test_prompt_and_render_changes_are_reasons():
+    assert stale_reasons(inputs(), inputs(prompt="a profile of Juri")) == ["prompt"]
+    assert stale_reasons(inputs(), inputs(render={"model": "imagen", "variant": 1})) == ["render"]
+
+
+def test_template_version_is_recorded():
+    recorded = {**inputs(), "template": "0"}
+    assert stale_reasons(recorded, inputs()) == ["template"]
+
+
+def test_missing_image_is_not_fresh(manifest, storage):
+    assert not manifest.is_fresh(storage, storage.root, "characters/juri_refs/noir/side.jpg", inputs())
+
+
+def test_untracked_image_counts_as_fresh(manifest, storage):
+    assert manifest.get(storage.root, KEY) is None
+    assert manifest.is_fresh(storage, storage.root, KEY, inputs())
+
+
+def test_recorded_image_is_fresh_until_an_input_changes(manifest, storage):
+    manifest.record(storage.root, KEY, inputs())
+    assert manifest.get(storage.root, KEY) == inputs()
+    assert manifest.is_fresh(storage, storage.root, KEY, inputs())
+    assert not manifest.is_fresh(storage, storage.root, KEY, inputs(style={**STYLE, "art_style": "Claymation"}))
+
+
+def test_records_are_per_data_directory(manifest, storage, tmp_path):
+    manifest.record(storage.root, KEY, inputs())
+    assert manifest.get(str(tmp_path / "other"), KEY) is None
+
+
+class TestRenders:
+    """Only the images whose inputs changed are rendered again."""
+
+    @pytest.fixture
+    def data_dir(self, tmp_path):
+        root = tmp_path / "data"
+        for category, file_id, sheet in (("characters", "juri", SHEET), ("styles", "noir", STYLE)):
+            os.makedirs(root / category)
+            write_json_atomic(str(root / category / f"{file_id}.json"), sheet)
+        return str(root)
+
+    def edit(self, data_dir, category, file_id, mutate):
+        update_sheet(os.path.join(data_dir, category, f"{file_id}.json"), mutate)
+        get_catalog(data_dir).invalidate(category, file_id)
+
+    def render(self, data_dir, **kwargs):
+        sources = {}
+        generate_character_references(
+            "juri", os.path.join(data_dir, "characters"), target_types=["head", "side"], use_cache=False,
+            on_event=lambda event: event["stage"] == "image_saved" and sources.update({event["type"]: event["source"]}),
+            **kwargs,
+        )
+        return sources
+
+    def test_unchanged_sheet_renders_nothing(self, data_dir):
+        assert self.render(data_dir) == {"head": "generated", "side": "generated"}
+        assert self.render(data_dir) == {"head": "existing", "side": "existing"}
+
+    def test_unused_field_renders_nothing(self, data_dir):
+        self.render(data_dir)
+        self.edit(data_dir, "characters", "juri", lambda sheet: sheet.update(notes="Rival of Kaelen"))
+        assert self.render(data_dir) == {"head": "existing", "side": "existing"}
+
+    def test_prompt_field_change_renders_again(self, data_dir):
+        self.render(data_dir)
+        self.edit(data_dir, "characters", "juri", lambda sheet: sheet.update(clothing="Leather jacket"))
+        assert self.render(data_dir) == {"head": "generated", "side": "generated"}
+        assert self.render(data_dir) == {"head": "existing", "side": "existing"}
+
+    def test_style_change_renders_again(self, data_dir):
+        self.render(data_dir)
+        self.edit(data_dir, "styles", "noir", lambda style: style.update(art_style="Claymation"))
+        assert self.render(data_dir) == {"head": "generated", "side": "generated"}
+
+    def test_force_renders_fresh_images(self, data_dir):
+        self.render(data_dir)
+        assert self.render(data_dir, force=True) == {"head": "generated", "side": "generated"}
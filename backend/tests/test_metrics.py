@@ -0,0 +1,121 @@
+import os
+import sys
+import json
+import logging
+import subprocess
+
+import pytest
+from fastapi.testclient import TestClient
+from prometheus_client.parser import text_string_to_metric_families
+
+from app import main
+from app.logging_config import JsonFormatter, TextFormatter
+from app.services import metrics
+from app.services.character_refs import generate_character_references
+
+SHEET = {"name": "Juri", "physical_traits": {"hair": "Pink"}, "style_id": "noir"}
+
+
+def sample(name, **labels):
+    """Current value of one aggregated series, 0 if it hasn't been recorded yet."""
+    body, _ = metrics.latest()
+    for family in text_string_to_metric_families(body.decode()):
+        for s in family.samples:
+            if s.name == name and all(s.labels.get(k) == v for k, v in labels.items()):
+                return s.value
+    return 0
+
+
+@pytest.fixture
+def characters_dir(tmp_path):
+    path = tmp_path / "data" / "characters"
+    path.mkdir(parents=True)
+    (path / "juri.json").write_text(json.dumps(SHEET))
+    return str(path)
+
+
+def test_requests_are_labelled_by_route_template():
+    client = TestClient(main.app)
+    before = sample("move37_http_request_duration_seconds_count", route="/jobs/{job_id}", status="404")
+    client.get("/jobs/missing-1")
+    client.get("/jobs/missing-2")
+    assert sample("move37_http_request_duration_seconds_count", route="/jobs/{job_id}", status="404") == before + 2
+
+
+def test_endpoint_serves_prometheus_text():
+    response = TestClient(main.app).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "move37_http_request_duration_seconds" in response.text
+
+
+def test_generation_records_stages_and_images(characters_dir):
+    before = {stage: sample("move37_generation_stage_seconds_count", kind="character", stage=stage)
+              for stage in ("prompt_build", "model_call", "image_save", "json_write")}
+    images = sample("move37_images_total", kind="character", source="generated")
+
+    generate_character_references("juri", characters_dir, target_types=["head", "side"], use_cache=False)
+
+    after = {stage: sample("move37_generation_stage_seconds_count", kind="character", stage=stage) for stage in before}
+    assert {stage: after[stage] - before[stage] for stage in before} == {
+        "prompt_build": 1, "model_call": 2, "image_save": 2, "json_write": 1,
+    }
+    assert sample("move37_images_total", kind="character", source="generated") == images + 2
+    assert sample("move37_image_bytes_written_total", kind="character") > 0
+
+
+def test_other_processes_are_aggregated(characters_dir):
+    before = sample("move37_images_total", kind="character", source="generated")
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run(
+        [sys.executable, "-c", "from app.services import metrics; metrics.IMAGES.labels('character', 'generated').inc(3)"],
+        cwd=backend, check=True,
+    )
+    assert sample("move37_images_total", kind="character", source="generated") == before + 3
+
+
+def test_importing_the_services_leaves_the_environment_alone(tmp_path):
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {k: v for k, v in os.environ.items() if k != "PROMETHEUS_MULTIPROC_DIR"}
+    env["MOVE37_STATE_DIR"] = str(tmp_path)
+    script = (
+        "import os; from app.services import metrics\n"
+        "assert 'PROMETHEUS_MULTIPROC_DIR' not in os.environ\n"
+        "metrics.IMAGES.labels('character', 'generated').inc(2)\n"
+        "assert b'move37_images_total{kind=\"character\",source=\"generated\"} 2.0' in metrics.latest()[0]\n"
+    )
+    subprocess.run([sys.executable, "-c", script], cwd=backend, env=env, check=True)
+    assert not os.path.exists(tmp_path / "metrics")
+
+
+def test_dead_process_files_are_removed():
+    directory = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    dead = os.path.join(directory, f"counter_{proc.pid}.db")
+    alive = os.path.join(directory, f"counter_{os.getpid()}.db")
+    open(dead, "wb").close()
+    open(alive, "ab").close()
+
+    metrics.remove_dead_process_files()
+    assert not os.path.exists(dead)
+    assert os.path.exists(alive)
+
+
+def record(**extra):
+    record = logging.LogRecord("app.services.jobs", logging.INFO, __file__, 1, "Finished job", (), None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_logs_carry_extra_fields():
+    entry = json.loads(JsonFormatter().format(record(job_id="abc", elapsed=1.5)))
+    assert entry["message"] == "Finished job"
+    assert entry["level"] == "INFO"
+    assert entry["logger"] == "app.services.jobs"
+    assert (entry["job_id"], entry["elapsed"]) == ("abc", 1.5)
+
+
+def test_text_logs_append_extra_fields():
+    line = TextFormatter("%(levelname)s %(name)s: %(message)s").format(record(job_id="abc"))
+    assert line == "INFO app.services.jobs: Finished job job_id=abc"
@@ -0,0 +1,69 @@
+import os
+import sys
+import threading
+import subprocess
+
+import pytest
+
+from app.services import model_registry
+from app.services.model_registry import get_imagen_model, warm_up
+
+
+@pytest.fixture
+def built(monkeypatch):
+    """Model IDs passed to from_pretrained, with a fresh registry and no real SDK init."""
+    import vertexai
+    from vertexai.preview.vision_models import ImageGenerationModel
+
+    calls = []
+    monkeypatch.setattr(model_registry, "_clients", {})
+    monkeypatch.setattr(model_registry, "_initialized", False)
+    monkeypatch.setattr(model_registry, "GENERATION_BACKEND", "vertex")
+    monkeypatch.setattr(vertexai, "init", lambda **kwargs: calls.append("init"))
+    monkeypatch.setattr(ImageGenerationModel, "from_pretrained", lambda model_id: calls.append(model_id) or object())
+    return calls
+
+
+def test_client_is_built_once_per_model_id(built):
+    first = get_imagen_model()
+    assert get_imagen_model() is first
+    assert get_imagen_model("imagen-4") is not first
+    assert built == ["init", model_registry.IMAGEN_MODEL_ID, "imagen-4"]
+
+
+def test_threads_share_one_client(built):
+    clients = []
+    threads = [threading.Thread(target=lambda: clients.append(get_imagen_model())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len({id(client) for client in clients}) == 1
+    assert built.count(model_registry.IMAGEN_MODEL_ID) == 1
+
+
+def test_warm_up_builds_clients_ahead_of_use(built):
+    warm_up(("imagen",))
+    assert built == ["init", model_registry.IMAGEN_MODEL_ID]
+    get_imagen_model()
+    assert built.count(model_registry.IMAGEN_MODEL_ID) == 1
+
+
+def test_warm_up_failures_are_not_fatal(built, monkeypatch):
+    def broken():
+        raise RuntimeError("no credentials")
+
+    monkeypatch.setattr(model_registry, "get_gemini_model", broken)
+    warm_up(("gemini", "imagen"))
+    assert model_registry.IMAGEN_MODEL_ID in built
+
+
+@pytest.mark.parametrize("module", ["app.main", "app.services.character_refs", "app.services.llm"])
+def test_import_does_not_load_the_vertex_sdk(module):
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    loaded = subprocess.run(
+        [sys.executable, "-c", f"import sys, {module}; print('vertexai' in sys.modules)"],
+        cwd=backend, capture_output=True, text=True, check=True,
+    ).stdout.split()[-1]
+    assert loaded == "False"
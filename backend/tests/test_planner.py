@@ -0,0 +1,250 @@
+import json
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from app.services import catalog, character_refs, environment_refs, planner, storage
+from app.services.catalog import get_catalog
+from app.services.batch import iter_batch
+from app.services.planner import plan_sequence, run_plan, reference_status, plan_stale, adopt_untracked
+from app.services.sheet_store import update_sheet
+from app.services.render_cache import RenderCache
+from app.services.character_refs import generate_character_references
+
+SHEETS = {
+    "characters": {
+        "juri": {"name": "Juri", "physical_traits": {"hair": "Pink"}, "style_id": "noir"},
+        "kaelen": {"name": "Kaelen", "clothing": "Grey cloak", "style_id": "noir"},
+    },
+    "environments": {"dojo": {"location": "a rooftop dojo"}},
+    "styles": {"noir": {"art_style": "Film noir"}, "anime": {"art_style": "Anime"}},
+    "sequences": {
+        "opening": {"sequence_id": "opening", "scenes": [
+            {"scene_id": "001", "character_id": "juri", "environment_id": "dojo"},
+            {"scene_id": "002", "character_id": "kaelen", "environment_id": "dojo"},
+            {"scene_id": "003", "character_id": "juri", "style_id": "anime"},
+        ]},
+    },
+}
+SEQUENCE = SHEETS["sequences"]["opening"]
+
+
+class StubImage:
+    def save(self, location, include_generation_parameters=False):
+        with open(location, "wb") as f:
+            f.write(location.encode())
+
+
+class StubModel:
+    def __init__(self):
+        self.calls = []
+        self.counts = []
+        self._lock = threading.Lock()
+
+    def generate_images(self, prompt, number_of_images=1, **kwargs):
+        with self._lock:
+            self.calls.append(prompt)
+            self.counts.append(number_of_images)
+        return [StubImage() for _ in range(number_of_images)]
+
+
+@pytest.fixture
+def model(tmp_path, monkeypatch):
+    model = StubModel()
+    cache = RenderCache(root=str(tmp_path / "render_cache"))
+    for module in (character_refs, environment_refs):
+        monkeypatch.setattr(module, "get_imagen_model", lambda *args, **kwargs: model)
+        monkeypatch.setattr(module, "get_render_cache", lambda: cache)
+    monkeypatch.setattr(planner, "get_render_cache", lambda: cache)
+    return model
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    root = tmp_path / "data"
+    for category, sheets in SHEETS.items():
+        (root / category).mkdir(parents=True)
+        for file_id, sheet in sheets.items():
+            (root / category / f"{file_id}.json").write_text(json.dumps(sheet))
+    # The prompt builders read styles from the default catalog
+    monkeypatch.setattr(catalog, "DATA_DIR", str(root))
+    monkeypatch.setattr(main, "DATA_DIR", str(root))
+    monkeypatch.setattr(main, "catalog", get_catalog(str(root)))
+    monkeypatch.setattr(storage, "DATA_DIR", str(root))
+    monkeypatch.setattr(storage, "_storages", {})
+    return root
+
+
+def plan(data_dir, **kwargs):
+    return plan_sequence(SEQUENCE, str(data_dir), **kwargs)
+
+
+def edit(data_dir, category, file_id, mutate):
+    update_sheet(str(data_dir / category / f"{file_id}.json"), mutate)
+    get_catalog(str(data_dir)).invalidate(category, file_id)
+
+
+def statuses(data_dir):
+    return {row["key"]: (row["status"], tuple(row["reasons"])) for row in reference_status(str(data_dir))}
+
+
+def test_tasks_are_deduplicated_per_character_style_and_environment(data_dir, model):
+    result = plan(data_dir)
+    assert [task["task_id"] for task in result["tasks"]] == [
+        "character:juri:noir", "character:kaelen:noir", "character:juri:anime", "environment:dojo",
+    ]
+    assert [scene["needs"] for scene in result["scenes"]] == [
+        ["character:juri:noir", "environment:dojo"],
+        ["character:kaelen:noir", "environment:dojo"],
+        ["character:juri:anime"],
+    ]
+    assert not any(scene["ready"] for scene in result["scenes"])
+    assert result["model_calls"] == 3 * 4 + 3
+    assert result["estimated_seconds"] > 0
+
+
+def test_unknown_ids_are_reported_together(data_dir):
+    sequence = {"scenes": [{"character_id": "ryu", "environment_id": "alley"}, {"character_id": "juri", "style_id": "pastel"}]}
+    with pytest.raises(ValueError, match="Unknown characters: ryu; environments: alley; styles: pastel"):
+        plan_sequence(sequence, str(data_dir))
+
+
+def test_estimate_matches_the_calls_made(data_dir, model):
+    result = plan(data_dir)
+    events = list(run_plan(result, str(data_dir)))
+
+    assert len(model.calls) == result["model_calls"]
+    assert events[-1]["status"] == "done"
+    after = plan(data_dir)
+    assert after["tasks"] == [] and after["model_calls"] == 0
+    assert all(scene["ready"] for scene in after["scenes"])
+
+
+def test_recorded_angles_are_skipped(data_dir, model):
+    list(iter_batch([{"kind": "character", "id": "juri", "style_id": "noir", "types": ["head", "side"]}], str(data_dir)))
+
+    task = plan(data_dir)["tasks"][0]
+    assert (task["task_id"], task["types"], task["model_calls"]) == ("character:juri:noir", ["full_body", "back"], 2)
+
+
+def test_unrecorded_files_count_as_existing(data_dir, model):
+    folder = data_dir / "characters" / "juri_refs" / "noir"
+    folder.mkdir(parents=True)
+    (folder / "head.jpg").write_bytes(b"jpeg")
+
+    task = plan(data_dir)["tasks"][0]
+    assert (task["types"], task["existing"], task["model_calls"]) == (["head", "full_body", "side", "back"], 1, 3)
+
+
+def test_cached_renders_are_not_model_calls(data_dir, model):
+    list(run_plan(plan(data_dir), str(data_dir)))
+    calls = len(model.calls)
+
+    forced = plan(data_dir, force=True)
+    assert (forced["model_calls"], forced["cache_hits"]) == (0, calls)
+    list(run_plan(forced, str(data_dir), force=True))
+    assert len(model.calls) == calls
+    assert plan(data_dir, force=True, use_cache=False)["model_calls"] == calls
+
+
+class TestStaleReferences:
+    @pytest.fixture
+    def rendered(self, data_dir, model):
+        list(run_plan(plan(data_dir), str(data_dir)))
+        model.calls.clear()
+        return data_dir
+
+    def test_rendered_images_are_fresh(self, rendered):
+        rows = statuses(rendered)
+        assert len(rows) == 15
+        assert set(rows.values()) == {("fresh", ())}
+        assert plan_stale(str(rendered))["tasks"] == []
+
+    def test_style_change_replans_only_its_images(self, rendered, model):
+        edit(rendered, "styles", "noir", lambda style: style.update(art_style="Claymation"))
+        stale = {key for key, (status, reasons) in statuses(rendered).items() if status == "stale"}
+        assert stale == {f"characters/{c}_refs/noir/{t}.jpg" for c in ("juri", "kaelen") for t in ("head", "full_body", "side", "back")}
+        assert statuses(rendered)["characters/juri_refs/noir/head.jpg"] == ("stale", ("style", "prompt"))
+
+        result = plan_stale(str(rendered), use_cache=False)
+        assert [task["task_id"] for task in result["tasks"]] == ["character:juri:noir", "character:kaelen:noir"]
+        list(run_plan(result, str(rendered), use_cache=False))
+        assert len(model.calls) == result["model_calls"] == 8
+        assert set(statuses(rendered).values()) == {("fresh", ())}
+
+    def test_each_angle_keeps_its_variant_count(self, rendered, model):
+        generate_character_references("kaelen", str(rendered / "characters"), num_images=4, target_type="head", force=True)
+        model.calls.clear()
+        model.counts.clear()
+        edit(rendered, "styles", "noir", lambda style: style.update(art_style="Claymation"))
+
+        result = plan_stale(str(rendered), use_cache=False)
+        kaelen = next(task for task in result["tasks"] if task["id"] == "kaelen")
+        assert kaelen["variants"] == {"head": 4, "full_body": 1, "side": 1, "back": 1}
+        list(run_plan(result, str(rendered), use_cache=False))
+
+        # 4 + 1 + 1 + 1 images for kaelen, one per angle for juri
+        assert sorted(model.counts) == [1] * 7 + [4]
+        assert len(model.calls) == result["model_calls"]
+        refs = json.loads((rendered / "characters" / "kaelen.json").read_text())["reference_images"]["noir"]
+        assert refs["head"] == [f"kaelen_refs/noir/head_{i}.jpg" for i in range(1, 5)]
+        assert refs["full_body"] == "kaelen_refs/noir/full_body.jpg"
+
+    def test_missing_image_is_replanned(self, rendered):
+        (rendered / "environments" / "dojo_refs" / "wide.jpg").unlink()
+        assert statuses(rendered)["environments/dojo_refs/wide.jpg"] == ("missing", ())
+        task, = plan_stale(str(rendered))["tasks"]
+        assert (task["task_id"], task["types"]) == ("environment:dojo", ["wide"])
+
+    def test_untracked_images_are_adopted(self, data_dir):
+        folder = data_dir / "environments" / "dojo_refs"
+        folder.mkdir()
+        (folder / "wide.jpg").write_bytes(b"jpeg")
+        edit(data_dir, "environments", "dojo", lambda sheet: sheet.update(reference_images={"wide": "dojo_refs/wide.jpg"}))
+
+        assert statuses(data_dir) == {"environments/dojo_refs/wide.jpg": ("untracked", ())}
+        assert plan_stale(str(data_dir))["tasks"] == []
+        assert adopt_untracked(str(data_dir)) == 1
+        assert statuses(data_dir) == {"environments/dojo_refs/wide.jpg": ("fresh", ())}
+
+
+class TestEndpoints:
+    @pytest.fixture
+    def client(self, data_dir, model):
+        return TestClient(main.app)
+
+    def test_plan_is_a_dry_run(self, client, model):
+        response = client.get("/sequences/opening/plan")
+        assert response.status_code == 200
+        assert response.json()["model_calls"] == 15
+        assert model.calls == []
+
+    def test_unknown_sequence_and_ids(self, client, data_dir):
+        assert client.get("/sequences/closing/plan").status_code == 404
+        (data_dir / "sequences" / "broken.json").write_text(json.dumps({"scenes": [{"character_id": "ryu"}]}))
+        response = client.get("/sequences/broken/plan")
+        assert (response.status_code, response.json()["detail"]) == (400, "Unknown characters: ryu")
+
+    def test_reference_status_lists_stale_images(self, client, data_dir, model):
+        client.post("/sequences/opening/render", json={})
+        assert client.get("/references/status").json() == []
+        edit(data_dir, "environments", "dojo", lambda sheet: sheet.update(location="a flooded dojo"))
+
+        rows = client.get("/references/status").json()
+        assert [(row["key"], row["status"], row["reasons"]) for row in rows] == [
+            (f"environments/dojo_refs/{t}.jpg", "stale", ["sheet", "prompt"]) for t in ("wide", "detail", "lighting")
+        ]
+        assert len(client.get("/references/status", params={"stale_only": False}).json()) == 15
+
+    def test_render_streams_the_plan_then_images(self, client, model):
+        response = client.post("/sequences/opening/render", json={})
+        assert response.headers["content-type"] == "application/x-ndjson"
+
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert lines[0]["status"] == "plan" and lines[0]["model_calls"] == 15
+        images = [line for line in lines if line["status"] == "image"]
+        assert len(images) == 15
+        assert all(line["urls"][0].startswith("/static-v/") for line in images)
+        assert len(model.calls) == 15
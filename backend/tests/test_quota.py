@@ -0,0 +1,129 @@
+import pytest
+
+from app.services import quota
+from app.services.quota import QuotaGovernor, QuotaExceededError, is_quota_error
+from app.services.fake_backend import FakeAPIError
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "quota.sqlite3")
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Backoff delays, recorded instead of slept; jitter always picks the full delay."""
+    recorded = []
+    monkeypatch.setattr(quota.time, "sleep", recorded.append)
+    monkeypatch.setattr(quota.random, "uniform", lambda low, high: high)
+    return recorded
+
+
+def unpaced(governor, monkeypatch):
+    """Skip the token bucket, which a 429 empties, so only backoff delays are recorded."""
+    monkeypatch.setattr(governor, "acquire", lambda: 0.0)
+    return governor
+
+
+def flaky(*errors):
+    """A call that raises the given errors in turn, then returns "ok"."""
+    pending = list(errors)
+
+    def call():
+        if pending:
+            raise pending.pop(0)
+        return "ok"
+
+    return call
+
+
+@pytest.mark.parametrize("error, expected", [
+    (FakeAPIError(429, "RESOURCE_EXHAUSTED"), True),
+    (QuotaExceededError("imagen quota exceeded"), True),
+    (RuntimeError("429 Quota exceeded for aiplatform.googleapis.com"), True),
+    (RuntimeError("RESOURCE_EXHAUSTED"), True),
+    (FakeAPIError(500, "INTERNAL"), False),
+    (ValueError("prompt mentions 1429 lanterns"), False),
+    (RuntimeError("image of 4290 bytes is too small"), False),
+])
+def test_is_quota_error(error, expected):
+    assert is_quota_error(error) is expected
+
+
+def test_throttle_cuts_rate_and_success_adds_to_it(db_path, monkeypatch):
+    monkeypatch.setattr(quota, "QUOTA_AIMD_DECREASE", 0.5)
+    monkeypatch.setattr(quota, "QUOTA_AIMD_INCREASE", 1.0)
+    governor = QuotaGovernor("imagen", max_rpm=20, db_path=db_path)
+
+    governor.on_throttle()
+    assert governor.rate == 10
+    governor.on_success()
+    assert governor.rate == 11
+
+
+def test_rate_stays_between_floor_and_ceiling(db_path, monkeypatch):
+    monkeypatch.setattr(quota, "QUOTA_MIN_RPM", 2)
+    governor = QuotaGovernor("imagen", max_rpm=20, db_path=db_path)
+
+    for _ in range(10):
+        governor.on_throttle()
+    assert governor.rate == 2
+    for _ in range(40):
+        governor.on_success()
+    assert governor.rate == 20
+
+
+def test_state_is_shared_through_the_database(db_path):
+    first = QuotaGovernor("imagen", max_rpm=20, db_path=db_path)
+    second = QuotaGovernor("imagen", max_rpm=20, db_path=db_path)
+    other = QuotaGovernor("gemini", max_rpm=60, db_path=db_path)
+
+    first.on_throttle()
+    assert second.rate == first.rate < 20
+    assert other.rate == 60
+
+
+def test_lowered_ceiling_applies_immediately(db_path):
+    QuotaGovernor("imagen", max_rpm=20, db_path=db_path)
+    assert QuotaGovernor("imagen", max_rpm=5, db_path=db_path).rate == 5
+
+
+def test_acquire_paces_calls_beyond_the_burst(db_path):
+    # 600 rpm: one token every 0.1 s
+    governor = QuotaGovernor("imagen", max_rpm=600, burst=1, db_path=db_path)
+    assert governor.acquire() == 0
+    assert governor.acquire() > 0
+
+
+def test_call_retries_quota_errors_with_exponential_backoff(db_path, sleeps, monkeypatch):
+    monkeypatch.setattr(quota, "QUOTA_BACKOFF_BASE", 2)
+    monkeypatch.setattr(quota, "QUOTA_AIMD_DECREASE", 0.5)
+    monkeypatch.setattr(quota, "QUOTA_AIMD_INCREASE", 1.0)
+    governor = unpaced(QuotaGovernor("imagen", max_rpm=600, db_path=db_path), monkeypatch)
+
+    assert governor.call(flaky(FakeAPIError(429, "RESOURCE_EXHAUSTED"), FakeAPIError(429, "RESOURCE_EXHAUSTED"))) == "ok"
+    assert sleeps == [2, 4]
+    # Halved twice, then one success
+    assert governor.rate == 151
+
+
+def test_call_gives_up_after_max_retries(db_path, sleeps, monkeypatch):
+    monkeypatch.setattr(quota, "QUOTA_MAX_RETRIES", 3)
+    monkeypatch.setattr(quota, "QUOTA_BACKOFF_BASE", 2)
+    monkeypatch.setattr(quota, "QUOTA_BACKOFF_CAP", 5)
+    governor = unpaced(QuotaGovernor("imagen", max_rpm=600, db_path=db_path), monkeypatch)
+
+    with pytest.raises(QuotaExceededError) as raised:
+        governor.call(flaky(*[FakeAPIError(429, "RESOURCE_EXHAUSTED")] * 4))
+    # Capped backoff between attempts, none after the last
+    assert sleeps == [2, 4, 5]
+    assert raised.value.retry_after == 5
+
+
+def test_call_raises_other_errors_at_once(db_path, sleeps, monkeypatch):
+    governor = unpaced(QuotaGovernor("imagen", max_rpm=600, db_path=db_path), monkeypatch)
+
+    with pytest.raises(FakeAPIError):
+        governor.call(flaky(FakeAPIError(500, "INTERNAL")))
+    assert sleeps == []
+    assert governor.rate == 600
@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import threading
+
+import pytest
+
+from app.services import character_refs, environment_refs
+from app.services.character_refs import generate_character_references, PartialRenderError
+from app.services.environment_refs import generate_environment_references
+from app.services.render_cache import RenderCache
+from app.services.sheet_store import update_sheet
+from app.services.catalog import get_catalog
+
+SHEET = {
+    "name": "Juri",
+    "physical_traits": {"hair": "Pink, spiky, short", "eyes": "Light brown"},
+    "style_id": "noir",
+    "clothing": "Navy martial arts uniform with a red hoodie collar",
+    "negative_prompt": "glasses, low quality",
+}
+
+
+class StubImage:
+    def save(self, location, include_generation_parameters=False):
+        with open(location, "wb") as f:
+            f.write(b"\xff\xd8stub\xff\xd9")
+
+
+class StubModel:
+    """Stands in for ImageGenerationModel; records calls and how many overlapped."""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.calls = []
+        self.counts = []
+        # 1-based numbers of the calls that fail
+        self.fail_calls = set()
+        # At most this many images per call, as when Imagen filters some out
+        self.max_returned = None
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def generate_images(self, prompt, number_of_images=1, **kwargs):
+        with self._lock:
+            self.calls.append(prompt)
+            self.counts.append(number_of_images)
+            failing = len(self.calls) in self.fail_calls
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        if failing:
+            raise RuntimeError("500 INTERNAL")
+        return [StubImage() for _ in range(min(number_of_images, self.max_returned or number_of_images))]
+
+
+@pytest.fixture
+def model(monkeypatch):
+    model = StubModel()
+    for module in (character_refs, environment_refs):
+        monkeypatch.setattr(module, "get_imagen_model", lambda *args, **kwargs: model)
+    return model
+
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path, monkeypatch):
+    cache = RenderCache(root=str(tmp_path / "render_cache"), max_bytes=10 * 1024 ** 2)
+    for module in (character_refs, environment_refs):
+        monkeypatch.setattr(module, "get_render_cache", lambda: cache)
+    return cache
+
+
+@pytest.fixture
+def characters_dir(tmp_path):
+    path = tmp_path / "data" / "characters"
+    path.mkdir(parents=True)
+    (path / "juri.json").write_text(json.dumps(SHEET, indent=4))
+    return str(path)
+
+
+def read_sheet(characters_dir):
+    with open(os.path.join(characters_dir, "juri.json")) as f:
+        return json.load(f)
+
+
+def test_angles_render_concurrently(model, characters_dir):
+    refs = generate_character_references("juri", characters_dir)
+
+    assert sorted(refs) == ["back", "full_body", "head", "side"]
+    assert len(model.calls) == 4
+    assert model.max_active > 1
+    assert read_sheet(characters_dir)["reference_images"]["noir"] == refs
+    for path in refs.values():
+        assert os.path.exists(os.path.join(characters_dir, path))
+
+
+def test_existing_angles_are_skipped(model, characters_dir):
+    generate_character_references("juri", characters_dir, target_type="head")
+    refs = generate_character_references("juri", characters_dir)
+
+    assert len(model.calls) == 4
+    assert refs["head"] == "juri_refs/noir/head.jpg"
+
+
+def test_variants_are_listed_per_angle(model, characters_dir):
+    refs = generate_character_references("juri", characters_dir, num_images=2, target_type="side")
+    assert refs == {"side": ["juri_refs/noir/side_1.jpg", "juri_refs/noir/side_2.jpg"]}
+
+
+def test_identical_render_is_linked_from_the_cache(model, characters_dir, cache):
+    generate_character_references("juri", characters_dir, target_type="head")
+    generate_character_references("juri", characters_dir, target_type="head", force=True)
+
+    assert len(model.calls) == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_use_cache_false_always_calls_the_model(model, characters_dir):
+    generate_character_references("juri", characters_dir, target_type="head")
+    generate_character_references("juri", characters_dir, target_type="head", force=True, use_cache=False)
+
+    assert len(model.calls) == 2
+
+
+@pytest.fixture
+def per_call(monkeypatch):
+    monkeypatch.setattr(character_refs, "IMAGEN_MAX_IMAGES_PER_CALL", 4)
+
+
+def variants(count, ref_type="head"):
+    return [f"juri_refs/noir/{ref_type}_{i}.jpg" for i in range(1, count + 1)]
+
+
+def test_large_counts_are_split_into_concurrent_calls(model, characters_dir, per_call):
+    refs = generate_character_references("juri", characters_dir, num_images=10, target_type="head")
+
+    assert sorted(model.counts) == [2, 4, 4]
+    assert model.max_active > 1
+    assert refs == {"head": variants(10)}
+    assert all(os.path.exists(os.path.join(characters_dir, path)) for path in refs["head"])
+
+
+def test_failed_chunk_keeps_the_saved_variants(model, characters_dir, per_call):
+    model.fail_calls = {2}
+    with pytest.raises(PartialRenderError) as raised:
+        generate_character_references("juri", characters_dir, num_images=8, target_types=["head", "side"])
+
+    saved = raised.value.references
+    assert len(saved["head"]) + len(saved["side"]) == 12
+    failure, = raised.value.errors
+    assert len(failure["paths"]) == 4
+    assert failure["error"] == "500 INTERNAL"
+    assert read_sheet(characters_dir)["reference_images"]["noir"] == saved
+
+
+def test_rerun_renders_only_the_missing_variants(model, characters_dir, per_call):
+    model.fail_calls = {1}
+    with pytest.raises(PartialRenderError):
+        generate_character_references("juri", characters_dir, num_images=8, target_type="head")
+    refs = generate_character_references("juri", characters_dir, num_images=8, target_type="head")
+
+    assert model.counts == [4, 4, 4]
+    assert refs == {"head": variants(8)}
+
+
+def test_stale_variants_of_a_failed_chunk_are_not_recorded(model, characters_dir, per_call):
+    generate_character_references("juri", characters_dir, num_images=8, target_type="head")
+    update_sheet(os.path.join(characters_dir, "juri.json"), lambda sheet: sheet.update(clothing="Leather jacket"))
+    get_catalog(os.path.dirname(characters_dir)).invalidate("characters", "juri")
+
+    model.fail_calls = {3}
+    with pytest.raises(PartialRenderError) as raised:
+        generate_character_references("juri", characters_dir, num_images=8, target_type="head")
+
+    # The failed chunk's files are still there, rendered from the old sheet
+    failure, = raised.value.errors
+    assert all(os.path.exists(os.path.join(characters_dir, path)) for path in failure["paths"])
+    recorded = read_sheet(characters_dir)["reference_images"]["noir"]["head"]
+    assert len(recorded) == 4
+    assert not set(recorded) & set(failure["paths"])
+
+
+def test_fewer_images_than_requested_is_a_partial_failure(model, characters_dir):
+    model.max_returned = 2
+    with pytest.raises(PartialRenderError) as raised:
+        generate_character_references("juri", characters_dir, num_images=3, target_type="head")
+
+    failure, = raised.value.errors
+    assert failure["paths"] == ["juri_refs/noir/head_3.jpg"]
+    assert failure["error"] == "Imagen returned 2 of 3 images"
+    assert read_sheet(characters_dir)["reference_images"]["noir"]["head"] == variants(2)
+
+    model.max_returned = None
+    refs = generate_character_references("juri", characters_dir, num_images=3, target_type="head")
+    assert model.counts == [3, 1]
+    assert refs == {"head": variants(3)}
+
+
+def test_nothing_rendered_raises_the_original_error(model, characters_dir, per_call):
+    model.fail_calls = {1, 2}
+    with pytest.raises(RuntimeError, match="500 INTERNAL") as raised:
+        generate_character_references("juri", characters_dir, num_images=8, target_type="head")
+    assert not isinstance(raised.value, PartialRenderError)
+
+
+def test_failed_environment_angle_keeps_the_others(model, tmp_path):
+    path = tmp_path / "data" / "environments"
+    path.mkdir(parents=True)
+    (path / "dojo.json").write_text(json.dumps({"location": "a rooftop dojo"}))
+    model.fail_calls = {1}
+    with pytest.raises(PartialRenderError) as raised:
+        generate_environment_references("dojo", str(path))
+
+    saved = raised.value.references
+    failure, = raised.value.errors
+    assert sorted([*saved, failure["type"]]) == ["detail", "lighting", "wide"]
+    assert failure["paths"] == [f"dojo_refs/{failure['type']}.jpg"]
+    assert json.loads((path / "dojo.json").read_text())["reference_images"] == saved
+
+    refs = generate_environment_references("dojo", str(path))
+    assert len(model.calls) == 4
+    assert sorted(refs) == ["detail", "lighting", "wide"]
@@ -0,0 +1,131 @@
+import os
+
+import pytest
+
+from app.services.render_cache import RenderCache, render_key
+from app.services.storage import LocalStorage
+from app.services.fake_backend import FakeGeneratedImage, synthetic_jpeg
+
+ASSET_KEY = "characters/juri_refs/noir/head.jpg"
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return RenderCache(root=str(tmp_path / "render_cache"), max_bytes=10 * 1024 ** 2)
+
+
+def image(seed: str):
+    return FakeGeneratedImage(synthetic_jpeg(seed, size=64))
+
+
+def fill(cache, *names):
+    """Save one render per name, oldest first; returns their keys."""
+    keys = [render_key(name) for name in names]
+    for name, key in zip(names, keys):
+        cache.save_blob(image(name), key)
+    return keys
+
+
+def test_render_key_covers_every_parameter():
+    base = render_key("a knight", "blurry", "imagen-3", "1:1", variant_index=0)
+    assert render_key("a knight", "blurry", "imagen-3", "1:1", variant_index=0) == base
+    assert render_key("a knight", "blurry", "imagen-3", "1:1", variant_index=1) != base
+    assert render_key("a knight", "blurry", "imagen-3", "16:9", variant_index=0) != base
+    assert render_key("a knight", "blurry", "imagen-3", "1:1", variant_index=0, output_format="webp") != base
+
+
+def test_lookup_counts_hits_and_misses(cache):
+    key, = fill(cache, "a")
+    assert cache.lookup(key) is not None
+    assert cache.lookup(render_key("b")) is None
+
+    stats = cache.stats()
+    assert (stats["entries"], stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 1, 0.5)
+
+
+def test_contains_does_not_count(cache):
+    key, = fill(cache, "a")
+    assert cache.contains(key)
+    assert not cache.contains(render_key("b"))
+    assert cache.stats()["hits"] == cache.stats()["misses"] == 0
+
+
+def test_evicts_least_recently_used_first(cache):
+    a, b, c = fill(cache, "a", "b", "c")
+    # a becomes the most recently used, leaving b the oldest
+    cache.lookup(a)
+
+    cache.max_bytes = cache.stats()["bytes"] - 1
+    assert cache.evict() == 1
+    assert not cache.contains(b)
+    assert cache.contains(a) and cache.contains(c)
+
+
+def test_save_blob_evicts_others_to_fit(cache):
+    a, b = fill(cache, "a", "b")
+    cache.max_bytes = 1
+    c, = fill(cache, "c")
+
+    # The new render is always kept, even on its own over the limit
+    assert cache.contains(c)
+    assert not cache.contains(a) and not cache.contains(b)
+    assert cache.stats()["entries"] == 1
+
+
+def test_evicted_blob_is_removed_from_disk(cache):
+    key, = fill(cache, "a")
+    blob = cache.lookup(key)
+    cache.max_bytes = 0
+    cache.evict()
+
+    assert not os.path.exists(blob)
+    assert cache.lookup(key) is None
+
+
+def test_reference_files_are_hard_links_into_the_store(cache, tmp_path):
+    storage = LocalStorage(str(tmp_path / "data"))
+    key, = fill(cache, "a")
+    blob = cache.lookup(key)
+    storage.put_file(ASSET_KEY, blob)
+
+    asset = storage.local_path(ASSET_KEY)
+    assert os.path.samefile(asset, blob)
+    assert os.stat(blob).st_nlink == 2
+
+
+def test_reference_survives_eviction(cache, tmp_path):
+    storage = LocalStorage(str(tmp_path / "data"))
+    key, = fill(cache, "a")
+    blob = cache.lookup(key)
+    with open(blob, "rb") as f:
+        content = f.read()
+    storage.put_file(ASSET_KEY, blob)
+
+    cache.max_bytes = 0
+    cache.evict()
+    with storage.open(ASSET_KEY) as f:
+        assert f.read() == content
+
+
+def test_replacing_a_reference_leaves_the_store_intact(cache, tmp_path):
+    storage = LocalStorage(str(tmp_path / "data"))
+    a, b = fill(cache, "a", "b")
+    blob_a = cache.lookup(a)
+    with open(blob_a, "rb") as f:
+        content = f.read()
+
+    storage.put_file(ASSET_KEY, blob_a)
+    storage.put_file(ASSET_KEY, cache.lookup(b))
+    assert os.path.samefile(storage.local_path(ASSET_KEY), cache.lookup(b))
+    with open(blob_a, "rb") as f:
+        assert f.read() == content
+
+
+def test_disabled_cache_writes_scratch_files(tmp_path):
+    cache = RenderCache(root=str(tmp_path / "render_cache"), enabled=False)
+    key = render_key("a")
+    path = cache.save_blob(image("a"), key)
+
+    assert os.path.exists(path)
+    assert cache.lookup(key) is None
+    assert cache.stats() == {"enabled": False}
@@ -0,0 +1,161 @@
+import os
+import json
+import time
+import threading
+import multiprocessing
+
+import pytest
+
+from app.services import sheet_store
+from app.services.sheet_store import update_sheet, sheet_lock, write_json_atomic
+
+
+@pytest.fixture
+def sheet(tmp_path):
+    path = str(tmp_path / "juri.json")
+    write_json_atomic(path, {"name": "Juri", "reference_images": {}})
+    return path
+
+
+def read(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def add_reference(ref_type):
+    def mutate(data):
+        data["reference_images"][ref_type] = f"juri_refs/noir/{ref_type}.jpg"
+    return mutate
+
+
+def wait_for_pending(path, count):
+    state = sheet_store._state(os.path.abspath(path))
+    deadline = time.monotonic() + 5
+    while len(state.pending) < count:
+        assert time.monotonic() < deadline, "updates never queued"
+        time.sleep(0.001)
+
+
+def _hold_lock(path, locked, release):
+    with sheet_lock(path):
+        locked.set()
+        release.wait(5)
+
+
+def test_update_merges_into_latest_version(sheet):
+    # An edit that landed after the caller loaded the sheet
+    data = read(sheet)
+    data["bio"] = "Street fighter"
+    write_json_atomic(sheet, data)
+
+    written = update_sheet(sheet, add_reference("head"))
+    assert written == read(sheet)
+    assert read(sheet) == {"name": "Juri", "bio": "Street fighter", "reference_images": {"head": "juri_refs/noir/head.jpg"}}
+
+
+def test_atomic_write_leaves_no_temp_files(sheet):
+    update_sheet(sheet, add_reference("head"))
+    assert os.listdir(os.path.dirname(sheet)) == ["juri.json"]
+
+
+def test_concurrent_updates_all_survive(sheet):
+    types = [f"angle_{i}" for i in range(16)]
+    threads = [threading.Thread(target=update_sheet, args=(sheet, add_reference(t))) for t in types]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(read(sheet)["reference_images"]) == sorted(types)
+
+
+def test_queued_updates_are_coalesced_into_one_write(sheet, monkeypatch):
+    writes = []
+    real_write = sheet_store.write_json_atomic
+
+    def counting_write(path, data):
+        writes.append(path)
+        real_write(path, data)
+
+    monkeypatch.setattr(sheet_store, "write_json_atomic", counting_write)
+    types = ["head", "full_body", "side", "back"]
+    results = {}
+
+    def update(ref_type):
+        results[ref_type] = update_sheet(sheet, add_reference(ref_type))
+
+    # Hold the lock so every update queues up behind it
+    with sheet_lock(sheet):
+        threads = [threading.Thread(target=update, args=(t,)) for t in types]
+        for thread in threads:
+            thread.start()
+        wait_for_pending(sheet, len(types))
+    for thread in threads:
+        thread.join()
+
+    assert len(writes) == 1
+    assert sorted(read(sheet)["reference_images"]) == sorted(types)
+    assert all(result == read(sheet) for result in results.values())
+
+
+def test_failed_mutation_only_fails_its_caller(sheet):
+    errors = {}
+
+    def broken(data):
+        data["reference_images"]["side"] = "juri_refs/noir/side.jpg"
+        raise KeyError("style_id")
+
+    def update(name, mutate):
+        try:
+            update_sheet(sheet, mutate)
+        except KeyError as e:
+            errors[name] = e
+
+    with sheet_lock(sheet):
+        threads = [
+            threading.Thread(target=update, args=("head", add_reference("head"))),
+            threading.Thread(target=update, args=("broken", broken)),
+        ]
+        for thread in threads:
+            thread.start()
+        wait_for_pending(sheet, 2)
+    for thread in threads:
+        thread.join()
+
+    assert list(errors) == ["broken"]
+    assert read(sheet)["reference_images"] == {"head": "juri_refs/noir/head.jpg"}
+
+
+def test_failed_mutation_writes_none_of_its_changes(sheet):
+    def half_done(data):
+        data["reference_images"]["side"] = "juri_refs/noir/side.jpg"
+        data["name"] = None
+        raise ValueError("render failed")
+
+    with pytest.raises(ValueError):
+        update_sheet(sheet, half_done)
+    assert read(sheet) == {"name": "Juri", "reference_images": {}}
+
+    update_sheet(sheet, add_reference("head"))
+    assert read(sheet) == {"name": "Juri", "reference_images": {"head": "juri_refs/noir/head.jpg"}}
+
+
+def test_lock_is_held_across_processes(sheet):
+    ctx = multiprocessing.get_context("spawn")
+    locked, release = ctx.Event(), ctx.Event()
+    holder = ctx.Process(target=_hold_lock, args=(sheet, locked, release))
+    holder.start()
+    try:
+        assert locked.wait(30)
+        done = threading.Event()
+        thread = threading.Thread(target=lambda: (update_sheet(sheet, add_reference("head")), done.set()))
+        thread.start()
+        # Blocked while the other process holds the lock
+        assert not done.wait(0.3)
+        release.set()
+        assert done.wait(5)
+        thread.join()
+    finally:
+        release.set()
+        holder.join(10)
+    assert read(sheet)["reference_images"] == {"head": "juri_refs/noir/head.jpg"}
@@ -0,0 +1,118 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from app.services import storage
+from app.services.catalog import get_catalog
+from app.services.storage import LocalStorage
+from app.services.static_assets import file_digest, versioned_url, versioned_references, IMMUTABLE_CACHE_CONTROL
+
+REL_PATH = "characters/juri_refs/noir/head.jpg"
+CONTENT = bytes(range(256)) * 8
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    root = tmp_path / "data"
+    image = root / REL_PATH
+    image.parent.mkdir(parents=True)
+    image.write_bytes(CONTENT)
+    sheet = {"name": "Juri", "reference_images": {"noir": {"head": "juri_refs/noir/head.jpg", "side": "juri_refs/noir/side.jpg"}}}
+    (root / "characters" / "juri.json").write_text(json.dumps(sheet))
+    monkeypatch.setattr(storage, "DATA_DIR", str(root))
+    monkeypatch.setattr(storage, "_storages", {})
+    monkeypatch.setattr(main, "DATA_DIR", str(root))
+    monkeypatch.setattr(main, "storage", storage.get_storage())
+    monkeypatch.setattr(main, "data_files", LocalStorage(str(root)))
+    monkeypatch.setattr(main, "catalog", get_catalog(str(root)))
+    return root
+
+
+@pytest.fixture
+def client(data_dir):
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def url(data_dir):
+    return versioned_url(REL_PATH)
+
+
+def test_url_carries_the_content_digest(data_dir, url):
+    digest = file_digest(str(data_dir / REL_PATH))
+    assert len(digest) == 16
+    assert url == f"/static-v/{digest}/{REL_PATH}"
+
+
+def test_digest_follows_the_content(data_dir, url):
+    (data_dir / REL_PATH).write_bytes(b"regenerated")
+    assert versioned_url(REL_PATH) != url
+
+
+def test_references_keep_their_nesting(data_dir, url):
+    refs = {"noir": {"head": "juri_refs/noir/head.jpg", "variants": ["juri_refs/noir/head.jpg", None]}}
+    assert versioned_references(refs, "characters") == {"noir": {"head": url, "variants": [url, None]}}
+    assert versioned_references("juri_refs/noir/missing.jpg", "characters") is None
+
+
+def test_serves_immutable_response(client, url):
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    assert response.headers["etag"] == f'"{url.split("/")[2]}"'
+    assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+
+
+@pytest.mark.parametrize("if_none_match", ["{etag}", 'W/"other", {etag}', "*"])
+def test_matching_etag_is_not_modified(client, url, if_none_match):
+    etag = client.get(url).headers["etag"]
+    response = client.get(url, headers={"If-None-Match": if_none_match.format(etag=etag)})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+
+
+def test_byte_range(client, url):
+    response = client.get(url, headers={"Range": "bytes=100-199"})
+    assert response.status_code == 206
+    assert response.content == CONTENT[100:200]
+    assert response.headers["content-range"] == f"bytes 100-199/{len(CONTENT)}"
+
+
+def test_if_range_accepts_the_etag(client, url):
+    etag = client.get(url).headers["etag"]
+    response = client.get(url, headers={"Range": "bytes=0-9", "If-Range": etag})
+    assert response.status_code == 206
+    assert response.content == CONTENT[:10]
+
+
+def test_stale_digest_redirects_to_current_version(client, data_dir, url):
+    (data_dir / REL_PATH).write_bytes(b"regenerated")
+    response = client.get(url, follow_redirects=False)
+    assert response.status_code == 302
+    assert response.headers["location"] == versioned_url(REL_PATH)
+    assert response.headers["cache-control"] == "no-cache"
+
+
+def test_missing_file(client):
+    assert client.get("/static-v/0123456789abcdef/characters/juri_refs/noir/back.jpg").status_code == 404
+
+
+def test_sheet_lists_reference_urls(client, url):
+    response = client.get("/data/characters/juri.json")
+    assert response.json()["reference_urls"] == {"noir": {"head": url, "side": None}}
+
+
+def test_remote_objects_are_streamed(client, data_dir, tmp_path, monkeypatch):
+    bucket = storage.S3Storage(storage.LocalS3Client(str(tmp_path / "s3")), "move37-assets", storage.ObjectIndex(str(tmp_path / "s3.sqlite3")))
+    bucket.put_file(REL_PATH, str(data_dir / REL_PATH))
+    (data_dir / REL_PATH).unlink()
+    monkeypatch.setattr(main, "storage", bucket)
+
+    response = client.get(f"/static-v/{bucket.digest(REL_PATH)}/{REL_PATH}")
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    assert response.headers["content-length"] == str(len(CONTENT))
+    assert response.headers["content-type"] == "image/jpeg"
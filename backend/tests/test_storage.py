@@ -0,0 +1,180 @@
+import os
+import sys
+
+import pytest
+
+import migrate_storage
+from app.services.asset_index import AssetIndex
+from app.services.static_assets import file_digest
+from app.services.storage import (
+    LocalStorage, ShardedStorage, S3Storage, LocalS3Client, ObjectIndex, clean_key,
+)
+
+KEY = "characters/juri_refs/noir/head.jpg"
+
+
+def make_storage(kind, tmp_path):
+    if kind == "local":
+        return LocalStorage(str(tmp_path / "data"))
+    if kind == "sharded":
+        return ShardedStorage(str(tmp_path / "objects"), ObjectIndex(str(tmp_path / "objects.sqlite3")))
+    return S3Storage(LocalS3Client(str(tmp_path / "s3")), "move37-assets", ObjectIndex(str(tmp_path / "s3.sqlite3")))
+
+
+@pytest.fixture(params=["local", "sharded", "s3"])
+def storage(request, tmp_path):
+    return make_storage(request.param, tmp_path)
+
+
+@pytest.fixture
+def src(tmp_path):
+    path = tmp_path / "render.jpg"
+    path.write_bytes(b"jpeg bytes")
+    return str(path)
+
+
+def read(storage, key):
+    with storage.open(key) as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("path, key", [
+    ("characters/juri_refs/noir/head.jpg", "characters/juri_refs/noir/head.jpg"),
+    ("/characters\\juri_refs/./noir/head.jpg", "characters/juri_refs/noir/head.jpg"),
+])
+def test_clean_key(path, key):
+    assert clean_key(path) == key
+
+
+@pytest.mark.parametrize("path", ["", ".", "..", "../secrets.txt", "characters/../../secrets.txt"])
+def test_clean_key_rejects_paths_outside(path):
+    with pytest.raises(ValueError):
+        clean_key(path)
+
+
+def test_put_and_read_back(storage, src):
+    storage.put_file(KEY, src)
+    assert read(storage, KEY) == b"jpeg bytes"
+    assert storage.stat(KEY)[0] == len(b"jpeg bytes")
+    assert storage.digest(KEY) == file_digest(src)
+    # Without move the source is left alone
+    assert os.path.exists(src)
+
+
+def test_move_consumes_the_source(storage, src):
+    storage.put_file(KEY, src, move=True)
+    assert not os.path.exists(src)
+    assert read(storage, KEY) == b"jpeg bytes"
+
+
+def test_missing_object(storage):
+    assert storage.stat(KEY) is None
+    assert not storage.exists(KEY)
+    assert storage.digest(KEY) is None
+    assert storage.local_path(KEY) is None
+
+
+def test_list_by_prefix(storage, src):
+    for key in (KEY, "characters/juri_refs/noir/side.jpg", "characters/kaelen_refs/noir/head.jpg", "environments/dojo_refs/wide.jpg"):
+        storage.put_file(key, src)
+    assert [row[0] for row in storage.list("characters/juri_refs/")] == [KEY, "characters/juri_refs/noir/side.jpg"]
+    assert len(storage.list()) == 4
+
+
+def test_delete(storage, src):
+    storage.put_file(KEY, src)
+    storage.delete(KEY)
+    assert not storage.exists(KEY)
+    assert storage.list() == []
+
+
+def test_local_copy(storage, src):
+    storage.put_file(KEY, src)
+    with storage.local_copy(KEY) as path:
+        with open(path, "rb") as f:
+            assert f.read() == b"jpeg bytes"
+    # Downloaded scratch copies are cleaned up; local files are left in place
+    assert os.path.exists(path) == (storage.local_path(KEY) is not None)
+
+
+def test_replacing_an_object_keeps_other_links(tmp_path, src):
+    storage = make_storage("sharded", tmp_path)
+    storage.put_file(KEY, src)
+    other = tmp_path / "other.jpg"
+    other.write_bytes(b"new render")
+    storage.put_file(KEY, str(other))
+
+    assert read(storage, KEY) == b"new render"
+    with open(src, "rb") as f:
+        assert f.read() == b"jpeg bytes"
+
+
+def test_shards_spread_objects_over_hashed_directories(tmp_path, src):
+    storage = make_storage("sharded", tmp_path)
+    storage.put_file(KEY, src)
+    path = os.path.relpath(storage.local_path(KEY), storage.root)
+    first, second, name = path.split(os.sep)
+    assert len(first) == len(second) == 2
+    assert name.startswith(first + second) and name.endswith("-head.jpg")
+
+
+def test_change_feed(tmp_path, src):
+    storage = make_storage("sharded", tmp_path)
+    storage.put_file(KEY, src)
+    seq, changes = storage.changes()
+    assert [(key, deleted) for key, _, _, _, deleted in changes] == [(KEY, 0)]
+
+    storage.put_file("characters/juri_refs/noir/side.jpg", src)
+    storage.delete(KEY)
+    latest, changes = storage.changes(seq)
+    assert latest > seq
+    assert [(key, deleted) for key, _, _, _, deleted in changes] == [("characters/juri_refs/noir/side.jpg", 0), (KEY, 1)]
+    assert storage.changes(latest) == (latest, [])
+
+
+def test_asset_index_follows_the_change_feed(tmp_path, src):
+    storage = make_storage("sharded", tmp_path)
+    storage.put_file(KEY, src)
+    index = AssetIndex(str(tmp_path / "data"), str(tmp_path / "asset_index.json"), refresh_interval=0, storage=storage)
+    assert [a["full_path"] for a in index.query()[0]] == [KEY]
+
+    storage.put_file("characters/juri_refs/noir/back.jpg", src)
+    storage.delete(KEY)
+    assets, _ = index.query()
+    assert [a["full_path"] for a in assets] == ["characters/juri_refs/noir/back.jpg"]
+    assert assets[0]["url"] == f"/static-v/{file_digest(src)}/characters/juri_refs/noir/back.jpg"
+
+
+class TestMigrate:
+    @pytest.fixture
+    def data_dir(self, tmp_path, src):
+        local = LocalStorage(str(tmp_path / "data"))
+        for key in (KEY, "environments/dojo_refs/wide.jpg"):
+            local.put_file(key, src)
+        (tmp_path / "data" / "characters" / "juri.json").write_text("{}")
+        return tmp_path / "data"
+
+    def migrate(self, monkeypatch, data_dir, target, *args):
+        monkeypatch.setattr(migrate_storage, "DATA_DIR", str(data_dir))
+        monkeypatch.setattr(migrate_storage, "get_storage", lambda root: target)
+        monkeypatch.setattr(sys, "argv", ["migrate_storage.py", *args])
+        migrate_storage.main()
+
+    def test_copies_assets_only(self, monkeypatch, tmp_path, data_dir):
+        target = make_storage("sharded", tmp_path)
+        self.migrate(monkeypatch, data_dir, target)
+        assert [row[0] for row in target.list()] == [KEY, "environments/dojo_refs/wide.jpg"]
+        assert (data_dir / KEY).exists()
+
+    def test_second_run_copies_nothing(self, monkeypatch, tmp_path, data_dir, capsys):
+        target = make_storage("sharded", tmp_path)
+        self.migrate(monkeypatch, data_dir, target)
+        self.migrate(monkeypatch, data_dir, target)
+        assert "0 copied, 2 already present" in capsys.readouterr().out
+
+    def test_category_and_delete(self, monkeypatch, tmp_path, data_dir):
+        target = make_storage("s3", tmp_path)
+        self.migrate(monkeypatch, data_dir, target, "--category", "characters", "--delete")
+        assert [row[0] for row in target.list()] == [KEY]
+        assert not (data_dir / KEY).exists()
+        assert (data_dir / "environments/dojo_refs/wide.jpg").exists()
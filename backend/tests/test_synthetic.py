@@ -0,0 +1,54 @@
+import os
+import json
+
+import pytest
+
+from app.services import catalog
+from app.services.compiler import iter_sequence
+from benchmarks.synthetic import build_data_tree
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "data"
+    return root, build_data_tree(str(root), 40)
+
+
+def files(root, pattern_dir, ext):
+    found = []
+    for dirpath, _, names in os.walk(root / pattern_dir):
+        found += [os.path.relpath(os.path.join(dirpath, n), root) for n in names if n.endswith(ext)]
+    return sorted(found)
+
+
+def test_tree_has_the_requested_size(tree):
+    root, ids = tree
+    assert len(ids["characters"]) == 40
+    assert len(ids["environments"]) == 4
+    assert len(files(root, "characters", ".json")) == 40
+    # Four angles on every fourth character: about one image per sheet
+    assert len(files(root, "characters", ".jpg")) == 40
+
+
+def test_reference_images_exist(tree):
+    root, ids = tree
+    sheet = json.loads((root / "characters" / f"{ids['characters'][0]}.json").read_text())
+    refs, = sheet["reference_images"].values()
+    assert sorted(refs) == ["back", "full_body", "head", "side"]
+    assert all((root / "characters" / path).is_file() for path in refs.values())
+
+
+def test_same_seed_builds_the_same_tree(tmp_path):
+    build_data_tree(str(tmp_path / "a"), 12)
+    build_data_tree(str(tmp_path / "b"), 12)
+    for rel_path in files(tmp_path / "a", "", ".json"):
+        assert (tmp_path / "a" / rel_path).read_bytes() == (tmp_path / "b" / rel_path).read_bytes()
+
+
+def test_sequence_compiles(tree, monkeypatch):
+    root, _ = tree
+    monkeypatch.setattr(catalog, "DATA_DIR", str(root))
+    scenes = json.loads((root / "sequences" / "synthetic.json").read_text())["scenes"]
+    compiled = list(iter_sequence(scenes))
+    assert len(compiled) == len(scenes)
+    assert all(prompt for _, prompt, _ in compiled)
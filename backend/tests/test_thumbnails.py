@@ -0,0 +1,149 @@
+import io
+import os
+
+import pytest
+from PIL import Image
+from fastapi.testclient import TestClient
+
+from app import main
+from app.services import thumbnails, storage
+from app.services.thumbnails import make_thumbnail, ensure_thumbnail, thumb_path
+
+REL_PATH = "characters/juri_refs/noir/head.jpg"
+
+
+def write_jpeg(path, color, size=(1024, 768)):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    Image.new("RGB", size, color).save(path, format="JPEG")
+
+
+def pixel(path):
+    with Image.open(path) as img:
+        return img.convert("RGB").getpixel((0, 0))
+
+
+def age(path, seconds):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns - seconds * 1_000_000_000))
+
+
+def current_thumb(size=128):
+    return thumb_path(REL_PATH, storage.get_storage().digest(REL_PATH), size)
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    root = tmp_path / "data"
+    write_jpeg(str(root / REL_PATH), (255, 0, 0))
+    monkeypatch.setattr(storage, "DATA_DIR", str(root))
+    monkeypatch.setattr(storage, "_storages", {})
+    monkeypatch.setattr(thumbnails, "DATA_DIR", str(root))
+    monkeypatch.setattr(thumbnails, "THUMB_DIR", str(tmp_path / "thumbs"))
+    monkeypatch.setattr(main, "storage", storage.get_storage())
+    monkeypatch.setattr(main, "data_files", storage.LocalStorage(str(root)))
+    return root
+
+
+def test_thumbnail_fits_the_size(tmp_path):
+    src, dest = str(tmp_path / "head.jpg"), str(tmp_path / "thumbs" / "head.jpg.webp")
+    write_jpeg(src, (255, 0, 0))
+    make_thumbnail(src, dest, 256)
+
+    with Image.open(dest) as img:
+        assert img.format == "WEBP"
+        assert img.size == (256, 192)
+
+
+def test_small_images_are_not_upscaled(tmp_path):
+    src, dest = str(tmp_path / "icon.jpg"), str(tmp_path / "icon.jpg.webp")
+    write_jpeg(src, (0, 0, 255), size=(64, 32))
+    make_thumbnail(src, dest, 256)
+
+    with Image.open(dest) as img:
+        assert img.size == (64, 32)
+
+
+def test_fresh_thumbnail_is_reused(data_dir, monkeypatch):
+    first = ensure_thumbnail(REL_PATH, 128)
+    monkeypatch.setattr(Image, "open", lambda *args, **kwargs: pytest.fail("thumbnail rendered again"))
+    assert ensure_thumbnail(REL_PATH, 128) == first
+
+
+def test_changed_source_renders_again(data_dir):
+    old = ensure_thumbnail(REL_PATH, 128)
+    write_jpeg(str(data_dir / REL_PATH), (0, 255, 0))
+
+    thumb = ensure_thumbnail(REL_PATH, 128)
+    assert pixel(thumb)[1] > 200
+    # The previous version's thumbnail is dropped
+    assert not os.path.exists(old)
+
+
+def test_older_source_renders_again(data_dir, tmp_path):
+    """Render-cache hits are hard links, so reverting an image gives it an older mtime."""
+    local = storage.get_storage()
+    blobs = {}
+    for name, color in (("a", (255, 0, 0)), ("b", (0, 255, 0))):
+        blobs[name] = str(tmp_path / "render_cache" / f"{name}.jpg")
+        write_jpeg(blobs[name], color)
+    age(blobs["a"], 60)
+
+    reds = []
+    for name in ("a", "b", "a"):
+        local.put_file(REL_PATH, blobs[name])
+        reds.append(pixel(ensure_thumbnail(REL_PATH, 128))[0] > 200)
+    assert reds == [True, False, True]
+
+
+def test_sizes_are_cached_separately(data_dir):
+    assert ensure_thumbnail(REL_PATH, 128) == current_thumb(128)
+    assert ensure_thumbnail(REL_PATH, 256) == current_thumb(256)
+    assert os.path.exists(current_thumb(128)) and os.path.exists(current_thumb(256))
+
+
+def test_schedule_skips_missing_and_non_image_assets(data_dir):
+    keys = ["characters/juri_refs/noir/back.jpg", "characters/juri.json"]
+    assert thumbnails.schedule_thumbnails(keys, sizes=(128,)) == []
+
+
+def test_schedule_skips_other_storages(data_dir, tmp_path):
+    other = storage.LocalStorage(str(tmp_path / "scratch"))
+    assert thumbnails.schedule_thumbnails([REL_PATH], storage=other, sizes=(128,)) == []
+
+
+class TestEndpoint:
+    @pytest.fixture
+    def client(self, data_dir):
+        return TestClient(main.app)
+
+    def test_serves_webp(self, client):
+        response = client.get(f"/thumbs/128/{REL_PATH}")
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "image/webp"
+        assert response.headers["cache-control"] == "public, max-age=86400"
+
+    def test_serves_the_updated_image(self, client, data_dir):
+        client.get(f"/thumbs/128/{REL_PATH}")
+        write_jpeg(str(data_dir / REL_PATH), (0, 255, 0))
+        age(str(data_dir / REL_PATH), 60)
+
+        response = client.get(f"/thumbs/128/{REL_PATH}")
+        assert pixel(io.BytesIO(response.content))[1] > 200
+
+    def test_serves_data_directory_images_under_sharded_storage(self, client, tmp_path, monkeypatch):
+        sharded = storage.ShardedStorage(str(tmp_path / "objects"), storage.ObjectIndex(str(tmp_path / "objects.sqlite3")))
+        monkeypatch.setattr(main, "storage", sharded)
+
+        response = client.get(f"/thumbs/128/{REL_PATH}")
+        assert response.status_code == 200
+        assert pixel(io.BytesIO(response.content))[0] > 200
+        assert client.get("/thumbs/128/characters/juri_refs/noir/back.jpg").status_code == 404
+
+    @pytest.mark.parametrize("url, status", [
+        (f"/thumbs/100/{REL_PATH}", 400),
+        (f"/thumbs/128/{REL_PATH}?format=gif", 400),
+        ("/thumbs/128/characters/juri.json", 400),
+        ("/thumbs/128/characters/juri_refs/noir/back.jpg", 404),
+    ])
+    def test_rejects_bad_requests(self, client, url, status):
+        assert client.get(url).status_code == status